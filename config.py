@@ -57,6 +57,50 @@ class BaseConfig(object):
     ANALYSIS_DATA_SIZE_CUTOFF=10000
     ANALYSIS_CATEGORICAL_VALUE_LIMIT=20
 
+    # In-memory dataset cache (per process)
+    IN_MEMORY_DATA_MAX_BYTES = int(env('DIVE_IN_MEMORY_DATA_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+    IN_MEMORY_DATA_EVICTION_POLICY = env('DIVE_IN_MEMORY_DATA_EVICTION_POLICY', 'lru')
+
+    # Parsed dataset cache shared by all processes on a host
+    DATASET_CACHE_PATH = env('DIVE_DATASET_CACHE_PATH', base_dir_path('cache'))
+
+    # Datasets with more rows are aggregated chunk by chunk where supported
+    STREAMING_ROW_THRESHOLD = int(env('DIVE_STREAMING_ROW_THRESHOLD', 1000000))
+
+    # Raw files of at least this many bytes are parsed on several cores (0 disables)
+    PARALLEL_PARSE_MIN_BYTES = int(env('DIVE_PARALLEL_PARSE_MIN_BYTES', 0))
+    PARALLEL_PARSE_PROCESSES = int(env('DIVE_PARALLEL_PARSE_PROCESSES', 0))
+
+    # Field properties of datasets with at least this many fields are computed on several cores (0 disables)
+    PARALLEL_FIELD_PROPERTIES_MIN_FIELDS = int(env('DIVE_PARALLEL_FIELD_PROPERTIES_MIN_FIELDS', 20))
+    PARALLEL_FIELD_PROPERTIES_PROCESSES = int(env('DIVE_PARALLEL_FIELD_PROPERTIES_PROCESSES', 0))
+
+    # Local copies of S3 objects, revalidated by ETag (S3 storage only)
+    S3_CACHE_PATH = env('DIVE_S3_CACHE_PATH', base_dir_path('s3_cache'))
+    S3_CACHE_MAX_BYTES = int(env('DIVE_S3_CACHE_MAX_BYTES', 10 * 1024 * 1024 * 1024))
+
+    # Directory of the 'local' storage type, which stands in for S3 in development and tests
+    S3_LOCAL_PATH = env('DIVE_S3_LOCAL_PATH', base_dir_path('local_s3'))
+
+    # Uploads are written here by the API and persisted by a worker, so both must share it
+    UPLOAD_SPOOL_PATH = env('DIVE_UPLOAD_SPOOL_PATH', base_dir_path('spool'))
+
+    # Part size of chunked and multipart writes to storage
+    STORAGE_PART_SIZE = int(env('DIVE_STORAGE_PART_SIZE', 8 * 1024 * 1024))
+
+    # Start pulling a dataset to local storage when a worker receives a task reading it
+    PREFETCH_ON_RECEIVE = env('DIVE_PREFETCH_ON_RECEIVE', 'true').lower() == 'true'
+    PREFETCH_THREADS = int(env('DIVE_PREFETCH_THREADS', 2))
+
+    # Datasets warmed into the host cache when a worker starts (0 disables), ranked
+    # by access_count ('frequency') or last_accessed ('recency'), within a byte budget
+    WARMUP_DATASETS = int(env('DIVE_WARMUP_DATASETS', 10))
+    WARMUP_ORDER = env('DIVE_WARMUP_ORDER', 'frequency')
+    WARMUP_MAX_BYTES = int(env('DIVE_WARMUP_MAX_BYTES', 1024 * 1024 * 1024))
+
+    # Accesses to a dataset are counted at most once per interval (seconds) per process
+    DATASET_ACCESS_RECORD_INTERVAL = int(env('DIVE_DATASET_ACCESS_RECORD_INTERVAL', 60))
+
     # Resources
     METADATA_FILE_NAME_SUFFIX = 'dev'
     STORAGE_TYPE = 'file'
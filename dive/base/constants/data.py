@@ -15,6 +15,14 @@ class Scale(Enum):
     CONTINUOUS = 'continuous'
 
 
+# Cell values read as missing, unless a dataset sets its own na_values.
+# Includes the pandas defaults, since the parser is told not to add them.
+DEFAULT_NA_VALUES = [
+    '', 'NA', 'NaN', 'nan', '-NaN', '-nan', 'N/A', 'n/a', 'na', 'NULL', 'None', '.',
+    '#N/A', '#N/A N/A', '#NA', '1.#IND', '-1.#IND', '1.#QNAN', '-1.#QNAN'
+]
+
+
 class DataType(Enum):
     STRING = 'string'
     BOOLEAN = 'boolean'
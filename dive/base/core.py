@@ -15,6 +15,10 @@ from raven.contrib.flask import Sentry
 from werkzeug.local import LocalProxy
 
 from dive.base.serialization import pjson_dumps, pjson_loads
+from dive.base.data.in_memory_data import InMemoryData
+from dive.base.data.shared_data import SharedData
+from dive.base.data.s3_cache import S3Cache
+from dive.base.data.storage import Storage
 
 # Setup logging config
 from setup_logging import setup_logging
@@ -37,7 +41,8 @@ db = CustomSQLAlchemy()
 login_manager = LoginManager()
 cors = CORS()
 compress = Compress()
-s3_client = None
+_s3_client = None
+s3_client = LocalProxy(lambda: _s3_client)
 mail = Mail()
 
 def create_app(**kwargs):
@@ -73,19 +78,40 @@ def create_app(**kwargs):
     def shutdown_session(exception=None):
         db.session.remove()
 
+    InMemoryData.configure(
+        max_bytes=app.config.get('IN_MEMORY_DATA_MAX_BYTES'),
+        eviction_policy=app.config.get('IN_MEMORY_DATA_EVICTION_POLICY', 'lru')
+    )
+    SharedData.configure(cache_path=app.config.get('DATASET_CACHE_PATH'))
+
+    if app.config['STORAGE_TYPE'] in [ 's3', 'local' ]:
+        S3Cache.configure(
+            cache_path=app.config.get('S3_CACHE_PATH'),
+            max_bytes=app.config.get('S3_CACHE_MAX_BYTES')
+        )
+
     if app.config['STORAGE_TYPE'] == 's3':
-        global s3_client
-        s3_client = boto3.client('s3',
+        set_s3_client(boto3.client('s3',
             aws_access_key_id=app.config['AWS_ACCESS_KEY_ID'],
             aws_secret_access_key=app.config['AWS_SECRET_ACCESS_KEY'],
             region_name=app.config['AWS_REGION']
-        )
+        ))
+    Storage.configure(app.config, s3_client=(s3_client if app.config['STORAGE_TYPE'] == 's3' else None))
 
     if app.config['STORAGE_TYPE'] == 'file':
         ensure_directories(app)
     return app
 
 
+def set_s3_client(client):
+    '''
+    Replace the S3 client behind s3_client and the s3 storage backend, e.g.
+    with a moto-backed client in tests
+    '''
+    global _s3_client
+    _s3_client = client
+
+
 def ensure_directories(app):
     if not os.path.isdir(app.config['STORAGE_PATH']):
         app.logger.info("Creating Upload directory")
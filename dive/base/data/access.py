@@ -6,17 +6,35 @@ TODO Rename either this or access.py to be more descriptive
 '''
 import locale
 
+import io
 import os
+import json
+import shutil
+import hashlib
+import tempfile
 from time import time
+from multiprocessing import cpu_count
 import numpy as np
 import pandas as pd
+from pandas.parser import CParserError
 from flask import current_app
 from flask_restful import abort
+from botocore.exceptions import ClientError
 
-from dive.base.core import s3_client
 from dive.base.data.in_memory_data import InMemoryData as IMD
+from dive.base.data.shared_data import SharedData
+from dive.base.data.storage import get_storage
+from dive.base.data.compression import open_decompressed
+from dive.base.data.conditionals import get_clauses, get_conditional_mask, ConditionalMasks
+from dive.base.data.row_index import ROW_INDEX_SUFFIX, read_row_index
+from dive.base.data.indexes import CategoricalIndex, build_categorical_indexes
+from dive.base.data.columnar import has_columnar, read_columnar, read_columnar_meta, read_columnar_index, get_columnar_files, \
+    iter_columnar, write_columnar, read_through_columnar, get_columnar_size
 from dive.base.db import db_access
+from dive.base.pool import get_pool
+from dive.base.constants import GeneralDataType as GDT, Scale, DEFAULT_NA_VALUES
 from dive.worker.core import task_app
+from dive.worker.cache import broadcast_invalidate_dataset
 
 
 import logging
@@ -25,62 +43,396 @@ logger = logging.getLogger(__name__)
 locale.setlocale(locale.LC_NUMERIC, '')
 
 
+def invalidate_dataset_cache(dataset_id):
+    '''
+    Drop cached frames of a dataset in this process and on this host, and ask
+    every worker to do the same
+    '''
+    IMD.removeData(dataset_id)
+    SharedData.removeData(dataset_id)
+    ConditionalMasks.removeDataset(dataset_id)
+    broadcast_invalidate_dataset(dataset_id)
+
+
 def delete_dataset(project_id, dataset_id):
     deleted_dataset = db_access.delete_dataset(project_id, dataset_id)
-    if deleted_dataset['storage_type'] == 's3':
-        file_obj = s3_client.delete_object(
-            Bucket=current_app.config['AWS_DATA_BUCKET'],
-            Key="%s/%s" % (str(project_id), deleted_dataset['file_name'])
-        )
-    elif deleted_dataset['storage_type'] == 'file':
-        os.remove(deleted_dataset['path'])
+    invalidate_dataset_cache(dataset_id)
+    storage = get_storage(deleted_dataset)
+    storage.delete(deleted_dataset, project_id)
+    storage.delete(deleted_dataset, project_id, suffix=ROW_INDEX_SUFFIX)
+    storage.deleteDirectory(deleted_dataset, project_id, SNAPSHOT_SUFFIX)
     return deleted_dataset
 
 
 def get_dataset_sample(dataset_id, project_id, start=0, inc=100):
+    '''
+    Rows [start, start + inc) of a dataset, read from the in-memory entry or
+    the columnar cache when available, else parsed from that range of the raw file
+    '''
     end = start + inc  # Upper bound excluded
-    df = get_data(dataset_id=dataset_id, project_id=project_id)
-
-    sample = map(list, df.iloc[start:end].values)
+    df = _get_data_rows(project_id, dataset_id, start, end)
 
     result = db_access.get_dataset_properties(project_id, dataset_id)
-    result['sample'] = sample
+    result['sample'] = _serialize_rows(df)
     return result
 
 
-def get_data(project_id=None, dataset_id=None, nrows=None, field_properties=[]):
-    if IMD.hasData(dataset_id):
+def _get_data_rows(project_id, dataset_id, start, end):
+    dataset_version = db_access.get_dataset_version(dataset_id)
+    if IMD.hasData(dataset_id, version=dataset_version):
+        try:
+            return IMD.getData(dataset_id).iloc[start:end]
+        except KeyError:
+            pass
+
+    dataset = db_access.get_dataset(project_id, dataset_id)
+    field_properties = db_access.get_field_properties(project_id, dataset_id)
+    columnar_directory = _get_columnar_directory(dataset, project_id, field_properties)
+    if columnar_directory:
+        return read_columnar(columnar_directory, start=start, stop=end)
+
+    df = read_raw_rows(dataset, project_id, start, end - start)
+    return coerce_types(df, field_properties)
+
+
+def _serialize_rows(df):
+    '''
+    Rows of df as lists, converted column by column so that mixed dtypes are
+    not upcast to one object array first
+    '''
+    columns = [ df[column_name].tolist() for column_name in df.columns ]
+    return [ list(row) for row in zip(*columns) ]
+
+
+def get_content_version(dataset, field_properties):
+    '''
+    Version string identifying the parsed and coerced contents of a dataset.
+    Includes a digest of field types, which can change on re-ingestion without
+    a version bump.
+    '''
+    field_types = ','.join([ '%s:%s' % (fp['name'], fp['type']) for fp in sorted(field_properties, key=lambda fp: fp['index']) ])
+    field_types_digest = hashlib.md5(field_types.encode('utf-8')).hexdigest()[:12]
+    return 'v%s-%s' % (dataset.get('version') or 0, field_types_digest)
+
+
+_last_recorded_accesses = {}
+def _record_access(dataset_id):
+    '''
+    Count an access to a dataset, at most once per interval in each process
+    '''
+    now = time()
+    if now - _last_recorded_accesses.get(dataset_id, 0) < current_app.config.get('DATASET_ACCESS_RECORD_INTERVAL', 60):
+        return
+    _last_recorded_accesses[dataset_id] = now
+    try:
+        db_access.record_dataset_access(dataset_id)
+    except Exception as e:
+        logger.error('Error recording access to dataset %s: %s', dataset_id, e, exc_info=True)
+
+
+def get_data(project_id=None, dataset_id=None, nrows=None, field_properties=[], columns=None):
+    '''
+    Load a coerced dataset. If columns is given, only those columns are read
+    (from the in-memory entry, the shared cache, the snapshot, or the raw file,
+    in that order) and returned in the requested order.
+    '''
+    if columns is not None:
+        columns = [ c for (i, c) in enumerate(columns) if c not in columns[:i] ]
+
+    _record_access(dataset_id)
+    dataset_version = db_access.get_dataset_version(dataset_id)
+    if not nrows and IMD.hasData(dataset_id, columns=columns, version=dataset_version):
         logger.debug('Accessing from IMD, project_id: %s, dataset_id: %s', project_id, dataset_id)
-        df = IMD.getData(dataset_id)
-        return df
+        try:
+            df = IMD.getData(dataset_id, columns=columns)
+            return df
+        except KeyError:
+            # Evicted between check and access, so reload below
+            pass
 
     dataset = db_access.get_dataset(project_id, dataset_id)
-    dialect = dataset['dialect']
-    encoding = dataset.get('encoding', 'utf-8')
-
-    if dataset['storage_type'] == 's3':
-        if dataset['preloaded']:
-            file_obj = s3_client.get_object(
-                Bucket=current_app.config['AWS_DATA_BUCKET'],
-                Key="-1/%s" % dataset['file_name']
-            )
-        else:
-            file_obj = s3_client.get_object(
-                Bucket=current_app.config['AWS_DATA_BUCKET'],
-                Key="%s/%s" % (str(project_id), dataset['file_name'])
-            )
-        accessor = file_obj['Body']
-
-    if dataset['storage_type'] == 'file':
-        accessor = dataset['path']
 
     if not field_properties:
         field_properties = db_access.get_field_properties(project_id, dataset_id)
 
-    df = pd.read_table(
-        accessor,
+    columns_to_load = None
+    if columns is not None:
+        cached_columns = IMD.getColumns(dataset_id, version=dataset_version)
+        columns_to_load = [ c for c in columns if c not in cached_columns ]
+
+    # Partial reads and untyped frames are not shared across processes
+    if nrows or not field_properties:
+        df = _load_data(dataset, project_id, nrows=nrows, field_properties=field_properties, columns=(columns if nrows else columns_to_load))
+        if nrows:
+            return df
+    else:
+        version = get_content_version(dataset, field_properties)
+        with SharedData.lock(dataset_id, version):
+            if SharedData.hasData(dataset_id, version):
+                logger.debug('Accessing from shared cache, project_id: %s, dataset_id: %s', project_id, dataset_id)
+                df = SharedData.getData(dataset_id, version, columns=columns_to_load)
+            else:
+                df = _load_snapshot(dataset, project_id, version, columns=columns_to_load)
+                if df is None:
+                    df = _load_data(dataset, project_id, field_properties=field_properties, columns=columns_to_load)
+                    if columns_to_load is None:
+                        SharedData.insertData(dataset_id, version, df)
+
+    if columns_to_load is None:
+        IMD.insertData(dataset_id, df, version=dataset_version)
+        return df
+
+    merged_df = IMD.addColumns(dataset_id, df, version=dataset_version)
+    return merged_df[columns]
+
+
+def warm_dataset(project_id, dataset_id, max_bytes=None):
+    '''
+    Bring a parsed dataset into the host-wide cache (or find its snapshot) and
+    read it into the page cache, ahead of the first request for it. Returns
+    its size in bytes, or None if it was not warmed: not ingested yet, nowhere
+    to cache it, or estimated larger than max_bytes.
+    '''
+    dataset = db_access.get_dataset(project_id, dataset_id)
+    field_properties = db_access.get_field_properties(project_id, dataset_id)
+    if not dataset or not field_properties:
+        return None
+
+    directory = _get_columnar_directory(dataset, project_id, field_properties)
+    if directory is None:
+        if not SharedData.enabled:
+            return None
+        # Roughly 8 bytes per value, to skip parsing datasets that cannot fit
+        dataset_properties = db_access.get_dataset_properties(project_id, dataset_id) or {}
+        n_values = (dataset_properties.get('n_rows') or 0) * (dataset_properties.get('n_cols') or 0)
+        if max_bytes is not None and n_values * 8 > max_bytes:
+            return None
+
+        version = get_content_version(dataset, field_properties)
+        with SharedData.lock(dataset_id, version):
+            if not SharedData.hasData(dataset_id, version) and _load_snapshot(dataset, project_id, version) is None:
+                SharedData.insertData(dataset_id, version, _load_data(dataset, project_id, field_properties=field_properties))
+        directory = _get_columnar_directory(dataset, project_id, field_properties)
+        if directory is None:
+            return None
+
+    size = get_columnar_size(directory)
+    if max_bytes is not None and size > max_bytes:
+        return None
+    read_through_columnar(directory)
+    return size
+
+
+def get_conditional_field_names(project_id, dataset_id, conditionals):
+    '''
+    Names of the fields referenced by a conditional dict, for column projection
+    '''
+    field_ids = [ c['field_id'] for clause in [ 'and', 'or' ] for c in (conditionals or {}).get(clause, []) or [] ]
+    if not field_ids:
+        return []
+    field_properties = db_access.get_field_properties(project_id, dataset_id)
+    return [ fp['name'] for fp in field_properties if fp['id'] in field_ids ]
+
+
+SNAPSHOT_SUFFIX = '.columnar'
+
+
+def save_dataset_snapshot(dataset_id, project_id):
+    '''
+    Write the coerced dataset next to the raw file in the columnar format, so
+    later loads skip CSV parsing and type coercion
+    '''
+    dataset = db_access.get_dataset(project_id, dataset_id)
+    field_properties = db_access.get_field_properties(project_id, dataset_id)
+    df = get_data(project_id=project_id, dataset_id=dataset_id, field_properties=field_properties)
+    attrs = { 'content_version': get_content_version(dataset, field_properties) }
+    indexes = build_categorical_indexes(df, field_properties)
+
+    tmp_directory = tempfile.mkdtemp()
+    try:
+        snapshot_directory = os.path.join(tmp_directory, 'snapshot')
+        write_columnar(df, snapshot_directory, attrs=attrs, indexes=indexes)
+        get_storage(dataset).saveDirectory(dataset, project_id, SNAPSHOT_SUFFIX, snapshot_directory)
+    finally:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    return {
+        'desc': 'Saved columnar snapshot of dataset %s' % dataset_id,
+        'result': None
+    }
+
+
+def _load_snapshot(dataset, project_id, version, columns=None):
+    '''
+    Return the coerced dataset (or the given columns of it) from its columnar
+    snapshot, or None if there is no snapshot for this content version
+    '''
+    storage = get_storage(dataset)
+    try:
+        if storage.is_local:
+            snapshot_path = storage.getLocalPath(dataset, project_id, suffix=SNAPSHOT_SUFFIX)
+            if not snapshot_path or not has_columnar(snapshot_path):
+                return None
+            if read_columnar_meta(snapshot_path)['attrs'].get('content_version') != version:
+                return None
+            logger.debug('Accessing from snapshot, dataset_id: %s', dataset['id'])
+            return read_columnar(snapshot_path, columns=columns)
+
+        elif SharedData.enabled:
+            snapshot_directory = _download_snapshot(dataset, project_id, version)
+            if not snapshot_directory:
+                return None
+            SharedData.insertDirectory(dataset['id'], version, snapshot_directory)
+            logger.debug('Accessing from downloaded snapshot, dataset_id: %s', dataset['id'])
+            return SharedData.getData(dataset['id'], version, columns=columns)
+    except (IOError, OSError, ValueError, KeyError, ClientError) as e:
+        logger.error('Error reading snapshot of dataset %s: %s', dataset['id'], e, exc_info=True)
+    return None
+
+
+def get_categorical_index(project_id, dataset_id, field_name, field_properties):
+    '''
+    Row-id index of a field from the dataset's snapshot, or None if the
+    snapshot is missing, stale, or has no index of that field
+    '''
+    dataset = db_access.get_dataset(project_id, dataset_id)
+    version = get_content_version(dataset, field_properties)
+    storage = get_storage(dataset)
+    if storage.is_local:
+        directory = storage.getLocalPath(dataset, project_id, suffix=SNAPSHOT_SUFFIX)
+    elif SharedData.hasData(dataset_id, version):
+        directory = SharedData.getPath(dataset_id, version)
+    else:
+        directory = None
+    if not directory:
+        return None
+
+    try:
+        if not has_columnar(directory):
+            return None
+        meta = read_columnar_meta(directory)
+        if meta['attrs'].get('content_version') != version:
+            return None
+        index_arrays = read_columnar_index(directory, field_name, meta=meta)
+    except (IOError, OSError, ValueError, KeyError) as e:
+        logger.error('Error reading index of field %s of dataset %s: %s', field_name, dataset_id, e, exc_info=True)
+        return None
+    if index_arrays is None:
+        return None
+    return CategoricalIndex.from_arrays(index_arrays, meta['n_rows'])
+
+
+def _download_snapshot(dataset, project_id, version):
+    '''
+    Copy the snapshot of a dataset from remote storage into a temporary
+    directory of the shared cache, or return None if it is missing or stale
+    '''
+    storage = get_storage(dataset)
+    meta_content = storage.read(dataset, project_id, suffix='%s/meta.json' % SNAPSHOT_SUFFIX)
+    if meta_content is None:
+        return None
+    meta = json.loads(meta_content)
+    if meta['attrs'].get('content_version') != version:
+        return None
+
+    snapshot_directory = tempfile.mkdtemp(prefix='.tmp-', dir=SharedData.cache_path)
+    try:
+        with open(os.path.join(snapshot_directory, 'meta.json'), 'wb') as f:
+            f.write(meta_content)
+        storage.getDirectory(dataset, project_id, SNAPSHOT_SUFFIX, get_columnar_files(meta), snapshot_directory)
+    except Exception:
+        shutil.rmtree(snapshot_directory, ignore_errors=True)
+        raise
+    return snapshot_directory
+
+
+def _get_accessor(dataset, project_id, byte_range=None):
+    '''
+    byte_range (start, end) restricts the accessor to those bytes of the raw
+    file; end may be None. Ranged accessors are file objects for the caller to close.
+    Compressed files are decompressed as they are read.
+    '''
+    accessor = get_storage(dataset).open(dataset, project_id, byte_range=byte_range)
+    if dataset.get('compression'):
+        return open_decompressed(accessor, dataset['compression'])
+    return accessor
+
+
+def get_row_index(dataset, project_id):
+    '''
+    Byte-offset row index of the raw file, or None if it has none
+    '''
+    storage = get_storage(dataset)
+    try:
+        row_index_path = storage.getLocalPath(dataset, project_id, suffix=ROW_INDEX_SUFFIX)
+        if row_index_path:
+            return read_row_index(row_index_path)
+        content = storage.read(dataset, project_id, suffix=ROW_INDEX_SUFFIX)
+        if content is not None:
+            return read_row_index(io.BytesIO(content))
+    except (IOError, ValueError, KeyError, ClientError) as e:
+        logger.error('Error reading row index of dataset %s: %s', dataset['id'], e, exc_info=True)
+    return None
+
+
+def check_row_index(dataset, project_id, n_rows):
+    '''
+    Drop the row index of the raw file if its row count differs from n_rows,
+    the number of rows the parser read, so reads fall back to the parser
+    '''
+    row_index = get_row_index(dataset, project_id)
+    if row_index is None or row_index.n_rows == n_rows:
+        return True
+    logger.warning('Row index of dataset %s has %s rows, parser read %s: dropping it',
+        dataset['id'], row_index.n_rows, n_rows)
+    get_storage(dataset).delete(dataset, project_id, suffix=ROW_INDEX_SUFFIX)
+    return False
+
+
+def read_raw_rows(dataset, project_id, start, nrows, row_index=None):
+    '''
+    Parse rows [start, start + nrows) of the raw file, seeking with the row
+    index when there is one
+    '''
+    if row_index is None:
+        row_index = get_row_index(dataset, project_id)
+
+    if row_index is None:
+        offset = dataset['offset'] or 0
+        df = _read_raw(dataset, project_id,
+            skiprows=range(0, offset) + range(offset + 1, offset + 1 + start),
+            nrows=nrows
+        )
+        df.index = pd.RangeIndex(start, start + len(df))
+        return df
+
+    names = _read_raw(dataset, project_id, nrows=1).columns.tolist()
+    if start >= row_index.n_rows:
+        return pd.DataFrame(columns=names)
+
+    byte_offset, rows_to_skip = row_index.seek(start)
+    accessor = _get_accessor(dataset, project_id, byte_range=(byte_offset, None))
+    try:
+        df = _read_raw(dataset, project_id, accessor=accessor, header=None, names=names, skiprows=rows_to_skip, nrows=nrows)
+    finally:
+        accessor.close()
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def get_na_values(dataset):
+    '''
+    Tokens the parser reads as missing values for this dataset
+    '''
+    na_values = dataset.get('na_values')
+    return na_values if na_values is not None else DEFAULT_NA_VALUES
+
+
+def _get_read_kwargs(dataset):
+    dialect = dataset['dialect']
+    return dict(
         error_bad_lines = False,
-        encoding = encoding,
+        encoding = dataset.get('encoding', 'utf-8'),
         skiprows = dataset['offset'],
         sep = dialect['delimiter'],
         engine = 'c',
@@ -89,29 +441,232 @@ def get_data(project_id=None, dataset_id=None, nrows=None, field_properties=[]):
         doublequote = dialect['doublequote'],
         quotechar = dialect['quotechar'],
         parse_dates = True,
-        nrows = nrows,
-        thousands = ','
+        thousands = ',',
+        na_values = get_na_values(dataset),
+        keep_default_na = False,
     )
-    sanitized_df = sanitize_df(df)
-    coerced_df = coerce_types(sanitized_df, field_properties)
 
-    IMD.insertData(dataset_id, coerced_df)
-    return coerced_df
+
+def _read_raw(dataset, project_id, **kwargs):
+    accessor = kwargs.pop('accessor', None) or _get_accessor(dataset, project_id)
+    read_kwargs = _get_read_kwargs(dataset)
+    read_kwargs.update(kwargs)
+    return pd.read_table(accessor, **read_kwargs)
+
+
+def _parse_byte_range(args):
+    '''
+    Parse bytes [start, end) of a file. Runs in pool workers, so takes only picklable arguments.
+    '''
+    path, (start, end), read_kwargs = args
+    with open(path, 'rb') as f:
+        f.seek(start)
+        content = f.read() if end is None else f.read(end - start)
+    return pd.read_table(io.BytesIO(content), **read_kwargs)
+
+
+def _read_raw_parallel(dataset, project_id, path, usecols=None):
+    '''
+    Parse the raw file at local path in byte ranges of whole rows, split at row index
+    offsets, in a pool of processes. Returns None when the file has no row
+    index, when ranges infer dtypes that concatenation would not reconcile as
+    a single parse does, or when the ranges do not add up to the rows and
+    columns of the file (a stale or misplaced index, or dropped bad lines).
+    '''
+    row_index = get_row_index(dataset, project_id)
+    if row_index is None:
+        return None
+    num_processes = current_app.config.get('PARALLEL_PARSE_PROCESSES') or cpu_count()
+    boundaries = row_index.getBoundaries(num_processes)
+    if len(boundaries) < 2:
+        return None
+
+    read_kwargs = _get_read_kwargs(dataset)
+    read_kwargs['usecols'] = usecols
+    names = _read_raw(dataset, project_id, nrows=1).columns.tolist()
+
+    # The first range includes the preamble and header; the others are bare rows
+    tasks = [ (path, (0, boundaries[1][0]), read_kwargs) ]
+    for byte_range in boundaries[1:]:
+        tasks.append((path, byte_range, dict(read_kwargs, header=None, names=names, skiprows=None)))
+
+    pool = get_pool(min(num_processes, len(tasks)))
+    try:
+        chunks = pool.map(_parse_byte_range, tasks)
+    except (CParserError, ValueError) as e:
+        # Ranges split inside quoted fields do not parse on their own
+        logger.warning('Ranges of dataset %s failed to parse (%s), parsing serially', dataset['id'], e)
+        return None
+    finally:
+        pool.close()
+        pool.join()
+
+    n_rows = sum(len(chunk) for chunk in chunks)
+    if n_rows != row_index.n_rows:
+        logger.warning('Ranges of dataset %s parsed %s rows, row index has %s, parsing serially', dataset['id'], n_rows, row_index.n_rows)
+        return None
+    header_columns = [ c for c in names if (usecols is None or c in usecols) ]
+    if any(chunk.columns.tolist() != header_columns for chunk in chunks):
+        logger.warning('Ranges of dataset %s parsed columns other than the header, parsing serially', dataset['id'])
+        return None
+
+    for column_name in chunks[0].columns:
+        dtypes = set(chunk[column_name].dtype for chunk in chunks)
+        if len(dtypes) > 1 and not all(dtype.kind in 'if' for dtype in dtypes):
+            logger.info('Ranges of dataset %s parsed %s as %s, parsing serially', dataset['id'], column_name, list(dtypes))
+            return None
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _get_parallel_parse_path(dataset, project_id):
+    '''
+    Local path of the raw file if it is large enough to parse in parallel, else None
+    '''
+    min_bytes = current_app.config.get('PARALLEL_PARSE_MIN_BYTES')
+    if not min_bytes or dataset.get('compression'):
+        return None
+    try:
+        path = get_storage(dataset).getLocalPath(dataset, project_id)
+        if path and os.path.getsize(path) >= min_bytes:
+            return path
+    except (OSError, ClientError) as e:
+        logger.debug('Not parsing dataset %s in parallel: %s', dataset['id'], e)
+    return None
+
+
+def _load_data(dataset, project_id, nrows=None, field_properties=[], columns=None):
+    df = None
+    parallel_parse_path = _get_parallel_parse_path(dataset, project_id) if nrows is None else None
+    if parallel_parse_path:
+        df = _read_raw_parallel(dataset, project_id, parallel_parse_path, usecols=columns)
+    if df is None:
+        df = _read_raw(dataset, project_id, nrows=nrows, usecols=columns)
+    if columns is not None:
+        df = df[columns]
+    return coerce_types(df, field_properties)
+
+
+def _get_columnar_directory(dataset, project_id, field_properties):
+    '''
+    Local columnar directory holding the current contents of a dataset, or None
+    '''
+    if not field_properties:
+        return None
+    version = get_content_version(dataset, field_properties)
+    if SharedData.hasData(dataset['id'], version):
+        return SharedData.getPath(dataset['id'], version)
+    storage = get_storage(dataset)
+    if storage.is_local:
+        snapshot_path = storage.getLocalPath(dataset, project_id, suffix=SNAPSHOT_SUFFIX)
+        if snapshot_path and has_columnar(snapshot_path) and read_columnar_meta(snapshot_path)['attrs'].get('content_version') == version:
+            return snapshot_path
+    return None
+
+
+def prefetch_snapshot(dataset, project_id, field_properties):
+    '''
+    Pull the columnar snapshot of a dataset's current contents into the page
+    cache, downloading it into the shared cache first from remote storage.
+    Returns False if there is no snapshot of this content version.
+    '''
+    directory = _get_columnar_directory(dataset, project_id, field_properties)
+    if directory is None and not get_storage(dataset).is_local and SharedData.enabled:
+        version = get_content_version(dataset, field_properties)
+        with SharedData.lock(dataset['id'], version):
+            if not SharedData.hasData(dataset['id'], version):
+                snapshot_directory = _download_snapshot(dataset, project_id, version)
+                if snapshot_directory:
+                    SharedData.insertDirectory(dataset['id'], version, snapshot_directory)
+        directory = _get_columnar_directory(dataset, project_id, field_properties)
+    if directory is None:
+        return False
+    read_through_columnar(directory)
+    return True
+
+
+DEFAULT_CHUNK_SIZE = 100000
+def iter_data_chunks(project_id=None, dataset_id=None, columns=None, chunksize=DEFAULT_CHUNK_SIZE, field_properties=[]):
+    '''
+    Yield coerced DataFrame chunks of at most chunksize rows, without holding
+    the whole dataset in memory. Chunks are sliced from the in-memory entry or
+    memory-mapped columnar files when available, else parsed incrementally.
+    '''
+    dataset_version = db_access.get_dataset_version(dataset_id)
+    if IMD.hasData(dataset_id, columns=columns, version=dataset_version):
+        try:
+            df = IMD.getData(dataset_id, columns=columns)
+            for start in range(0, df.shape[0], chunksize):
+                yield df.iloc[start:start + chunksize]
+            return
+        except KeyError:
+            pass
+
+    dataset = db_access.get_dataset(project_id, dataset_id)
+    if not field_properties:
+        field_properties = db_access.get_field_properties(project_id, dataset_id)
+
+    columnar_directory = _get_columnar_directory(dataset, project_id, field_properties)
+    if columnar_directory:
+        for chunk in iter_columnar(columnar_directory, chunksize, columns=columns):
+            yield chunk
+        return
+
+    for chunk in _read_raw(dataset, project_id, usecols=columns, chunksize=chunksize):
+        if columns is not None:
+            chunk = chunk[columns]
+        yield coerce_types(chunk, field_properties)
+
+
+class DataChunks(object):
+    '''
+    Re-iterable sequence of coerced chunks of a dataset, accepted in place of a
+    DataFrame by aggregations that can run in bounded memory
+    '''
+    def __init__(self, project_id, dataset_id, columns=None, chunksize=DEFAULT_CHUNK_SIZE, field_properties=[]):
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.columns = columns
+        self.chunksize = chunksize
+        self.field_properties = field_properties
+
+    def __iter__(self):
+        return self.iter_columns(self.columns)
+
+    def iter_columns(self, columns):
+        return iter_data_chunks(project_id=self.project_id, dataset_id=self.dataset_id, columns=columns, chunksize=self.chunksize, field_properties=self.field_properties)
+
+    def iter_column(self, column):
+        for chunk in self.iter_columns([ column ]):
+            yield chunk[column]
+
+    def to_frame(self, columns=None):
+        chunks = list(self.iter_columns(columns if columns is not None else self.columns))
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
 
 
 fields_to_coerce_to_float = [ 'decimal', 'latitude', 'longitude' ]
 fields_to_coerce_to_integer = [ 'year', 'integer' ]
 fields_to_coerce_to_string = [ 'string' ]
 fields_to_coerce_to_datetime = [ 'datetime' ]
+MAX_CATEGORICAL_UNIQUE_VALUES = 1000
 def coerce_types(df, field_properties):
+    '''
+    Force the columns of df to the types in field_properties. Nominal and
+    ordinal fields with at most MAX_CATEGORICAL_UNIQUE_VALUES unique_values
+    become Categoricals, and integer fields are stored in the narrowest
+    integer dtype holding their range.
+    '''
     decimal_fields = []
     integer_fields = []
     string_fields = []
     datetime_fields = []
+    categorical_fields = []
 
     for fp in field_properties:
         name = fp['name']
         data_type = fp['type']
+        if name not in df.columns:
+            continue
         if data_type in fields_to_coerce_to_float:
             decimal_fields.append(name)
         elif data_type in fields_to_coerce_to_integer:
@@ -121,12 +676,20 @@ def coerce_types(df, field_properties):
         elif data_type in fields_to_coerce_to_datetime:
             datetime_fields.append(name)
 
+        if (fp.get('general_type') == GDT.C.value) and \
+            (fp.get('scale') in [ Scale.NOMINAL.value, Scale.ORDINAL.value ]) and \
+            fp.get('unique_values') and (len(fp['unique_values']) <= MAX_CATEGORICAL_UNIQUE_VALUES):
+            categorical_fields.append(fp)
+
     # Forcing data types
     for decimal_field in decimal_fields:
         df[decimal_field] = pd.to_numeric(df[decimal_field], errors='coerce')
 
     for integer_field in integer_fields:
-        df[integer_field] = pd.to_numeric(df[integer_field], errors='coerce')
+        df[integer_field] = downcast_integers(pd.to_numeric(df[integer_field], errors='coerce'))
+
+    for fp in categorical_fields:
+        df[fp['name']] = encode_categorical(df[fp['name']], fp['unique_values'], ordered=(fp['scale'] == Scale.ORDINAL.value))
 
     for datetime_field in datetime_fields:
         df[datetime_field] = pd.to_datetime(
@@ -137,32 +700,48 @@ def coerce_types(df, field_properties):
     return df
 
 
-def sanitize_df(df):
-    # General Sanitation
-    invalid_chars = [ 'None', '', 'n/a', 'na', 'NA', 'NaN', 'n/\a', '.', '\n', '\r\n' ]
-    for invalid_char in invalid_chars:
-        df.replace(invalid_char, np.nan)
-    return df
-
-
-def make_safe_string(s):
-    invalid_chars = '-_.+^$#/\() '
-    if not s.startswith('temp_name_'):
-        for invalid_char in invalid_chars:
-
-            s = s.replace(invalid_char, '_')
-        s = 'temp_name_' + s
-    return s
+def downcast_integers(series):
+    '''
+    Columns with NAs stay float64
+    '''
+    if (series.dtype.kind != 'i') or not len(series):
+        return series
+    min_value, max_value = series.min(), series.max()
+    for dtype in [ np.int8, np.int16, np.int32 ]:
+        if np.iinfo(dtype).min <= min_value and max_value <= np.iinfo(dtype).max:
+            return series.astype(dtype)
+    return series
 
 
-def _construct_conditional_clause(field, operation, criteria):
-    field_general_type = field['general_type']
-    field_name = make_safe_string(field['name'])
-    if (field_general_type == 'q') or (field_general_type == 't'):
-        query_string = '%s %s %s' % (field_name, operation, criteria)
-    else:
-        query_string = '%s %s "%s"' % (field_name, operation, criteria)
-    return query_string
+def encode_categorical(series, unique_values, ordered=False):
+    '''
+    Categorical with unique_values as categories, so that every chunk of a
+    dataset is encoded alike. Returns series unchanged if unique_values does
+    not cover it.
+    '''
+    if pd.core.common.is_categorical_dtype(series.dtype):
+        return series
+    try:
+        categorical = pd.Categorical(series, categories=unique_values, ordered=ordered)
+    except (TypeError, ValueError):
+        return series
+    if (categorical.codes == -1).sum() != series.isnull().sum():
+        return series
+    return pd.Series(categorical, index=series.index, name=series.name)
+
+
+def remove_unused_categories(df):
+    '''
+    Drop categories without rows from the Categorical columns of df, so that
+    groupbys after filtering only see the values present
+    '''
+    categorical_columns = [ c for c in df.columns if pd.core.common.is_categorical_dtype(df[c].dtype) ]
+    if not categorical_columns:
+        return df
+    df = df.copy(deep=False)
+    for column in categorical_columns:
+        df[column] = df[column].cat.remove_unused_categories()
+    return df
 
 
 def get_conditioned_data(project_id, dataset_id, df, conditional_arg):
@@ -170,57 +749,18 @@ def get_conditioned_data(project_id, dataset_id, df, conditional_arg):
     Given a data frame and a conditional dict ({ and: [{field_id, operation,
     criteria}], or: [...]}).
 
-    Return the conditioned data frame in same dimensions as original.
-
-    TODO Turn this into an argument of the get_data function
+    Return the rows of df satisfying all and clauses or any or clause. df must
+    hold every row of the dataset, and at least the conditioned fields.
     '''
-    full_conditional = {}
-
-    and_clause_list = conditional_arg.get('and')
-    or_clause_list = conditional_arg.get('or')
-    if not (and_clause_list or or_clause_list):
+    if not (conditional_arg.get('and') or conditional_arg.get('or')):
         return df
 
-    desired_keys = ['general_type', 'name', 'id']
-    raw_field_properties = db_access.get_field_properties(project_id, dataset_id)
-    all_field_properties = [{ k: field[k] for k in desired_keys } for field in raw_field_properties]
-
-    query_strings = { 'and': '', 'or': '' }
-
-    orig_cols = df.columns.tolist()
-    safe_df = df.rename(columns=make_safe_string)
-
-
-    if and_clause_list:
-        for c in and_clause_list:
-            field = next((field for field in all_field_properties if c['field_id'] == field['id']), None)
-            if field and c['criteria'] is not None:
-                clause = _construct_conditional_clause(field, c['operation'], c['criteria'])
-                query_strings['and'] = query_strings['and'] + ' & ' + clause
-
-    if or_clause_list:
-        for c in or_clause_list:
-            field = next((field for field in all_field_properties if c['field_id'] == field['id']), None)
-            if field and c['criteria'] is not None:
-                clause = _construct_conditional_clause(field, c['operation'], c['criteria'])
-                query_strings['or'] = query_strings['or'] + ' | ' + clause
-
-    query_strings['and'] = query_strings['and'].strip(' & ')
-    query_strings['or'] = query_strings['or'].strip(' | ')
-
-    # Concatenate
-    final_query_string = ''
-    if query_strings['and'] and query_strings['or']:
-        final_query_string = '%s | %s' % (query_strings['and'], query_strings['or'])
-    elif query_strings['and'] and not query_strings['or']:
-        final_query_string = query_strings['and']
-    elif query_strings['or'] and not query_strings['and']:
-        final_query_string = query_strings['or']
-
-    if not final_query_string:
+    field_properties = db_access.get_field_properties(project_id, dataset_id)
+    clauses = get_clauses(conditional_arg, field_properties)
+    if not (clauses['and'] or clauses['or']):
         return df
 
-    conditioned_df = safe_df.query(final_query_string)
-    conditioned_df.columns = orig_cols
-
-    return conditioned_df
+    dataset_version = db_access.get_dataset_version(dataset_id)
+    get_index = lambda field_name: get_categorical_index(project_id, dataset_id, field_name, field_properties)
+    mask = get_conditional_mask(dataset_id, dataset_version, df, clauses, get_index=get_index)
+    return remove_unused_categories(df[mask])
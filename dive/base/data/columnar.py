@@ -0,0 +1,307 @@
+'''
+Typed columnar on-disk format for DataFrames
+
+A snapshot is a directory with one .npy file per column and a meta.json
+describing names, storage kinds and free-form attributes. It may also hold
+row-id indexes of some columns (see dive.base.data.indexes). Numeric and datetime
+columns are memory-mapped on read, so processes reading the same snapshot share
+the OS page cache instead of each holding a private copy.
+
+Columns of strings are stored as byte offsets (the .npy file) into a blob of
+the concatenated UTF-8 values, with a mask of nulls, so a range of rows is read
+without loading the rest of the column. Other object columns are pickled whole.
+'''
+import os
+import json
+import errno
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+FORMAT_VERSION = 2
+META_FILE_NAME = 'meta.json'
+MMAP_DTYPE_KINDS = 'biufcmM'
+INDEX_PARTS = [ 'values', 'offsets', 'row_ids' ]
+READ_THROUGH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def has_columnar(directory):
+    return os.path.isfile(os.path.join(directory, META_FILE_NAME))
+
+
+def read_columnar_meta(directory):
+    with open(os.path.join(directory, META_FILE_NAME), 'r') as f:
+        return json.load(f)
+
+
+def _get_string_encoding(values):
+    '''
+    'utf-8' if every non-null value is unicode, None if every one is a byte
+    string, False if values hold anything else (including nulls other than NaN)
+    '''
+    types = set(type(v) for v in values if not (isinstance(v, float) and v != v))
+    if types == set([ unicode ]):
+        return 'utf-8'
+    if types == set([ str ]):
+        return None
+    return False
+
+
+def _write_strings(path, values, encoding):
+    null = np.array([ isinstance(v, float) for v in values ], dtype=bool)
+    encoded = [ b'' if is_null else (v.encode(encoding) if encoding else v) for (v, is_null) in zip(values, null) ]
+    lengths = np.fromiter((len(v) for v in encoded), dtype=np.int64, count=len(encoded))
+    np.save(path, np.concatenate([ [ 0 ], np.cumsum(lengths) ]).astype(np.int64))
+    np.save(path + '.nulls.npy', null)
+    with open(path + '.strings', 'wb') as f:
+        for v in encoded:
+            f.write(v)
+
+
+def _read_strings(path, encoding, rows):
+    '''
+    Values of rows (a slice with step 1) of a column of strings, reading only
+    their bytes from the blob
+    '''
+    offsets = np.load(path, mmap_mode='r')
+    start, stop, step = rows.indices(len(offsets) - 1)
+    stop = max(start, stop)
+    offsets = np.array(offsets[start:stop + 1])
+    null = np.array(np.load(path + '.nulls.npy', mmap_mode='r')[start:stop])
+
+    with open(path + '.strings', 'rb') as f:
+        f.seek(offsets[0])
+        blob = f.read(offsets[-1] - offsets[0])
+
+    offsets = (offsets - offsets[0]).tolist()
+    values = np.empty(stop - start, dtype=object)
+    for i in range(stop - start):
+        if null[i]:
+            values[i] = np.nan
+        else:
+            value = blob[offsets[i]:offsets[i + 1]]
+            values[i] = value.decode(encoding) if encoding else value
+    return values
+
+
+def _write_column(directory, file_name, series):
+    column_meta = { 'file': file_name, 'kind': 'array', 'tz': None }
+    path = os.path.join(directory, file_name)
+
+    if pd.core.common.is_categorical_dtype(series.dtype):
+        column_meta['kind'] = 'category'
+        column_meta['ordered'] = bool(series.cat.ordered)
+        np.save(path, series.cat.codes.values)
+        np.save(path + '.categories.npy', np.asarray(series.cat.categories.values))
+    elif pd.core.common.is_datetimetz(series):
+        column_meta['tz'] = str(series.dt.tz)
+        np.save(path, pd.DatetimeIndex(series).asi8)
+    elif series.dtype.kind in MMAP_DTYPE_KINDS:
+        np.save(path, series.values)
+    else:
+        values = series.values.astype(object)
+        encoding = _get_string_encoding(values)
+        if encoding is False:
+            column_meta['kind'] = 'object'
+            np.save(path, values)
+        else:
+            column_meta['kind'] = 'strings'
+            column_meta['encoding'] = encoding
+            _write_strings(path, values, encoding)
+    return column_meta
+
+
+def _read_column(directory, column_meta, index, mmap=True, rows=slice(None)):
+    '''
+    rows slices the column before it is materialized; memory-mapped kinds and
+    strings then only read the pages holding those rows
+    '''
+    path = os.path.join(directory, column_meta['file'])
+    kind = column_meta['kind']
+    mmap_mode = 'r' if mmap else None
+
+    if kind == 'category':
+        codes = np.load(path, mmap_mode='r')[rows]
+        categories = np.load(path + '.categories.npy')
+        values = pd.Categorical.from_codes(np.asarray(codes), categories, ordered=column_meta.get('ordered', False))
+    elif kind == 'strings':
+        values = _read_strings(path, column_meta.get('encoding'), rows)
+    elif kind == 'object':
+        values = np.load(path)[rows]
+    elif column_meta.get('tz'):
+        values = pd.DatetimeIndex(np.load(path, mmap_mode='r')[rows]).tz_localize('UTC').tz_convert(column_meta['tz'])
+    else:
+        values = np.load(path, mmap_mode=mmap_mode)[rows]
+    return pd.Series(values, index=index)
+
+
+def get_columnar_files(meta):
+    '''
+    Names of every file of a snapshot besides meta.json
+    '''
+    file_names = []
+    for column_meta in meta['columns']:
+        file_names.append(column_meta['file'])
+        if column_meta['kind'] == 'category':
+            file_names.append('%s.categories.npy' % column_meta['file'])
+        elif column_meta['kind'] == 'strings':
+            file_names.extend([ '%s.nulls.npy' % column_meta['file'], '%s.strings' % column_meta['file'] ])
+    for index_meta in meta.get('indexes', {}).values():
+        file_names.extend([ '%s.%s.npy' % (index_meta['file'], part) for part in INDEX_PARTS ])
+    return file_names
+
+
+def write_columnar(df, directory, attrs={}, indexes={}):
+    '''
+    Atomically write df into directory, replacing any existing snapshot.
+    indexes maps column names to dicts of index arrays (see INDEX_PARTS).
+    Returns the written meta.
+    '''
+    parent = os.path.dirname(os.path.abspath(directory))
+    ensure_directory(parent)
+    tmp_directory = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+
+    try:
+        meta = {
+            'format_version': FORMAT_VERSION,
+            'n_rows': df.shape[0],
+            'columns': [],
+            'indexes': {},
+            'attrs': attrs
+        }
+        for (i, column_name) in enumerate(df.columns):
+            column_meta = _write_column(tmp_directory, 'c%s.npy' % i, df[column_name])
+            column_meta['name'] = column_name
+            meta['columns'].append(column_meta)
+
+        for (i, (column_name, index_arrays)) in enumerate(indexes.items()):
+            file_name = 'x%s' % i
+            for part in INDEX_PARTS:
+                np.save(os.path.join(tmp_directory, '%s.%s.npy' % (file_name, part)), index_arrays[part])
+            meta['indexes'][column_name] = { 'file': file_name }
+
+        with open(os.path.join(tmp_directory, META_FILE_NAME), 'w') as f:
+            json.dump(meta, f)
+
+        replace_directory(tmp_directory, directory)
+    except Exception:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        raise
+    return meta
+
+
+def read_columnar(directory, columns=None, mmap=True, start=None, stop=None):
+    '''
+    Read a snapshot into a DataFrame. If columns is given, only those files are
+    touched; if start or stop is given, only rows [start, stop) are read.
+    Raises KeyError if a requested column is not in the snapshot.
+    '''
+    meta = read_columnar_meta(directory)
+    columns_meta = OrderedDict([ (c['name'], c) for c in meta['columns'] ])
+
+    if columns is None:
+        columns = columns_meta.keys()
+
+    rows = slice(*slice(start, stop).indices(meta['n_rows']))
+    index = pd.RangeIndex(rows.start, rows.stop)
+    data = OrderedDict()
+    for column_name in columns:
+        data[column_name] = _read_column(directory, columns_meta[column_name], index, mmap=mmap, rows=rows)
+    return pd.DataFrame(data, columns=columns, index=index)
+
+
+def read_columnar_index(directory, column_name, meta=None):
+    '''
+    Returns the index arrays of column_name, or None if it is not indexed.
+    Row ids are memory-mapped.
+    '''
+    if meta is None:
+        meta = read_columnar_meta(directory)
+    index_meta = meta.get('indexes', {}).get(column_name)
+    if not index_meta:
+        return None
+    index_arrays = {}
+    for part in INDEX_PARTS:
+        path = os.path.join(directory, '%s.%s.npy' % (index_meta['file'], part))
+        index_arrays[part] = np.load(path, mmap_mode=('r' if part == 'row_ids' else None))
+    return index_arrays
+
+
+def iter_columnar(directory, chunksize, columns=None):
+    '''
+    Yield DataFrames of at most chunksize rows. Array columns are memory-mapped
+    and strings read range by range, so only the current chunk is
+    materialized; pickled object columns are loaded whole.
+    '''
+    meta = read_columnar_meta(directory)
+    columns_meta = OrderedDict([ (c['name'], c) for c in meta['columns'] ])
+    if columns is None:
+        columns = columns_meta.keys()
+
+    index = pd.RangeIndex(meta['n_rows'])
+    object_series = dict((column_name, _read_column(directory, columns_meta[column_name], index))
+        for column_name in columns if columns_meta[column_name]['kind'] == 'object')
+    for start in range(0, meta['n_rows'], chunksize):
+        stop = min(start + chunksize, meta['n_rows'])
+        chunk_index = pd.RangeIndex(start, stop)
+        data = OrderedDict()
+        for column_name in columns:
+            if column_name in object_series:
+                data[column_name] = object_series[column_name].iloc[start:stop]
+            else:
+                data[column_name] = _read_column(directory, columns_meta[column_name], chunk_index, rows=slice(start, stop))
+        yield pd.DataFrame(data, columns=columns)
+
+
+def replace_directory(src, dst):
+    '''
+    Move src into place at dst. Readers holding files from a previous dst keep
+    them, since unlinking does not invalidate open memory maps.
+    '''
+    trash = None
+    if os.path.exists(dst):
+        trash = tempfile.mkdtemp(prefix='.trash-', dir=os.path.dirname(os.path.abspath(dst)))
+        os.rename(dst, os.path.join(trash, 'old'))
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        # Another process won the race and wrote an equivalent snapshot
+        if e.errno not in [ errno.EEXIST, errno.ENOTEMPTY ]:
+            raise
+        shutil.rmtree(src, ignore_errors=True)
+    if trash:
+        shutil.rmtree(trash, ignore_errors=True)
+
+
+def get_columnar_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, file_name)) for file_name in os.listdir(directory))
+
+
+def read_through_columnar(directory):
+    '''
+    Read every file of a columnar directory once, pulling it into the page
+    cache for later memory maps
+    '''
+    for file_name in os.listdir(directory):
+        with open(os.path.join(directory, file_name), 'rb') as f:
+            while f.read(READ_THROUGH_BLOCK_SIZE):
+                pass
+
+
+def remove_columnar(directory):
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def ensure_directory(directory):
+    try:
+        os.makedirs(directory)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
@@ -0,0 +1,190 @@
+'''
+Compressed raw files
+
+Uploads compressed with gzip, bzip2, xz or zip are stored as they are and
+decompressed as a stream whenever they are read. Decompressed byte offsets do
+not map to the stored file, so compressed files have no row index and are
+parsed serially.
+
+xz needs the lzma module (backports.lzma on Python 2); without it, xz uploads
+are rejected.
+'''
+import bz2
+import zlib
+import shutil
+import zipfile
+import tempfile
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+# Compression by file extension
+COMPRESSIONS = {
+    'gz': 'gzip',
+    'gzip': 'gzip',
+    'bz2': 'bz2',
+    'xz': 'xz',
+    'zip': 'zip'
+}
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def get_compression(file_name):
+    '''
+    Returns (compression or None, file_name without the compression extension)
+    '''
+    if '.' in file_name:
+        name, extension = file_name.rsplit('.', 1)
+        compression = COMPRESSIONS.get(extension.lower())
+        if compression:
+            return compression, name
+    return None, file_name
+
+
+def _get_zip_member(archive):
+    members = [ info for info in archive.infolist() if not info.filename.endswith('/') ]
+    if not members:
+        raise ValueError('Zip archive contains no files')
+    if len(members) > 1:
+        logger.info('Zip archive contains %s files, reading %s', len(members), members[0].filename)
+    return members[0]
+
+
+def get_zip_member_name(file_obj):
+    '''
+    Name of the file read from a zip archive
+    '''
+    file_obj.seek(0)
+    try:
+        return _get_zip_member(zipfile.ZipFile(file_obj)).filename
+    finally:
+        file_obj.seek(0)
+
+
+def _get_decompressor(compression):
+    if compression == 'gzip':
+        # 16 + MAX_WBITS expects a gzip header and trailer
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    if compression == 'xz':
+        if lzma is None:
+            raise ValueError('xz files need the lzma module')
+        return lzma.LZMADecompressor()
+    raise ValueError('Unknown compression %s' % compression)
+
+
+class DecompressingReader(object):
+    '''
+    Read-only file object over the decompressed contents of file_obj. Only
+    rewinding is supported, by seek(0).
+
+    Concatenated gzip, bzip2 and xz streams are read one after another, as
+    their command-line tools do. Zip archives are read from their first file,
+    and need a seekable file_obj, so other streams are spooled to a temporary
+    file first.
+    '''
+    def __init__(self, file_obj, compression, chunk_size=READ_CHUNK_SIZE):
+        self.source = file_obj
+        self.file_obj = file_obj
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.spooled_file = None
+        if compression == 'zip' and not _is_seekable(file_obj):
+            self.spooled_file = tempfile.TemporaryFile()
+            shutil.copyfileobj(file_obj, self.spooled_file, chunk_size)
+            self.file_obj = self.spooled_file
+        self._start()
+
+    def _start(self):
+        self.position = 0
+        self.buffer = b''
+        self.eof = False
+        if self.compression == 'zip':
+            archive = zipfile.ZipFile(self.file_obj)
+            self.member = archive.open(_get_zip_member(archive))
+        else:
+            self.decompressor = _get_decompressor(self.compression)
+
+    def _read_chunk(self):
+        if self.compression == 'zip':
+            chunk = self.member.read(self.chunk_size)
+            self.eof = not chunk
+            return chunk
+
+        data = self.file_obj.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return getattr(self.decompressor, 'flush', lambda: b'')()
+
+        chunk = self._decompress(data)
+        unused_data = self.decompressor.unused_data
+        while unused_data:
+            # Another stream follows the one just ended
+            self.decompressor = _get_decompressor(self.compression)
+            chunk += self.decompressor.decompress(unused_data)
+            unused_data = self.decompressor.unused_data
+        return chunk
+
+    def _decompress(self, data):
+        try:
+            return self.decompressor.decompress(data)
+        except EOFError:
+            # The previous stream ended exactly at the end of the last chunk
+            self.decompressor = _get_decompressor(self.compression)
+            return self.decompressor.decompress(data)
+
+    def read(self, size=-1):
+        while not self.eof and (size is None or size < 0 or len(self.buffer) < size):
+            self.buffer += self._read_chunk()
+
+        if size is None or size < 0:
+            result, self.buffer = self.buffer, b''
+        else:
+            result, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.position += len(result)
+        return result
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise IOError('Decompressed streams can only be rewound')
+        self.file_obj.seek(0)
+        self._start()
+
+    def close(self):
+        if self.compression == 'zip':
+            self.member.close()
+        if self.spooled_file:
+            self.spooled_file.close()
+        if hasattr(self.source, 'close'):
+            self.source.close()
+
+
+def _is_seekable(file_obj):
+    try:
+        file_obj.seek(file_obj.tell())
+    except (AttributeError, IOError, ValueError):
+        return False
+    return True
+
+
+def open_decompressed(accessor, compression):
+    '''
+    DecompressingReader over a path or file object
+    '''
+    if isinstance(accessor, basestring):
+        accessor = open(accessor, 'rb')
+    return DecompressingReader(accessor, compression)
@@ -0,0 +1,174 @@
+'''
+Compile conditional dicts ({ and: [{field_id, operation, criteria}], or: [...] })
+into boolean row masks
+
+Masks are evaluated column by column with NumPy comparisons, or from a
+categorical row-id index for equality and membership tests when the field has
+one. They are memoized per (dataset_id, dataset version, conditionals hash) so
+specs sharing conditionals only pay for the first evaluation.
+'''
+import json
+import operator
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+operations = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda series, values: series.isin(values),
+    'not in': lambda series, values: ~series.isin(values),
+}
+list_operations = [ 'in', 'not in' ]
+negated_operations = [ '!=', 'not in' ]
+index_operations = [ '==', '!=', 'in', 'not in' ]
+
+MASK_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+def get_clauses(conditionals, field_properties):
+    '''
+    Resolve the and/or clause lists of conditionals against field_properties,
+    dropping clauses without criteria or with unknown fields, as (field, operation, criteria)
+    '''
+    field_properties_by_id = dict((fp['id'], fp) for fp in field_properties)
+    clauses = {}
+    for clause_type in [ 'and', 'or' ]:
+        clauses[clause_type] = []
+        for c in (conditionals or {}).get(clause_type) or []:
+            field = field_properties_by_id.get(c['field_id'])
+            if field and c['criteria'] is not None:
+                clauses[clause_type].append((field, c['operation'], c['criteria']))
+    return clauses
+
+
+def get_conditionals_hash(clauses):
+    key = dict((clause_type, [ (field['id'], operation, criteria) for (field, operation, criteria) in clause_list ])
+        for clause_type, clause_list in clauses.items())
+    return hashlib.md5(json.dumps(key, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _coerce_criteria(series, criteria):
+    '''
+    Convert the criteria of the client to the type of the column values: datetime
+    columns compare against timestamps, numeric columns (including categoricals
+    of numbers, and years stored as integers) against floats, others against strings
+    '''
+    dtype = series.cat.categories.dtype if pd.core.common.is_categorical_dtype(series.dtype) else series.dtype
+    if dtype.kind == 'M':
+        return pd.Timestamp(criteria)
+    if dtype.kind in 'biuf':
+        try:
+            return float(criteria)
+        except (TypeError, ValueError):
+            return criteria
+    return '%s' % criteria
+
+
+def compile_clause(df, field, operation, criteria, index=None):
+    if operation not in operations:
+        raise ValueError('Invalid conditional operation %s, must be one of %s' % (operation, operations.keys()))
+    series = df[field['name']]
+    if operation in list_operations:
+        value = [ _coerce_criteria(series, c) for c in criteria ]
+    else:
+        value = _coerce_criteria(series, criteria)
+
+    if (index is not None) and (operation in index_operations) and (index.num_rows == len(series)):
+        mask = index.getMask(value if operation in list_operations else [ value ])
+        return ~mask if operation in negated_operations else mask
+
+    # Unordered categoricals only support equality, so order comparisons run on the values
+    if pd.core.common.is_categorical_dtype(series.dtype) and (operation not in index_operations):
+        series = pd.Series(np.asarray(series), index=series.index)
+
+    return np.asarray(operations[operation](series, value), dtype=bool)
+
+
+def compile_mask(df, clauses, get_index=None):
+    '''
+    Returns a boolean array over the rows of df: (all and clauses) | (any or clause),
+    or None if there are no clauses. get_index(field_name) may return a
+    CategoricalIndex of the field, or None.
+    '''
+    def _compile(field, operation, criteria):
+        index = get_index(field['name']) if (get_index and operation in index_operations) else None
+        return compile_clause(df, field, operation, criteria, index=index)
+
+    and_mask = None
+    for (field, operation, criteria) in clauses.get('and', []):
+        clause_mask = _compile(field, operation, criteria)
+        and_mask = clause_mask if and_mask is None else (and_mask & clause_mask)
+
+    or_mask = None
+    for (field, operation, criteria) in clauses.get('or', []):
+        clause_mask = _compile(field, operation, criteria)
+        or_mask = clause_mask if or_mask is None else (or_mask | clause_mask)
+
+    if and_mask is None:
+        return or_mask
+    if or_mask is None:
+        return and_mask
+    return and_mask | or_mask
+
+
+class conditionalMasks(object):
+    '''
+    Process-local LRU cache of compiled masks, bounded by total bytes
+    '''
+    def __init__(self, max_bytes=MASK_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.masks = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def getMask(self, key, num_rows):
+        with self.lock:
+            mask = self.masks.pop(key, None)
+            if mask is None:
+                return None
+            self.masks[key] = mask
+        # Masks only apply to frames with every row of the dataset
+        if len(mask) != num_rows:
+            return None
+        return mask
+
+    def insertMask(self, key, mask):
+        with self.lock:
+            if key in self.masks:
+                self.total_bytes -= self.masks.pop(key).nbytes
+            if mask.nbytes > self.max_bytes:
+                return
+            self.masks[key] = mask
+            self.total_bytes += mask.nbytes
+            while self.total_bytes > self.max_bytes:
+                evicted_key, evicted_mask = self.masks.popitem(last=False)
+                self.total_bytes -= evicted_mask.nbytes
+
+    def removeDataset(self, dataset_id):
+        with self.lock:
+            for key in [ k for k in self.masks.keys() if k[0] == dataset_id ]:
+                self.total_bytes -= self.masks.pop(key).nbytes
+
+ConditionalMasks = conditionalMasks()
+
+
+def get_conditional_mask(dataset_id, version, df, clauses, get_index=None):
+    key = (dataset_id, version, get_conditionals_hash(clauses))
+    mask = ConditionalMasks.getMask(key, len(df))
+    if mask is None:
+        mask = compile_mask(df, clauses, get_index=get_index)
+        if mask is not None:
+            ConditionalMasks.insertMask(key, mask)
+    return mask
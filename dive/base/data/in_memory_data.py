@@ -1,21 +1,176 @@
+'''
+Process-local cache of loaded datasets
+
+Frames are kept under a byte budget (measured with DataFrame.memory_usage(deep=True))
+and evicted by least-recent or least-frequent use. Pinned datasets are never evicted.
+An entry may hold only some of a dataset's columns; it is then marked incomplete
+and further columns can be added as they are requested. Entries remember the
+dataset version they were loaded at, and are dropped when a newer one is asked for.
+'''
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+EVICTION_POLICIES = [ 'lru', 'lfu' ]
+
+
+def get_df_size(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
 class inMemoryData(object):
 
-    def __init__(self):
-        self.data = {}
+    def __init__(self, max_bytes=None, eviction_policy='lru'):
+        self.data = OrderedDict()
+        self.complete = set()
+        self.versions = {}
+        self.sizes = {}
+        self.frequencies = {}
+        self.pinned = set()
+        self.total_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.RLock()
+        self.configure(max_bytes=max_bytes, eviction_policy=eviction_policy)
+
+    def configure(self, max_bytes=None, eviction_policy='lru'):
+        if eviction_policy not in EVICTION_POLICIES:
+            raise ValueError('Invalid eviction policy %s, must be one of %s' % (eviction_policy, EVICTION_POLICIES))
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.eviction_policy = eviction_policy
+            self._evict()
 
-    def insertData(self, dataset_id, df):
-        self.data[dataset_id] = df
+    def insertData(self, dataset_id, df, complete=True, version=None):
+        size = get_df_size(df)
+        with self.lock:
+            if dataset_id in self.data:
+                self._remove(dataset_id)
 
-    def hasData(self, dataset_id):
-        if dataset_id in self.data:
-            return True
-        else:
-            return False
+            if (self.max_bytes is not None) and (size > self.max_bytes) and (dataset_id not in self.pinned):
+                logger.info('Not caching dataset %s: %s bytes exceeds budget of %s bytes', dataset_id, size, self.max_bytes)
+                return
 
-    def getData(self, dataset_id):
-        return self.data[dataset_id]
+            self.data[dataset_id] = df
+            self.versions[dataset_id] = version
+            if complete:
+                self.complete.add(dataset_id)
+            self.sizes[dataset_id] = size
+            self.frequencies[dataset_id] = self.frequencies.get(dataset_id, 0) + 1
+            self.total_bytes += size
+            self._evict()
+
+    def addColumns(self, dataset_id, df, version=None):
+        '''
+        Merge the columns of df into the (possibly partial) entry for dataset_id.
+        Returns the merged frame.
+        '''
+        with self.lock:
+            self._drop_stale(dataset_id, version)
+            if dataset_id not in self.data:
+                self.insertData(dataset_id, df, complete=False, version=version)
+                return df
+            existing_df = self.data[dataset_id]
+            new_columns = [ c for c in df.columns if c not in existing_df.columns ]
+            if not new_columns:
+                return existing_df
+            complete = dataset_id in self.complete
+            merged_df = pd.concat([ existing_df, df[new_columns] ], axis=1)
+            self.insertData(dataset_id, merged_df, complete=complete, version=version)
+            return merged_df
+
+    def hasData(self, dataset_id, columns=None, version=None):
+        with self.lock:
+            self._drop_stale(dataset_id, version)
+            if dataset_id in self.data and \
+                ((dataset_id in self.complete) or (columns is not None and all(c in self.data[dataset_id].columns for c in columns))):
+                return True
+            else:
+                self.misses += 1
+                return False
+
+    def getData(self, dataset_id, columns=None):
+        with self.lock:
+            df = self.data.pop(dataset_id)
+            self.data[dataset_id] = df  # Move to most-recently used position
+            self.frequencies[dataset_id] = self.frequencies.get(dataset_id, 0) + 1
+            self.hits += 1
+        if columns is not None:
+            return df[columns]
+        return df
+
+    def getColumns(self, dataset_id, version=None):
+        with self.lock:
+            self._drop_stale(dataset_id, version)
+            if dataset_id in self.data:
+                return self.data[dataset_id].columns.tolist()
+            return []
 
     def removeData(self, dataset_id):
+        with self.lock:
+            if dataset_id in self.data:
+                self._remove(dataset_id)
+            self.frequencies.pop(dataset_id, None)
+
+    def pinData(self, dataset_id):
+        with self.lock:
+            self.pinned.add(dataset_id)
+
+    def unpinData(self, dataset_id):
+        with self.lock:
+            self.pinned.discard(dataset_id)
+            self._evict()
+
+    def getStats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'num_datasets': len(self.data),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'eviction_policy': self.eviction_policy,
+                'pinned': list(self.pinned)
+            }
+
+    def _drop_stale(self, dataset_id, version):
+        if (version is not None) and (dataset_id in self.data) and (self.versions.get(dataset_id) != version):
+            logger.debug('Dropping stale dataset %s from IMD', dataset_id)
+            self._remove(dataset_id)
+
+    def _remove(self, dataset_id):
         del self.data[dataset_id]
+        self.complete.discard(dataset_id)
+        self.versions.pop(dataset_id, None)
+        self.total_bytes -= self.sizes.pop(dataset_id, 0)
+
+    def _next_victim(self):
+        candidates = [ k for k in self.data.keys() if k not in self.pinned ]
+        if not candidates:
+            return None
+        if self.eviction_policy == 'lfu':
+            # Ties broken by recency, since keys are ordered least- to most-recently used
+            return min(candidates, key=lambda k: self.frequencies.get(k, 0))
+        return candidates[0]
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        while self.total_bytes > self.max_bytes:
+            victim = self._next_victim()
+            if victim is None:
+                break
+            logger.debug('Evicting dataset %s (%s bytes) from IMD', victim, self.sizes.get(victim))
+            self._remove(victim)
+            self.evictions += 1
 
-InMemoryData = inMemoryData()
\ No newline at end of file
+InMemoryData = inMemoryData()
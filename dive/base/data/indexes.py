@@ -0,0 +1,92 @@
+'''
+Row-id indexes of categorical fields
+
+For each nominal or ordinal field with known unique_values, the positions of
+the rows holding each value are stored contiguously (CSR layout: values,
+offsets into row_ids, row_ids), so equality and membership conditionals
+resolve by gathering row ids instead of comparing every value of the column.
+'''
+import numpy as np
+import pandas as pd
+
+from dive.base.constants import Scale
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CategoricalIndex(object):
+    def __init__(self, values, offsets, row_ids, num_rows):
+        self.values = values
+        self.offsets = offsets
+        self.row_ids = row_ids
+        self.num_rows = num_rows
+
+    @classmethod
+    def from_arrays(cls, index_arrays, num_rows):
+        return cls(index_arrays['values'], index_arrays['offsets'], index_arrays['row_ids'], num_rows)
+
+    def to_arrays(self):
+        return {
+            'values': self.values,
+            'offsets': self.offsets,
+            'row_ids': self.row_ids
+        }
+
+    def getRowIds(self, values):
+        '''
+        Sorted positions of the rows equal to any of values
+        '''
+        values = set(values)
+        positions = [ i for (i, v) in enumerate(self.values) if v in values ]
+        if not positions:
+            return np.array([], dtype=self.row_ids.dtype)
+        row_ids = np.concatenate([ self.row_ids[self.offsets[i]:self.offsets[i + 1]] for i in positions ])
+        if len(positions) > 1:
+            row_ids.sort()
+        return row_ids
+
+    def getMask(self, values):
+        mask = np.zeros(self.num_rows, dtype=bool)
+        mask[self.getRowIds(values)] = True
+        return mask
+
+
+def build_categorical_index(series, unique_values):
+    '''
+    Returns None if unique_values does not cover every non-null value of series
+    '''
+    if not unique_values:
+        return None
+    codes = pd.Categorical(series, categories=unique_values).codes
+    num_missing = (codes == -1).sum()
+    if num_missing != series.isnull().sum():
+        return None
+
+    row_id_dtype = np.int32 if len(series) < np.iinfo(np.int32).max else np.int64
+    counts = np.bincount(codes[codes != -1], minlength=len(unique_values))
+    offsets = np.concatenate([ [ 0 ], np.cumsum(counts) ]).astype(np.int64)
+
+    # Stable sort keeps row ids ascending within each value; nulls (-1) sort first
+    row_ids = np.argsort(codes, kind='mergesort')[num_missing:].astype(row_id_dtype)
+    return CategoricalIndex(np.asarray(unique_values, dtype=object), offsets, row_ids, len(series))
+
+
+def build_categorical_indexes(df, field_properties):
+    '''
+    Index arrays for every nominal or ordinal field of df with unique_values
+    '''
+    indexes = {}
+    for fp in field_properties:
+        if fp.get('scale') not in [ Scale.NOMINAL.value, Scale.ORDINAL.value ] or not fp.get('unique_values'):
+            continue
+        if fp['name'] not in df.columns:
+            continue
+        try:
+            index = build_categorical_index(df[fp['name']], fp['unique_values'])
+        except (TypeError, ValueError) as e:
+            logger.debug('Not indexing field %s: %s', fp['name'], e)
+            continue
+        if index is not None:
+            indexes[fp['name']] = index.to_arrays()
+    return indexes
@@ -0,0 +1,144 @@
+'''
+Filesystem stand-in for the boto3 S3 client
+
+Implements the subset of the client API DIVE uses, storing objects under
+<root>/<bucket>/<key>. Errors are raised as botocore ClientErrors with the
+codes S3 returns, so callers handle both clients alike. Set S3_LOCAL_PATH to
+use it for local development and tests.
+'''
+import os
+import shutil
+import hashlib
+from urllib import quote
+
+from botocore.exceptions import ClientError
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class LocalStreamingBody(object):
+    '''
+    Like botocore's StreamingBody: read(amt=None) and close()
+    '''
+    def __init__(self, f, length):
+        self._f = f
+        self._remaining = length
+
+    def read(self, amt=None):
+        if self._remaining <= 0:
+            return b''
+        amt = self._remaining if (amt is None or amt < 0) else min(amt, self._remaining)
+        chunk = self._f.read(amt)
+        self._remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self._f.close()
+
+
+def _not_found(operation_name, key, code='NoSuchKey'):
+    return ClientError({ 'Error': { 'Code': code, 'Message': 'Not Found: %s' % key } }, operation_name)
+
+
+class LocalS3Client(object):
+    def __init__(self, root):
+        self.root = root
+
+    def getObjectPath(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def _etag(self, path):
+        # Cheap stand-in for S3's content MD5: changes whenever the file is rewritten
+        stat = os.stat(path)
+        return '"%s"' % hashlib.md5('%s-%s' % (stat.st_mtime, stat.st_size)).hexdigest()
+
+    def _ensure_parent(self, path):
+        parent = os.path.dirname(path)
+        if not os.path.isdir(parent):
+            os.makedirs(parent)
+
+    def head_object(self, Bucket, Key):
+        path = self.getObjectPath(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _not_found('HeadObject', Key, code='404')
+        return { 'ETag': self._etag(path), 'ContentLength': os.path.getsize(path) }
+
+    def get_object(self, Bucket, Key, Range=None):
+        path = self.getObjectPath(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _not_found('GetObject', Key)
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        if Range:
+            # Only the 'bytes=start-' and 'bytes=start-end' forms
+            start_string, end_string = Range.split('=', 1)[1].split('-', 1)
+            start = int(start_string)
+            if end_string:
+                end = min(int(end_string), size - 1)
+        f = open(path, 'rb')
+        f.seek(start)
+        length = max(0, end - start + 1)
+        return {
+            'Body': LocalStreamingBody(f, length),
+            'ETag': self._etag(path),
+            'ContentLength': length
+        }
+
+    def put_object(self, Bucket, Key, Body):
+        path = self.getObjectPath(Bucket, Key)
+        self._ensure_parent(path)
+        with open(path, 'wb') as f:
+            if hasattr(Body, 'read'):
+                shutil.copyfileobj(Body, f)
+            else:
+                f.write(Body)
+        return { 'ETag': self._etag(path) }
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, Callback=None, Config=None):
+        path = self.getObjectPath(Bucket, Key)
+        self._ensure_parent(path)
+        shutil.copyfile(Filename, path)
+
+    def download_file(self, Bucket, Key, Filename, ExtraArgs=None, Callback=None, Config=None):
+        path = self.getObjectPath(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _not_found('HeadObject', Key, code='404')
+        shutil.copyfile(path, Filename)
+
+    def delete_object(self, Bucket, Key):
+        path = self.getObjectPath(Bucket, Key)
+        if os.path.isfile(path):
+            os.remove(path)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        deleted = []
+        for o in Delete.get('Objects', []):
+            self.delete_object(Bucket=Bucket, Key=o['Key'])
+            deleted.append({ 'Key': o['Key'] })
+        return { 'Deleted': deleted }
+
+    def _list(self, Bucket, Prefix=''):
+        bucket_path = os.path.join(self.root, Bucket)
+        contents = []
+        for directory, dir_names, file_names in os.walk(bucket_path):
+            for file_name in file_names:
+                path = os.path.join(directory, file_name)
+                key = os.path.relpath(path, bucket_path).replace(os.sep, '/')
+                if key.startswith(Prefix or ''):
+                    contents.append({ 'Key': key, 'Size': os.path.getsize(path), 'ETag': self._etag(path) })
+        return sorted(contents, key=lambda o: o['Key'])
+
+    def list_objects(self, Bucket, Prefix=''):
+        return { 'Contents': self._list(Bucket, Prefix) }
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None):
+        contents = self._list(Bucket, Prefix)
+        return { 'Contents': contents, 'KeyCount': len(contents) }
+
+    def generate_presigned_url(self, ClientMethod, Params={}, ExpiresIn=3600):
+        return 'file://%s' % quote(self.getObjectPath(Params.get('Bucket', ''), Params.get('Key', '')))
@@ -0,0 +1,238 @@
+'''
+Byte-offset row index of raw flat files
+
+Records the byte offset at which every Nth data row (after the header) starts,
+so readers can seek close to any row instead of scanning from the top. Row
+ends are found block by block with NumPy, outside of quoted fields per the
+file's dialect. Blank lines are not rows, as for the parser.
+
+Rows are counted as records of the file: lines the parser drops as malformed
+(error_bad_lines=False) still count, so once the file is parsed, an index
+whose row count differs from the parser's is dropped (check_row_index in
+dive.base.data.access).
+'''
+import io
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+ROW_INDEX_INTERVAL = 1000
+ROW_INDEX_SUFFIX = '.rowindex.npz'
+BLOCK_SIZE = 16 * 1024 * 1024
+
+# Multi-byte encodings whose newline bytes can occur inside characters
+UNINDEXABLE_ENCODINGS = [ 'utf-16', 'utf-32', 'utf16', 'utf32' ]
+
+
+def get_row_index_path(path):
+    return path + ROW_INDEX_SUFFIX
+
+
+def is_indexable(encoding):
+    encoding = (encoding or '').lower()
+    return not any(e in encoding for e in UNINDEXABLE_ENCODINGS)
+
+
+class RowIndex(object):
+    def __init__(self, offsets, interval, n_rows, data_offset):
+        self.offsets = offsets
+        self.interval = interval
+        self.n_rows = n_rows
+        self.data_offset = data_offset
+
+    def seek(self, row):
+        '''
+        Returns (byte offset, number of rows to skip from there) to reach row
+        '''
+        row = max(0, min(row, self.n_rows))
+        i = min(row // self.interval, len(self.offsets) - 1)
+        if i < 0:
+            return self.data_offset, 0
+        return int(self.offsets[i]), row - i * self.interval
+
+    def getBoundaries(self, num_parts):
+        '''
+        Up to num_parts (start, end) byte ranges of whole rows covering the data
+        '''
+        if not len(self.offsets):
+            return []
+        step = max(1, int(np.ceil(len(self.offsets) / float(num_parts))))
+        starts = [ int(o) for o in self.offsets[::step] ]
+        return [ (start, (starts[i + 1] if i + 1 < len(starts) else None)) for (i, start) in enumerate(starts) ]
+
+
+def _find_row_ends(block, quotechar, escapechar, delimiter, in_quotes, previous_byte=b''):
+    '''
+    Positions in block of newlines ending rows, and whether block ends inside
+    quotes. previous_byte is the byte before block, empty at the start of the file.
+
+    As for the parser, a quote only opens a quoted field at the start of a field
+    (or right after the quote closing one, as a doubled quote); quotes inside
+    unquoted fields, as in 5" or don't, are literal.
+    '''
+    arr = np.frombuffer(block, dtype=np.uint8)
+    newlines = np.flatnonzero(arr == ord('\n'))
+    if not quotechar:
+        return newlines, in_quotes
+
+    quotes = (arr == ord(quotechar))
+    if escapechar:
+        quotes[1:] &= (arr[:-1] != ord(escapechar))
+        if previous_byte == escapechar:
+            quotes[0] = False
+
+    # A newline is outside quotes if an even number of quotes precede it
+    # (doubled quotes inside fields count twice, so they do not flip the state)
+    quote_counts = np.cumsum(quotes) + int(in_quotes)
+    if _opens_at_field_starts(arr, quotes, quote_counts, quotechar, delimiter, previous_byte):
+        row_ends = newlines[(quote_counts[newlines] % 2) == 0]
+        return row_ends, bool(quote_counts[-1] % 2) if len(quote_counts) else in_quotes
+
+    # Some quote would open a field in its middle: follow the quote state event by event
+    row_ends = []
+    field_start_bytes = _get_field_start_bytes(quotechar, delimiter)
+    for i in np.flatnonzero(quotes | (arr == ord('\n'))).tolist():
+        if arr[i] == ord('\n'):
+            if not in_quotes:
+                row_ends.append(i)
+        elif in_quotes:
+            in_quotes = False
+        else:
+            preceding = arr[i - 1] if i else (ord(previous_byte) if previous_byte else None)
+            in_quotes = (preceding is None) or (preceding in field_start_bytes)
+    return np.array(row_ends, dtype=newlines.dtype), in_quotes
+
+
+def _get_field_start_bytes(quotechar, delimiter):
+    '''
+    Bytes after which a quote opens a quoted field
+    '''
+    delimiter = delimiter if (delimiter and len(delimiter) == 1) else ','
+    return set(ord(c) for c in [ '\n', '\r', quotechar, delimiter ])
+
+
+def _opens_at_field_starts(arr, quotes, quote_counts, quotechar, delimiter, previous_byte):
+    '''
+    Whether every quote that the quote count takes as opening a quoted field
+    follows a delimiter, a line break or another quote
+    '''
+    openings = np.flatnonzero(quotes & ((quote_counts % 2) == 1))
+    if not len(openings):
+        return True
+    preceding = arr[np.maximum(openings - 1, 0)]
+    if openings[0] == 0:
+        if not previous_byte:
+            preceding = preceding[1:]
+        else:
+            preceding = preceding.copy()
+            preceding[0] = ord(previous_byte)
+    return bool(np.in1d(preceding, np.array(list(_get_field_start_bytes(quotechar, delimiter)), dtype=np.uint8)).all())
+
+
+class RowIndexBuilder(object):
+    '''
+    Incremental build_row_index, fed consecutive blocks of a file
+    '''
+    def __init__(self, dialect, offset=0, interval=ROW_INDEX_INTERVAL, start=0):
+        self.quotechar = dialect.get('quotechar')
+        self.escapechar = dialect.get('escapechar')
+        self.delimiter = dialect.get('delimiter')
+        self.header_rows = (offset or 0) + 1
+        self.interval = interval
+
+        self.offsets = []
+        self.n_records = 0
+        self.data_offset = None
+        self.in_quotes = False
+        self.row_start = start
+        self.position = start
+        self.previous_byte = b''
+
+    @property
+    def n_rows(self):
+        '''
+        Data rows ended so far
+        '''
+        return max(0, self.n_records - self.header_rows)
+
+    def update(self, block):
+        if not block:
+            return self
+        position = self.position
+        row_ends, self.in_quotes = _find_row_ends(block, self.quotechar, self.escapechar, self.delimiter, self.in_quotes, self.previous_byte)
+        if len(row_ends):
+            arr = np.frombuffer(block, dtype=np.uint8)
+            ends = row_ends.astype(np.int64) + position
+            starts = np.concatenate([ [ self.row_start ], ends[:-1] + 1 ])
+            lengths = ends - starts
+
+            # Blank lines ('' or a lone '\r') are not rows
+            first_bytes = np.zeros(len(starts), dtype=np.uint8)
+            in_block = starts >= position
+            first_bytes[in_block] = arr[starts[in_block] - position]
+            if not in_block[0] and self.previous_byte:
+                first_bytes[0] = ord(self.previous_byte)
+            records = ~((lengths == 0) | ((lengths == 1) & (first_bytes == ord('\r'))))
+            record_starts = starts[records]
+            record_ends = ends[records]
+
+            record_numbers = self.n_records + np.arange(len(record_starts))
+            data_row_numbers = record_numbers - self.header_rows
+            indexed = (data_row_numbers >= 0) & (data_row_numbers % self.interval == 0)
+            self.offsets.extend(record_starts[indexed].tolist())
+
+            if self.data_offset is None and self.n_records + len(record_starts) >= self.header_rows:
+                self.data_offset = int(record_ends[self.header_rows - self.n_records - 1]) + 1
+
+            self.n_records += len(record_starts)
+            self.row_start = int(ends[-1]) + 1
+        self.position += len(block)
+        self.previous_byte = block[-1:]
+        return self
+
+    def finish(self):
+        # Last row without a trailing newline
+        position, row_start = self.position, self.row_start
+        if position > row_start and not (position - row_start == 1 and self.previous_byte == b'\r'):
+            if self.n_records >= self.header_rows and (self.n_records - self.header_rows) % self.interval == 0:
+                self.offsets.append(row_start)
+            self.n_records += 1
+            self.row_start = position
+
+        data_offset = self.data_offset if self.data_offset is not None else position
+        return RowIndex(np.array(self.offsets, dtype=np.int64), self.interval, self.n_rows, data_offset)
+
+
+def build_row_index(file_obj, dialect, offset=0, interval=ROW_INDEX_INTERVAL, block_size=BLOCK_SIZE):
+    '''
+    Scan a binary file object from its current position. offset is the number
+    of lines before the header, as for the parser's skiprows.
+    '''
+    builder = RowIndexBuilder(dialect, offset=offset, interval=interval, start=file_obj.tell())
+    while True:
+        block = file_obj.read(block_size)
+        if not block:
+            break
+        builder.update(block)
+    return builder.finish()
+
+
+def write_row_index(row_index, f):
+    np.savez(f,
+        offsets=row_index.offsets,
+        meta=np.array([ row_index.interval, row_index.n_rows, row_index.data_offset ], dtype=np.int64)
+    )
+
+
+def read_row_index(f):
+    with np.load(f) as npz:
+        interval, n_rows, data_offset = [ int(v) for v in npz['meta'] ]
+        return RowIndex(npz['offsets'], interval, n_rows, data_offset)
+
+
+def row_index_to_bytes(row_index):
+    buf = io.BytesIO()
+    write_row_index(row_index, buf)
+    return buf.getvalue()
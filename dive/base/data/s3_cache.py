@@ -0,0 +1,173 @@
+'''
+Host-wide on-disk cache of S3 objects
+
+Raw files are downloaded once per host under S3_CACHE_PATH and revalidated
+against the object's ETag with a HEAD request, so repeated loads of a dataset
+read a local file instead of streaming the whole object again. Entries are
+evicted least recently used first once the cache exceeds S3_CACHE_MAX_BYTES.
+A per-key file lock makes concurrent misses wait on the first download.
+'''
+import os
+import fcntl
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+from dive.base.data.columnar import ensure_directory
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+ETAG_SUFFIX = '.etag'
+LOCK_SUFFIX = '.lock'
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class s3ObjectCache(object):
+
+    def __init__(self, cache_path=None, max_bytes=None):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, cache_path=None, max_bytes=None):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        if self.cache_path:
+            ensure_directory(self.cache_path)
+
+    @property
+    def enabled(self):
+        return bool(self.cache_path)
+
+    def _path(self, bucket, key):
+        # Hashed names keep keys with slashes or odd characters flat and collision-free
+        name = hashlib.md5(('%s/%s' % (bucket, key)).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_path, name)
+
+    def _read_etag(self, path):
+        try:
+            with open(path + ETAG_SUFFIX) as f:
+                return f.read().strip()
+        except IOError:
+            return None
+
+    @contextmanager
+    def _lock(self, path):
+        with open(path + LOCK_SUFFIX, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def getValidPath(self, client, bucket, key):
+        '''
+        Local path of the object if a copy matching its current ETag is cached, else None
+        '''
+        if not self.enabled:
+            return None
+        path = self._path(bucket, key)
+        if not os.path.isfile(path):
+            return None
+        etag = client.head_object(Bucket=bucket, Key=key)['ETag']
+        if self._read_etag(path) != etag:
+            return None
+        os.utime(path, None)
+        self.hits += 1
+        return path
+
+    def getPath(self, client, bucket, key):
+        '''
+        Local path of an up-to-date copy of the object, downloading it on a
+        miss. Raises ClientError if the object does not exist.
+        '''
+        path = self._path(bucket, key)
+        with self._lock(path):
+            etag = client.head_object(Bucket=bucket, Key=key)['ETag']
+            if os.path.isfile(path) and self._read_etag(path) == etag:
+                os.utime(path, None)
+                self.hits += 1
+                return path
+
+            self.misses += 1
+            response = client.get_object(Bucket=bucket, Key=key)
+            body = response['Body']
+            try:
+                self._write(path, body, response.get('ETag', etag))
+            finally:
+                body.close()
+        self._evict(keep=path)
+        return path
+
+    def putFileobj(self, bucket, key, fileobj, etag):
+        '''
+        Write through an object just uploaded, so the first read skips the download
+        '''
+        if not self.enabled:
+            return
+        path = self._path(bucket, key)
+        try:
+            with self._lock(path):
+                self._write(path, fileobj, etag)
+        except (IOError, OSError) as e:
+            logger.error('Error caching S3 object %s: %s', key, e, exc_info=True)
+            return
+        self._evict(keep=path)
+
+    def _write(self, path, fileobj, etag):
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=self.cache_path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = fileobj.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with open(path + ETAG_SUFFIX, 'w') as f:
+            f.write(etag)
+
+    def removeObject(self, bucket, key):
+        if not self.enabled:
+            return
+        self._remove_path(self._path(bucket, key))
+
+    def _remove_path(self, path):
+        for p in [ path, path + ETAG_SUFFIX ]:
+            if os.path.isfile(p):
+                os.remove(p)
+
+    def _evict(self, keep=None):
+        if not self.max_bytes:
+            return
+        entries = []
+        for name in os.listdir(self.cache_path):
+            if name.startswith('.') or name.endswith(ETAG_SUFFIX) or name.endswith(LOCK_SUFFIX):
+                continue
+            path = os.path.join(self.cache_path, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_bytes = sum(size for (mtime, size, path) in entries)
+        for (mtime, size, path) in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            with self._lock(path):
+                self._remove_path(path)
+            total_bytes -= size
+            self.evictions += 1
+
+S3Cache = s3ObjectCache()
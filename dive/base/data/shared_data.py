@@ -0,0 +1,98 @@
+'''
+Host-wide cache of parsed datasets, shared across processes
+
+Parsed frames are written in the columnar format under DATASET_CACHE_PATH,
+keyed by dataset_id and a content version, so every Celery child and gunicorn
+worker on a node reuses a single parse. A per-key file lock makes concurrent
+misses wait on the first parse instead of repeating it.
+'''
+import os
+import fcntl
+import shutil
+from contextlib import contextmanager
+
+from dive.base.data.columnar import has_columnar, read_columnar, write_columnar, replace_directory, ensure_directory
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class sharedData(object):
+
+    def __init__(self, cache_path=None):
+        self.cache_path = cache_path
+
+    def configure(self, cache_path=None):
+        self.cache_path = cache_path
+        if self.cache_path:
+            ensure_directory(self.cache_path)
+
+    @property
+    def enabled(self):
+        return bool(self.cache_path)
+
+    def _dataset_path(self, dataset_id):
+        return os.path.join(self.cache_path, str(dataset_id))
+
+    def _path(self, dataset_id, version):
+        return os.path.join(self._dataset_path(dataset_id), str(version))
+
+    def hasData(self, dataset_id, version):
+        return self.enabled and has_columnar(self._path(dataset_id, version))
+
+    def getPath(self, dataset_id, version):
+        return self._path(dataset_id, version)
+
+    def getData(self, dataset_id, version, columns=None):
+        return read_columnar(self._path(dataset_id, version), columns=columns)
+
+    def insertData(self, dataset_id, version, df):
+        if not self.enabled:
+            return
+        try:
+            write_columnar(df, self._path(dataset_id, version))
+        except (IOError, OSError) as e:
+            logger.error('Error writing dataset %s to shared cache: %s', dataset_id, e, exc_info=True)
+            return
+        self._remove_other_versions(dataset_id, version)
+
+    def insertDirectory(self, dataset_id, version, directory):
+        '''
+        Move an already-written columnar directory into the cache
+        '''
+        if not self.enabled:
+            return
+        ensure_directory(self._dataset_path(dataset_id))
+        replace_directory(directory, self._path(dataset_id, version))
+        self._remove_other_versions(dataset_id, version)
+
+    def removeData(self, dataset_id):
+        if not self.enabled:
+            return
+        shutil.rmtree(self._dataset_path(dataset_id), ignore_errors=True)
+
+    @contextmanager
+    def lock(self, dataset_id, version):
+        '''
+        Exclusive per-(dataset, version) lock across processes on this host
+        '''
+        if not self.enabled:
+            yield
+            return
+        dataset_path = self._dataset_path(dataset_id)
+        ensure_directory(dataset_path)
+        with open(os.path.join(dataset_path, '.%s.lock' % version), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remove_other_versions(self, dataset_id, version):
+        dataset_path = self._dataset_path(dataset_id)
+        for name in os.listdir(dataset_path):
+            if name.startswith('.') or name == str(version):
+                continue
+            shutil.rmtree(os.path.join(dataset_path, name), ignore_errors=True)
+
+SharedData = sharedData()
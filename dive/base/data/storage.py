@@ -0,0 +1,361 @@
+'''
+Storage backends of raw dataset files
+
+A dataset's storage_type selects the backend holding its raw file: 'file'
+(a directory on this host), 's3' (a bucket, read through the local S3 cache),
+or 'local' (a directory laid out like a bucket, standing in for S3 in
+development and tests). Files derived from a raw file, like its row index and
+columnar snapshot, are addressed by a suffix of its name.
+'''
+import io
+import os
+import shutil
+import tempfile
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+from dive.base.data.s3_cache import S3Cache
+from dive.base.data.local_s3 import LocalS3Client
+from dive.base.data.columnar import ensure_directory, replace_directory
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+PART_SIZE = 8 * 1024 * 1024
+PREFETCH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def is_not_found(e):
+    return e.response['Error']['Code'] in [ 'NoSuchKey', '404' ]
+
+
+def _open_path(path, byte_range=None):
+    if not byte_range:
+        return path
+    start, end = byte_range
+    f = open(path, 'rb')
+    f.seek(start)
+    if end is None:
+        return f
+    with f:
+        return io.BytesIO(f.read(end - start))
+
+
+class StorageBackend(object):
+    storage_type = None
+
+    # Whether files are read in place rather than through local copies
+    is_local = False
+
+    def getPath(self, project_id, file_name):
+        '''
+        Location recorded on a new dataset stored as file_name
+        '''
+        raise NotImplementedError
+
+    def exists(self, project_id, file_name):
+        raise NotImplementedError
+
+    def save(self, project_id, file_name, file_obj):
+        '''
+        Write file_obj from its current position, part by part
+        '''
+        raise NotImplementedError
+
+    def open(self, dataset, project_id, suffix='', byte_range=None):
+        '''
+        Path or file object to read a dataset's file from. byte_range (start,
+        end) restricts it to those bytes, and end may be None. Ranged reads
+        return file objects for the caller to close.
+        '''
+        raise NotImplementedError
+
+    def read(self, dataset, project_id, suffix=''):
+        '''
+        Content of a small file of a dataset, or None if it does not exist
+        '''
+        raise NotImplementedError
+
+    def getLocalPath(self, dataset, project_id, suffix='', download=True):
+        '''
+        Path of a local copy of a dataset's file, or None if there is none
+        (or, unless download is set, none yet)
+        '''
+        raise NotImplementedError
+
+    def saveDirectory(self, dataset, project_id, suffix, directory):
+        '''
+        Store the files of a local directory, which the backend may move
+        '''
+        raise NotImplementedError
+
+    def getDirectory(self, dataset, project_id, suffix, file_names, destination):
+        '''
+        Copy file_names of a saved directory into destination
+        '''
+        raise NotImplementedError
+
+    def delete(self, dataset, project_id, suffix=''):
+        raise NotImplementedError
+
+    def deleteDirectory(self, dataset, project_id, suffix):
+        raise NotImplementedError
+
+    def createProject(self, project_id):
+        pass
+
+    def deleteProject(self, project_id):
+        raise NotImplementedError
+
+    def prefetch(self, dataset, project_id):
+        '''
+        Make the raw file cheap to read soon. Called off the request path.
+        '''
+        pass
+
+
+class FileStorage(StorageBackend):
+    storage_type = 'file'
+    is_local = True
+
+    def __init__(self, storage_path, part_size=PART_SIZE):
+        self.storage_path = storage_path
+        self.part_size = part_size
+
+    def _project_path(self, project_id):
+        return os.path.join(self.storage_path, str(project_id))
+
+    def _path(self, dataset, suffix=''):
+        return dataset['path'] + suffix
+
+    def getPath(self, project_id, file_name):
+        return os.path.join(self._project_path(project_id), file_name)
+
+    def exists(self, project_id, file_name):
+        return os.path.exists(self.getPath(project_id, file_name))
+
+    def save(self, project_id, file_name, file_obj):
+        path = self.getPath(project_id, file_name)
+        ensure_directory(os.path.dirname(path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(file_obj, f, self.part_size)
+            os.rename(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return path
+
+    def open(self, dataset, project_id, suffix='', byte_range=None):
+        return _open_path(self._path(dataset, suffix), byte_range=byte_range)
+
+    def read(self, dataset, project_id, suffix=''):
+        path = self._path(dataset, suffix)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def getLocalPath(self, dataset, project_id, suffix='', download=True):
+        path = self._path(dataset, suffix)
+        return path if os.path.exists(path) else None
+
+    def saveDirectory(self, dataset, project_id, suffix, directory):
+        # Moved next to the destination first, so the final rename stays on one filesystem
+        path = self._path(dataset, suffix)
+        tmp_directory = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(path))
+        os.rmdir(tmp_directory)
+        shutil.move(directory, tmp_directory)
+        replace_directory(tmp_directory, path)
+
+    def getDirectory(self, dataset, project_id, suffix, file_names, destination):
+        path = self._path(dataset, suffix)
+        for file_name in file_names:
+            shutil.copyfile(os.path.join(path, file_name), os.path.join(destination, file_name))
+
+    def delete(self, dataset, project_id, suffix=''):
+        path = self._path(dataset, suffix)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def deleteDirectory(self, dataset, project_id, suffix):
+        shutil.rmtree(self._path(dataset, suffix), ignore_errors=True)
+
+    def createProject(self, project_id):
+        ensure_directory(self._project_path(project_id))
+
+    def deleteProject(self, project_id):
+        shutil.rmtree(self._project_path(project_id), ignore_errors=True)
+
+    def prefetch(self, dataset, project_id):
+        # Reading the file once pulls it into the page cache
+        with open(self._path(dataset), 'rb') as f:
+            while f.read(PREFETCH_BLOCK_SIZE):
+                pass
+
+
+class S3Storage(StorageBackend):
+    '''
+    Objects keyed <project_id>/<file_name> in a bucket (-1/<file_name> for
+    preloaded datasets). Full reads go through the host's S3 cache; ranged
+    reads of objects not cached yet are ranged GETs.
+    '''
+    storage_type = 's3'
+
+    def __init__(self, client, bucket, cache=S3Cache, part_size=PART_SIZE):
+        self.client = client
+        self.bucket = bucket
+        self.cache = cache
+        self.transfer_config = TransferConfig(multipart_threshold=part_size, multipart_chunksize=part_size)
+
+    def _key(self, dataset, project_id, suffix=''):
+        if dataset['preloaded']:
+            return '-1/%s%s' % (dataset['file_name'], suffix)
+        return '%s/%s%s' % (project_id, dataset['file_name'], suffix)
+
+    def _new_key(self, project_id, file_name):
+        return '%s/%s' % (project_id, file_name)
+
+    def getPath(self, project_id, file_name):
+        return 'https://s3.amazonaws.com/%s/%s' % (self.bucket, self._new_key(project_id, file_name))
+
+    def exists(self, project_id, file_name):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._new_key(project_id, file_name))
+        except ClientError as e:
+            if is_not_found(e):
+                return False
+            raise
+        return True
+
+    def save(self, project_id, file_name, file_obj):
+        key = self._new_key(project_id, file_name)
+        start = file_obj.tell()
+        self.client.upload_fileobj(file_obj, self.bucket, key, Config=self.transfer_config)
+
+        # Write through to the cache, so the first read of a new upload skips the download
+        if self.cache.enabled:
+            file_obj.seek(start)
+            self.cache.putFileobj(self.bucket, key, file_obj, self.client.head_object(Bucket=self.bucket, Key=key)['ETag'])
+        return self.getPath(project_id, file_name)
+
+    def open(self, dataset, project_id, suffix='', byte_range=None):
+        local_path = self.getLocalPath(dataset, project_id, suffix=suffix, download=not byte_range)
+        if local_path:
+            return _open_path(local_path, byte_range=byte_range)
+
+        kwargs = {}
+        if byte_range:
+            start, end = byte_range
+            kwargs['Range'] = 'bytes=%s-%s' % (start, '' if end is None else end - 1)
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(dataset, project_id, suffix), **kwargs)['Body']
+
+    def read(self, dataset, project_id, suffix=''):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(dataset, project_id, suffix))['Body'].read()
+        except ClientError as e:
+            if is_not_found(e):
+                return None
+            raise
+
+    def getLocalPath(self, dataset, project_id, suffix='', download=True):
+        if not self.cache.enabled:
+            return None
+        key = self._key(dataset, project_id, suffix)
+        try:
+            if download:
+                return self.cache.getPath(self.client, self.bucket, key)
+            return self.cache.getValidPath(self.client, self.bucket, key)
+        except ClientError as e:
+            if is_not_found(e):
+                return None
+            raise
+
+    def saveDirectory(self, dataset, project_id, suffix, directory):
+        prefix = self._key(dataset, project_id, suffix)
+        for file_name in os.listdir(directory):
+            self.client.upload_file(os.path.join(directory, file_name), self.bucket, '%s/%s' % (prefix, file_name), Config=self.transfer_config)
+
+    def getDirectory(self, dataset, project_id, suffix, file_names, destination):
+        prefix = self._key(dataset, project_id, suffix)
+        for file_name in file_names:
+            self.client.download_file(self.bucket, '%s/%s' % (prefix, file_name), os.path.join(destination, file_name))
+
+    def delete(self, dataset, project_id, suffix=''):
+        key = self._key(dataset, project_id, suffix)
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+        self.cache.removeObject(self.bucket, key)
+
+    def _delete_prefix(self, prefix):
+        kwargs = { 'Bucket': self.bucket, 'Prefix': prefix }
+        while True:
+            listing = self.client.list_objects_v2(**kwargs)
+            keys = [ { 'Key': o['Key'] } for o in listing.get('Contents', []) ]
+            if keys:
+                self.client.delete_objects(Bucket=self.bucket, Delete={ 'Objects': keys })
+                for key in keys:
+                    self.cache.removeObject(self.bucket, key['Key'])
+            if not listing.get('IsTruncated'):
+                break
+            kwargs['ContinuationToken'] = listing['NextContinuationToken']
+
+    def deleteDirectory(self, dataset, project_id, suffix):
+        self._delete_prefix('%s/' % self._key(dataset, project_id, suffix))
+
+    def deleteProject(self, project_id):
+        self._delete_prefix('%s/' % project_id)
+
+    def prefetch(self, dataset, project_id):
+        self.getLocalPath(dataset, project_id)
+
+
+class LocalS3Storage(S3Storage):
+    '''
+    S3Storage over a directory, through LocalS3Client
+    '''
+    storage_type = 'local'
+
+    def __init__(self, root, bucket, **kwargs):
+        super(LocalS3Storage, self).__init__(LocalS3Client(root), bucket, **kwargs)
+
+    def getPath(self, project_id, file_name):
+        return self.client.getObjectPath(self.bucket, self._new_key(project_id, file_name))
+
+
+class storageBackends(object):
+    '''
+    Backends by storage_type, built from the app config
+    '''
+    def __init__(self):
+        self.backends = {}
+        self.default_storage_type = None
+
+    def configure(self, config, s3_client=None):
+        self.default_storage_type = config['STORAGE_TYPE']
+        self.backends = {
+            'file': FileStorage(config['STORAGE_PATH'], part_size=config.get('STORAGE_PART_SIZE', PART_SIZE))
+        }
+        if s3_client is not None:
+            self.backends['s3'] = S3Storage(s3_client, config['AWS_DATA_BUCKET'], part_size=config.get('STORAGE_PART_SIZE', PART_SIZE))
+        if config.get('S3_LOCAL_PATH'):
+            self.backends['local'] = LocalS3Storage(config['S3_LOCAL_PATH'], config.get('AWS_DATA_BUCKET') or 'dive', part_size=config.get('STORAGE_PART_SIZE', PART_SIZE))
+
+    def get(self, storage_type=None):
+        storage_type = storage_type or self.default_storage_type
+        try:
+            return self.backends[storage_type]
+        except KeyError:
+            raise ValueError('No storage backend configured for storage type %s' % storage_type)
+
+Storage = storageBackends()
+
+
+def get_storage(dataset=None):
+    '''
+    Backend holding dataset, or new files if dataset is None
+    '''
+    return Storage.get(dataset['storage_type'] if dataset else None)
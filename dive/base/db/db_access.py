@@ -6,7 +6,9 @@ Mainly used to separate session management from models, and to provide uniform
 db interfaces to both the API and compute layers.
 '''
 
+from datetime import datetime
 from flask import abort
+from sqlalchemy import func
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 
 from dive.base.core import db
@@ -83,6 +85,37 @@ def get_dataset(project_id, dataset_id):
         logger.error(e)
         raise e
 
+def get_dataset_version(dataset_id):
+    result = db.session.query(Dataset.version).filter_by(id=dataset_id).first()
+    return result[0] if result else None
+
+def increment_dataset_version(dataset_id):
+    dataset = Dataset.query.filter_by(id=dataset_id).one()
+    dataset.version = (dataset.version or 0) + 1
+    db.session.commit()
+    return dataset.version
+
+def record_dataset_access(dataset_id):
+    # Outside the session, so callers' pending changes are not committed with it
+    db.engine.execute(Dataset.__table__.update()
+        .where(Dataset.id == dataset_id)
+        .values(
+            access_count=func.coalesce(Dataset.access_count, 0) + 1,
+            last_accessed=datetime.utcnow()
+        )
+    )
+
+def get_hot_datasets(limit, order_by='frequency'):
+    '''
+    Most frequently (or recently) accessed datasets, preloaded ones first among ties
+    '''
+    if order_by == 'recency':
+        order = Dataset.last_accessed.desc().nullslast()
+    else:
+        order = Dataset.access_count.desc().nullslast()
+    datasets = Dataset.query.order_by(order, Dataset.preloaded.desc(), Dataset.id).limit(limit).all()
+    return [ row_to_dict(dataset) for dataset in datasets ]
+
 def get_datasets(project_id, include_preloaded=True, **kwargs):
     datasets = Dataset.query.filter_by(project_id=project_id, **kwargs).all()
 
@@ -278,6 +311,10 @@ def update_field_properties_type_by_id(project_id, field_id, field_type, general
         'type': True
     })
 
+    # Cached frames were coerced with the old type
+    dataset = field_properties.dataset
+    dataset.version = (dataset.version or 0) + 1
+
     db.session.commit()
     return row_to_dict(field_properties)
 
@@ -98,13 +98,26 @@ class Dataset(db.Model):
     offset = Column(Integer)
     dialect = Column(JSONB)
     encoding = Column(Unicode(250))
+    encoding_confidence = Column(Float)
+    encoding_detection_time = Column(Float)  # Seconds
     path = Column(Unicode(250))
     file_name = Column(Unicode(250))
     type = Column(Unicode(250))
     orig_type = Column(Unicode(250))
+    compression = Column(Unicode(10))  # Of the raw file: gzip, bz2, xz, zip or null
     tags = Column(JSONB)
     info_url = Column(Unicode(250))
 
+    # Tokens parsed as missing values, DEFAULT_NA_VALUES if null
+    na_values = Column(JSONB)
+
+    # Incremented whenever cached representations of the data become stale
+    version = Column(Integer, default=1)
+
+    # Access counters, ranking the datasets workers warm up on start
+    access_count = Column(Integer, default=0)
+    last_accessed = Column(DateTime)
+
     # One-to-one with dataset_properties
     dataset_properties = relationship('Dataset_Properties',
         uselist=False,
@@ -148,6 +161,7 @@ class Dataset_Properties(db.Model):
     field_accessors = Column(JSONB)
     structure = Enum(['wide', 'long'])
     is_time_series = Column(Boolean())
+    na_values = Column(JSONB)
 
     dataset_id = Column(Integer, ForeignKey('dataset.id',
         onupdate='CASCADE', ondelete='CASCADE'), index=True)
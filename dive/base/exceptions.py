@@ -1,2 +1,6 @@
 class UploadTooLargeException(Exception):
     pass
+
+
+class UnsupportedFileTypeException(Exception):
+    pass
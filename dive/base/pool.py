@@ -0,0 +1,17 @@
+'''
+Process pools for work split across cores within a request or task
+'''
+from multiprocessing import Pool, current_process
+import billiard
+
+
+def get_pool(num_processes):
+    '''
+    Pool of num_processes processes, which fork from the caller and so share
+    its memory pages at the time of the call
+    '''
+    # Celery prefork children are daemonic, and multiprocessing will not fork
+    # from them; billiard (Celery's fork of multiprocessing) will
+    if current_process().daemon:
+        return billiard.Pool(num_processes)
+    return Pool(num_processes)
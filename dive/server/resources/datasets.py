@@ -10,21 +10,30 @@ from celery import chain
 
 from dive.base.db import db_access
 from dive.base.db.accounts import load_account, project_auth
-from dive.base.exceptions import UploadTooLargeException
 from dive.base.serialization import jsonify
 from dive.base.data.access import get_dataset_sample, delete_dataset
-from dive.worker.pipelines import full_pipeline, ingestion_pipeline, get_chain_IDs
-from dive.worker.ingestion.upload import upload_file
+from dive.base.data.compression import get_compression
+from dive.worker.pipelines import full_pipeline, ingestion_pipeline, upload_pipeline, get_chain_IDs
+from dive.worker.ingestion.upload import spool_upload, ALLOWED_EXTENSIONS
 from dive.worker.handlers import worker_error_handler
 
 import logging
 logger = logging.getLogger(__name__)
 
-ALLOWED_EXTENSIONS = set(['txt', 'csv', 'tsv', 'xlsx', 'xls', 'json'])
-
 
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1] in ALLOWED_EXTENSIONS
+    '''
+    Compressed files must hold an allowed file, except zip archives, whose
+    contents are only known once opened
+    '''
+    if '.' not in filename:
+        return False
+    compression, uncompressed_filename = get_compression(filename)
+    if compression == 'zip':
+        return True
+    if compression:
+        return allowed_file(uncompressed_filename)
+    return filename.rsplit('.', 1)[1] in ALLOWED_EXTENSIONS
 
 
 # File upload handler
@@ -32,35 +41,31 @@ uploadFileParser = reqparse.RequestParser()
 uploadFileParser.add_argument('project_id', type=int, required=True, location='json')
 class UploadFile(Resource):
     '''
-    1) Saves file
-    2) Triggers data ingestion tasks
-    3) Returns dataset_id
+    1) Spools file
+    2) Triggers saving and data ingestion tasks
+    3) Returns task_id
+
+    Files over the row or column limits, or of unsupported types, fail the
+    task, whose result then has status 413 or 415 and the reason as error
     '''
     def post(self):
         form_data = json.loads(request.form.get('data'))
         project_id = form_data.get('project_id')
+        na_values = form_data.get('na_values')
         file_obj = request.files.get('file')
 
         if file_obj and allowed_file(file_obj.filename):
-
-            # Get dataset_ids corresponding to file if successful upload
+            spooled_path = spool_upload(file_obj)
             try:
-                datasets = upload_file(project_id, file_obj)
-            except UploadTooLargeException as e:
-                return jsonify({
-                    'status': 'error',
-                    'message': str(e)
-                }, status=413)
-            result = {
-                'status': 'success',
-                'datasets': datasets
-            }
-            for dataset in datasets:
-                ingestion_task = ingestion_pipeline.apply_async(
-                    args=[ dataset['id'], project_id ]
+                upload_task = upload_pipeline.apply_async(
+                    args=[ spooled_path, file_obj.filename, project_id ],
+                    kwargs={ 'na_values': na_values }
                 )
+            except Exception:
+                os.remove(spooled_path)
+                raise
             return jsonify({
-                'task_id': ingestion_task.task_id
+                'task_id': upload_task.task_id
                 }, status=202)
         return jsonify({'status': 'Upload failed'})
 
@@ -168,6 +173,8 @@ class DeselectPreloadedDataset(Resource):
 # Dataset retrieval, editing, deletion
 datasetGetParser = reqparse.RequestParser()
 datasetGetParser.add_argument('project_id', type=int, required=True)
+datasetGetParser.add_argument('start', type=int, required=False, default=0)
+datasetGetParser.add_argument('inc', type=int, required=False, default=100)
 
 datasetDeleteParser = reqparse.RequestParser()
 datasetDeleteParser.add_argument('project_id', type=int, required=True)
@@ -179,7 +186,7 @@ class Dataset(Resource):
         project_id = args.get('project_id')
 
         dataset = db_access.get_dataset(project_id, dataset_id)
-        sample = get_dataset_sample(dataset_id, project_id)
+        sample = get_dataset_sample(dataset_id, project_id, start=args.get('start'), inc=args.get('inc'))
 
         response = {
             'id': dataset_id,
@@ -8,7 +8,7 @@ from flask_restful import Resource, reqparse
 from flask_login import login_required
 
 from dive.base.db import db_access
-from dive.base.data.access import get_data
+from dive.base.data.access import get_data, invalidate_dataset_cache
 from dive.worker.ingestion.field_properties import compute_single_field_property_nontype
 from dive.base.constants import quantitative_types, categorical_types, temporal_types, specific_type_to_general_type
 from dive.base.serialization import jsonify
@@ -42,12 +42,13 @@ class Field(Resource):
 
             field_property = db_access.get_field_property(project_id, dataset_id, field_id)
             field_name = field_property['name']
-            df = get_data(project_id=project_id, dataset_id=dataset_id)
+            df = get_data(project_id=project_id, dataset_id=dataset_id, columns=[field_name])
 
             updated_properties = compute_single_field_property_nontype(field_name, df[field_name], field_type, general_type)
 
             field_property_document = \
                 db_access.update_field_properties_type_by_id(project_id, field_id, field_type, general_type, updated_properties)
+            invalidate_dataset_cache(dataset_id)
 
         if field_is_id != None:
             field_property_document = \
@@ -1,12 +1,9 @@
-import os
-import shutil
-import boto3
 
 from flask import make_response, current_app
 from flask_restful import Resource, reqparse, marshal_with
 from flask_login import login_required
 
-from dive.base.core import s3_client
+from dive.base.data.storage import get_storage
 from dive.base.db import db_access
 from dive.base.db.accounts import load_account, project_auth
 from dive.base.serialization import jsonify
@@ -47,23 +44,7 @@ class Project(Resource):
     def delete(self, project_id):
         result = db_access.delete_project(project_id)
 
-        if current_app.config['STORAGE_TYPE'] == 'file':
-            project_dir = os.path.join(current_app.config['STORAGE_PATH'], str(result['id']))
-            if os.path.isdir(project_dir):
-                shutil.rmtree(project_dir)
-        elif current_app.config['STORAGE_TYPE'] == 's3':
-            bucket_objects = s3_client.list_objects(
-                Bucket=current_app.config['AWS_DATA_BUCKET'],
-                Prefix="%s/" % (project_id)
-            )
-            if bucket_objects.get('Contents'):
-                file_objects = [ { 'Key': obj['Key'] } for obj in bucket_objects['Contents']]
-                s3_delete_objects_result = s3_client.delete_objects(
-                    Bucket=current_app.config['AWS_DATA_BUCKET'],
-                    Delete={
-                        'Objects': file_objects
-                    }
-                )
+        get_storage().deleteProject(result['id'])
 
         return jsonify({
             "message": "Successfully deleted project.",
@@ -132,9 +113,6 @@ class Projects(Resource):
         new_project_id = result['id']
         db_access.create_document(new_project_id)
 
-        if current_app.config['STORAGE_TYPE'] == 'file':
-            project_dir = os.path.join(current_app.config['STORAGE_PATH'], str(result['id']))
-            if not os.path.isdir(project_dir):
-                os.mkdir(project_dir)
+        get_storage().createProject(result['id'])
 
         return jsonify(result)
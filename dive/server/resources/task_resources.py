@@ -35,6 +35,12 @@ task_state_to_code = {
     states.REVOKED: 500
 }
 
+# Failures caused by the uploaded file rather than by the server
+error_type_to_code = {
+    'UploadTooLargeException': 413,
+    'UnsupportedFileTypeException': 415
+}
+
 class TaskResult(Resource):
     def get(self, task_id):
         task = celery.AsyncResult(task_id)  # task_2 = AsyncResult(id=task_id, app=celery)
@@ -43,6 +49,7 @@ class TaskResult(Resource):
         result = {
             'state': state
         }
+        error_type = None
 
         if (state == states.PENDING):
             try:
@@ -60,9 +67,13 @@ class TaskResult(Resource):
                 error_type = type(info).__name__
                 error_message = '%s: %s' % (error_type, str(info))
             else:
-                error_type = None
                 error_message = 'Unknown error occurred'
             result['error'] = error_message
 
-        response = jsonify(result, status=task_state_to_code[state])
+        status = task_state_to_code[state]
+        if error_type in error_type_to_code:
+            result['message'] = str(info)
+            status = error_type_to_code[error_type]
+
+        response = jsonify(result, status=status)
         return response
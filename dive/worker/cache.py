@@ -0,0 +1,32 @@
+'''
+Remote control commands for keeping dataset caches consistent across workers
+'''
+from celery.worker.control import control_command
+
+from dive.worker.core import celery
+from dive.base.data.in_memory_data import InMemoryData as IMD
+from dive.base.data.shared_data import SharedData
+from dive.base.data.conditionals import ConditionalMasks
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+@control_command(args=[('dataset_id', int)], signature='<dataset_id>')
+def invalidate_dataset(state, dataset_id):
+    '''
+    Runs in the main process of every worker. Clears the host cache; pool
+    children notice the version change on their next get_data.
+    '''
+    logger.info('Invalidating cached frames of dataset %s', dataset_id)
+    IMD.removeData(dataset_id)
+    SharedData.removeData(dataset_id)
+    ConditionalMasks.removeDataset(dataset_id)
+    return { 'ok': 'invalidated dataset %s' % dataset_id }
+
+
+def broadcast_invalidate_dataset(dataset_id):
+    try:
+        celery.control.broadcast('invalidate_dataset', arguments={ 'dataset_id': dataset_id })
+    except Exception as e:
+        logger.error('Error broadcasting invalidation of dataset %s: %s', dataset_id, e, exc_info=True)
@@ -75,9 +75,13 @@ def format_bin_edges_list(bin_edges_list, precision, general_type=GDT.Q.value):
     }
 
 
-def get_num_bins(v, procedure='freedman', default_num_bins=10):
+def get_num_bins(v, procedure='freedman', default_num_bins=10, n=None):
+    '''
+    n defaults to len(v); pass it when v is a sample of a larger column
+    '''
     v = v.astype(float, raise_on_error=False)
-    n = len(v)
+    if n is None:
+        n = len(v)
     min_v = min(v)
     max_v = max(v)
 
@@ -5,7 +5,7 @@ import pandas as pd
 
 from dive.base.db import db_access
 from dive.worker.core import celery, task_app
-from dive.base.data.access import get_data
+from dive.base.data.access import get_data, get_na_values, check_row_index
 from dive.base.data.in_memory_data import InMemoryData as IMD
 from dive.worker.ingestion.type_detection import calculate_field_type, detect_time_series
 
@@ -18,12 +18,13 @@ def compute_dataset_properties(dataset_id, project_id, path=None):
     ''' Compute and return dictionary containing whole
     import pandas as pd-dataset properties '''
 
+    dataset = db_access.get_dataset(project_id, dataset_id)
     if not path:
-        dataset = db_access.get_dataset(project_id, dataset_id)
         path = dataset['path']
         df = get_data(project_id=project_id, dataset_id=dataset_id)
 
     n_rows, n_cols = df.shape
+    check_row_index(dataset, project_id, n_rows)
     field_names = df.columns.values.tolist()
 
     # field_types = []
@@ -49,6 +50,7 @@ def compute_dataset_properties(dataset_id, project_id, path=None):
         'field_accessors': [ i for i in range(0, n_cols) ],
         'structure': structure,
         'is_time_series': time_series,
+        'na_values': get_na_values(dataset),
     }
 
     return {
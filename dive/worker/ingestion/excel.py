@@ -0,0 +1,108 @@
+'''
+Conversion of Excel workbooks into one CSV file per sheet
+
+.xlsx workbooks are read with openpyxl in read-only mode, which streams rows
+out of the sheet XML rather than loading the workbook; .xls workbooks are
+opened on demand with xlrd, loading only the converted sheet. The workbook
+(with its shared strings) is opened once, then sheets are converted in
+parallel by processes forked from the opener, one per sheet, and rows are
+written in batches.
+'''
+import os
+from multiprocessing import cpu_count
+
+import xlrd
+from openpyxl import load_workbook
+
+from dive.base.pool import get_pool
+from dive.worker.ingestion.utilities import write_csv_rows
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def open_workbook(workbook_path, file_type):
+    if file_type == 'xlsx':
+        return load_workbook(workbook_path, read_only=True, data_only=True)
+    return xlrd.open_workbook(workbook_path, on_demand=True)
+
+
+def close_workbook(workbook, file_type):
+    if file_type != 'xlsx':
+        workbook.release_resources()
+
+
+def _iter_xlsx_rows(workbook, sheet_name):
+    # Read-only worksheets open their XML from the archive by file name, so
+    # forked workers do not share a file offset
+    for row in workbook[sheet_name].rows:
+        yield [ cell.value for cell in row ]
+
+
+def _iter_xls_rows(book, sheet_name):
+    sheet = book.sheet_by_name(sheet_name)
+    try:
+        for rn in xrange(sheet.nrows):
+            yield sheet.row_values(rn)
+    finally:
+        book.unload_sheet(sheet_name)
+
+
+# Workbooks opened by convert_workbook, registered before the pool forks so
+# that workers share the parsed shared strings instead of each parsing them
+_shared_workbooks = {}
+
+
+def _convert_sheet(args):
+    '''
+    Write one sheet to a CSV file. Runs in pool workers, so takes only picklable arguments.
+    '''
+    workbook_key, file_type, sheet_name, csv_path, row_limit, column_limit = args
+    workbook = _shared_workbooks[workbook_key]
+    iter_rows = _iter_xlsx_rows if file_type == 'xlsx' else _iter_xls_rows
+    with open(csv_path, 'wb') as csv_file:
+        return write_csv_rows(iter_rows(workbook, sheet_name), csv_file, row_limit=row_limit, column_limit=column_limit)
+
+
+def get_sheet_names(workbook, file_type):
+    if file_type == 'xlsx':
+        return workbook.get_sheet_names()
+    return workbook.sheet_names()
+
+
+def convert_workbook(workbook_path, file_type, directory, row_limit=None, column_limit=None, num_processes=None):
+    '''
+    Write each non-empty sheet of a workbook to a CSV file in directory.
+    Returns [ (sheet_name, csv_path) ] in sheet order.
+    '''
+    workbook = open_workbook(workbook_path, file_type)
+    workbook_key = id(workbook)
+    _shared_workbooks[workbook_key] = workbook
+    try:
+        tasks = [ (workbook_key, file_type, sheet_name, os.path.join(directory, '%s.csv' % i), row_limit, column_limit)
+            for (i, sheet_name) in enumerate(get_sheet_names(workbook, file_type)) ]
+        if not tasks:
+            return []
+
+        num_processes = min(num_processes or cpu_count(), len(tasks))
+        if num_processes > 1:
+            pool = get_pool(num_processes)
+            try:
+                row_counts = pool.map(_convert_sheet, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            row_counts = map(_convert_sheet, tasks)
+    finally:
+        del _shared_workbooks[workbook_key]
+        close_workbook(workbook, file_type)
+
+    sheets = []
+    for (task, n_rows) in zip(tasks, row_counts):
+        sheet_name, csv_path = task[2], task[3]
+        if n_rows:
+            sheets.append((sheet_name, csv_path))
+        else:
+            os.remove(csv_path)
+    return sheets
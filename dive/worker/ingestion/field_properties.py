@@ -10,10 +10,12 @@ from time import time
 from random import sample, randint
 from scipy import stats as sc_stats
 from flask import current_app
-from itertools import permutations
+from itertools import permutations, chain
+from multiprocessing import cpu_count
 
 from dive.base.db import db_access
-from dive.base.data.access import get_data, coerce_types
+from dive.base.data.access import get_data, coerce_types, DataChunks
+from dive.base.pool import get_pool
 from dive.base.data.in_memory_data import InMemoryData as IMD
 from dive.worker.core import celery, task_app
 from dive.base.constants import GeneratingProcedure as GP, TypeStructure as TS, \
@@ -22,6 +24,8 @@ from dive.worker.ingestion.type_detection import calculate_field_type
 from dive.worker.ingestion.id_detection import detect_id
 from dive.worker.ingestion.utilities import get_unique
 from dive.worker.visualization.data import get_bin_agg_data, get_val_count_data
+from dive.worker.statistics.column_profile import ColumnProfile, is_profilable
+from dive.worker.statistics.streaming import streaming_sketch, streaming_describe_categorical
 
 from celery import states
 from celery.utils.log import get_task_logger
@@ -80,10 +84,30 @@ def sample_with_maximum_distance(li, num_samples, random_start=True):
     return samples
 
 
-def calculate_field_stats(field_type, general_type, field_values, logging=False):
+def calculate_field_stats(field_type, general_type, field_values, logging=False, profile=None):
+    '''
+    profile is the ColumnProfile of numeric field_values, if already computed.
+    field_values may also be an iterable of Series chunks (see
+    DataChunks.iter_column), summarized in bounded memory: percentiles then
+    come from a reservoir sample, which is exact up to its size.
+    '''
     if logging: start_time = time()
     percentiles = [(i * .5) / 10 for i in range(1, 20)]
 
+    if not isinstance(field_values, pd.Series):
+        # Summarized as DataFrame.describe would, by the dtype of the chunks
+        chunks = iter(field_values)
+        first_chunk = next(chunks, pd.Series([]))
+        chunks = chain([ first_chunk ], chunks)
+        if is_profilable(first_chunk):
+            return streaming_sketch(chunks).describe(percentiles=percentiles)
+        return streaming_describe_categorical(chunks)
+
+    if profile is None and is_profilable(field_values):
+        profile = ColumnProfile(field_values)
+    if profile is not None:
+        return profile.describe(percentiles=percentiles)
+
     df = pd.DataFrame(field_values)
     stats = df.describe(percentiles=percentiles).to_dict().values()[0]
     stats['total_count'] = df.shape[0]
@@ -118,26 +142,40 @@ def get_temporal_uniqueness(field_name, field_type, general_type, df, temporal_f
         is_unique_by_time = any(uniqueness_by_time_fields)
     return is_unique_by_time
 
-def compute_single_field_property_nontype(field_name, field_values, field_type, general_type, df=None, temporal_fields=[]):
+def compute_single_field_property_nontype(field_name, field_values, field_type, general_type, df=None, temporal_fields=[], stream_stats=False):
+    '''
+    With stream_stats, stats are left to be computed from chunks of the dataset
+    '''
     temporal = (len(temporal_fields) > 0)
 
-    field_values_no_na = field_values.dropna(how='any')
-    all_null = (len(field_values_no_na) == 0)
-    num_na = len(field_values) - len(field_values_no_na)
-    is_unique = detect_unique_list(field_values_no_na) if not temporal else get_temporal_uniqueness(field_name, field_type, general_type, df, temporal_fields)
+    # Numeric fields are summarized from one sort of their values
+    profile = ColumnProfile(field_values) if is_profilable(field_values) else None
+    if profile is not None:
+        field_values_no_na = profile.sorted_values
+        all_null = (profile.count == 0)
+        num_na = profile.num_na
+        is_unique = detect_unique_count(profile.num_unique, profile.count) if not temporal else get_temporal_uniqueness(field_name, field_type, general_type, df, temporal_fields)
+    else:
+        field_values_no_na = field_values.dropna(how='any')
+        all_null = (len(field_values_no_na) == 0)
+        num_na = len(field_values) - len(field_values_no_na)
+        is_unique = detect_unique_list(field_values_no_na) if not temporal else get_temporal_uniqueness(field_name, field_type, general_type, df, temporal_fields)
 
     is_id = detect_id(field_name, field_type, is_unique)
 
     stats, contiguous, scale, viz_data, normality, unique_values = [ None ]*6
 
     if not all_null:
-        stats = calculate_field_stats(field_type, general_type, field_values)
-        contiguous = get_contiguity(field_name, field_values, field_values_no_na, field_type, general_type)
+        if not stream_stats:
+            stats = calculate_field_stats(field_type, general_type, field_values, profile=profile)
+        contiguous = get_contiguity(field_name, field_values, field_values_no_na, field_type, general_type, profile=profile)
         scale = get_scale(field_name, field_values, field_type, general_type, contiguous)
-        viz_data = get_field_distribution_viz_data(field_name, field_values, field_type, general_type, scale, is_id, contiguous)
+        viz_data = get_field_distribution_viz_data(field_name, field_values, field_type, general_type, scale, is_id, contiguous, profile=profile)
         normality = get_normality(field_name, field_values, field_type, general_type, scale)
 
-        unique_values = [ e for e in get_unique(field_values_no_na) if not pd.isnull(e) ] if (scale in [ Scale.NOMINAL.value, Scale.ORDINAL.value ] and not is_unique) else None
+        if scale in [ Scale.NOMINAL.value, Scale.ORDINAL.value ] and not is_unique:
+            unique_values = list(profile.unique_values) if profile is not None else get_unique(field_values_no_na)
+            unique_values = [ e for e in unique_values if not pd.isnull(e) ]
 
     return {
         'scale': scale,  # Recompute if continguous
@@ -160,19 +198,25 @@ def get_scale(field_name, field_values, field_type, general_type, contiguous):
     return scale
 
 
-def get_contiguity(field_name, field_values, field_values_no_na, field_type, general_type, MAX_CONTIGUOUS_FIELDS=30):
+def get_contiguity(field_name, field_values, field_values_no_na, field_type, general_type, MAX_CONTIGUOUS_FIELDS=30, profile=None):
     contiguous = False
 
     if field_type == DT.INTEGER.value:
+        if profile is not None:
+            if (profile.max - profile.min + 1 <= MAX_CONTIGUOUS_FIELDS):
+                contiguous = profile.is_contiguous()
+            return contiguous
+
         value_range = max(field_values_no_na) - min(field_values_no_na) + 1
         if (value_range <= MAX_CONTIGUOUS_FIELDS):
             contiguous = detect_contiguous_integers(field_values_no_na)
     return contiguous
 
 
-def get_field_distribution_viz_data(field_name, field_values, field_type, general_type, scale, is_id, contiguous):
+def get_field_distribution_viz_data(field_name, field_values, field_type, general_type, scale, is_id, contiguous, profile=None):
     viz_data = None
     if is_id: return viz_data
+    precomputed = { 'profiles': { field_name: profile } } if profile is not None else {}
 
     df = pd.DataFrame.from_dict({ field_name: field_values })
     field_document = { 'name': field_name, 'type': field_type, 'scale': scale, 'general_type': general_type }
@@ -214,7 +258,7 @@ def get_field_distribution_viz_data(field_name, field_values, field_type, genera
         }
         viz_data_function = get_val_count_data
     try:
-        viz_data = viz_data_function(df, spec)
+        viz_data = viz_data_function(df, spec, precomputed=precomputed)
     except Exception as e:
         logger.error('Error getting viz data: %s', e, exc_info=True)
         return None
@@ -255,6 +299,59 @@ def compute_single_field_property_type(field_name, field_values, field_position=
     }
 
 
+# Frames read by pool workers, registered before the pool forks so that the
+# workers share their pages instead of each receiving a pickled copy
+_shared_frames = {}
+
+
+def _compute_field_property_type(args):
+    '''
+    Type properties of one field. Runs in pool workers, so takes only picklable arguments.
+    '''
+    frame_key, i, field_name, num_fields = args
+    df = _shared_frames[frame_key]
+    return compute_single_field_property_type(field_name, df[field_name], field_position=i, num_fields=num_fields)
+
+
+def _compute_field_property_nontype(args):
+    '''
+    Other properties of one field. Runs in pool workers, so takes only picklable arguments.
+    '''
+    frame_key, field_name, field_type, general_type, temporal_fields, stream_stats = args
+    df = _shared_frames[frame_key]
+    return compute_single_field_property_nontype(field_name, df[field_name], field_type, general_type, df=df, temporal_fields=temporal_fields, stream_stats=stream_stats)
+
+
+def _map_fields(function, df, tasks, num_processes):
+    '''
+    Map function over tasks of df's fields, in a pool of num_processes when
+    greater than 1. Results are in the order of tasks.
+    '''
+    frame_key = id(df)
+    _shared_frames[frame_key] = df
+    try:
+        tasks = [ (frame_key,) + task for task in tasks ]
+        num_processes = min(num_processes, len(tasks))
+        if num_processes <= 1:
+            return map(function, tasks)
+
+        pool = get_pool(num_processes)
+        try:
+            return pool.map(function, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        del _shared_frames[frame_key]
+
+
+def _get_field_properties_processes(num_fields):
+    min_fields = current_app.config.get('PARALLEL_FIELD_PROPERTIES_MIN_FIELDS')
+    if not min_fields or num_fields < min_fields:
+        return 1
+    return current_app.config.get('PARALLEL_FIELD_PROPERTIES_PROCESSES') or cpu_count()
+
+
 def compute_all_field_properties(dataset_id, project_id, should_detect_hierarchical_relationships=True, track_started=True):
     '''
     Compute field properties of a specific dataset
@@ -274,36 +371,38 @@ def compute_all_field_properties(dataset_id, project_id, should_detect_hierarchi
     if num_fields <= len(total_palette):
         palette = sample_with_maximum_distance(total_palette, num_fields, random_start=True)
 
+    # Fields are independent, so each step runs field by field in a pool
+    num_processes = _get_field_properties_processes(num_fields)
+
     # 1) Detect field types
+    logger.info('[%s | %s] Detecting types of %s fields', project_id, dataset_id, num_fields)
+    type_tasks = [ (i, field_name, num_fields) for (i, field_name) in enumerate(df) ]
+    type_objects = _map_fields(_compute_field_property_type, df, type_tasks, num_processes)
     for (i, field_name) in enumerate(df):
-        logger.info('[%s | %s] Detecting type for field %s', project_id, dataset_id, field_name)
-        field_values = df[field_name]
-        d = field_property_type_object = compute_single_field_property_type(field_name, field_values, field_position=i, num_fields=num_fields)
         field_properties[i].update({
             'index': i,
             'name': field_name,
         })
-        field_properties[i].update(d)
+        field_properties[i].update(type_objects[i])
 
 
     temporal_fields = [ fp for fp in field_properties if (fp['general_type'] == GDT.T.value)]
 
     # Necessary to coerce here?
     coerced_df = coerce_types(df, field_properties)
-    IMD.insertData(dataset_id, coerced_df)
+    IMD.insertData(dataset_id, coerced_df, version=db_access.get_dataset_version(dataset_id))
+
+    # Stats of large datasets are summarized from chunks, coerced as coerced_df
+    stream_stats = (coerced_df.shape[0] > current_app.config.get('STREAMING_ROW_THRESHOLD', 1000000))
+    if stream_stats:
+        chunks = DataChunks(project_id, dataset_id, field_properties=[ dict(fp) for fp in field_properties ])
 
     # 2) Rest
+    nontype_tasks = [ (field_name, field_properties[i]['type'], field_properties[i]['general_type'], temporal_fields, stream_stats)
+        for (i, field_name) in enumerate(coerced_df) ]
+    nontype_objects = _map_fields(_compute_field_property_nontype, coerced_df, nontype_tasks, num_processes)
     for (i, field_name) in enumerate(coerced_df):
-        field_values = coerced_df[field_name]
-
-        d = field_properties_nontype_object = compute_single_field_property_nontype(
-            field_name,
-            field_values,
-            field_properties[i]['type'],
-            field_properties[i]['general_type'],
-            df=coerced_df,
-            temporal_fields=temporal_fields
-        )
+        d = nontype_objects[i]
         field_properties[i].update({
             'color': palette[i],
             'children': [],
@@ -313,6 +412,9 @@ def compute_all_field_properties(dataset_id, project_id, should_detect_hierarchi
         })
         field_properties[i].update(d)
 
+        if stream_stats and (d['num_na'] < coerced_df.shape[0]):
+            field_properties[i]['stats'] = calculate_field_stats(field_properties[i]['type'], field_properties[i]['general_type'], chunks.iter_column(field_name))
+
     if should_detect_hierarchical_relationships:
         hierarchical_relationships = detect_hierarchical_relationships(coerced_df, field_properties)
         MAX_UNIQUE_VALUES_THRESHOLD = 100   
@@ -332,17 +434,23 @@ def compute_all_field_properties(dataset_id, project_id, should_detect_hierarchi
 
 def detect_hierarchical_relationships(df, field_properties, MAX_UNIQUE_VALUES_THRESHOLD = 100):
     hierarchical_relationships = []
+    field_a_codes = {}
     for field_a, field_b in permutations(field_properties, 2):
         if field_a['is_unique'] or (field_a['general_type'] != GDT.C.value) or (field_b['general_type'] != GDT.C.value):
             continue
 
-        field_b_unique_corresponding_values = []
-        for unique_value_index, unique_value_a in enumerate(field_a['unique_values']):
-            if unique_value_index > MAX_UNIQUE_VALUES_THRESHOLD:
-                continue
-            sub_df = df.loc[df[field_a['name']] == unique_value_a]
-            field_b_unique_corresponding_values.extend(set(sub_df[field_b['name']]))
-            # print unique_value_a, set(sub_df[field_b['name']])
+        # Encode field a once against its first unique values; -1 marks the other rows
+        if field_a['name'] not in field_a_codes:
+            field_a_codes[field_a['name']] = pd.Categorical(
+                df[field_a['name']],
+                categories=field_a['unique_values'][:MAX_UNIQUE_VALUES_THRESHOLD + 1]
+            ).codes
+        codes_a = field_a_codes[field_a['name']]
+
+        # Distinct (a, b) pairs: the b values corresponding to each value of a
+        pairs = pd.DataFrame({ 'a': codes_a, 'b': df[field_b['name']].values })
+        pairs = pairs[pairs['a'] != -1].drop_duplicates()
+        field_b_unique_corresponding_values = pairs['b'].tolist()
 
         if detect_unique_list(field_b_unique_corresponding_values, THRESHOLD=0.5):
             hierarchical_relationships.append([ field_a, field_b ])
@@ -384,7 +492,11 @@ def detect_unique_list(l, THRESHOLD=0.95):
     # TODO Vary threshold by number of elements (be smarter about it)
 
     # Comparing length of uniqued elements with original list
-    if len(l) and ((len(np.unique(l)) / float(len(l))) >= THRESHOLD):
+    return detect_unique_count(len(np.unique(l)) if len(l) else 0, len(l), THRESHOLD=THRESHOLD)
+
+
+def detect_unique_count(num_unique, num_values, THRESHOLD=0.95):
+    if num_values and ((num_unique / float(num_values)) >= THRESHOLD):
         return True
     return False
 
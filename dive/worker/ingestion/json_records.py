@@ -0,0 +1,214 @@
+'''
+Conversion of JSON uploads into CSV files, record by record
+
+Accepts a top-level array of records as well as JSON Lines (records separated
+by whitespace). Records are decoded one at a time from a buffer of a few
+chunks, so memory use depends on the size of a record rather than the file.
+A record that does not decode from the buffer is scanned for its end (its
+brackets and strings), resuming where the previous chunk ended: one that ends
+in the buffer is invalid, others are decoded once their end arrives, and
+records over max_record_size characters are rejected. The header is the union of the keys of the first records, in
+order of appearance.
+'''
+import re
+import json
+import codecs
+from itertools import chain
+
+from dive.base.exceptions import UploadTooLargeException
+from dive.worker.ingestion.utilities import write_csv_rows
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+READ_CHUNK_SIZE = 1024 * 1024
+SCHEMA_SAMPLE_SIZE = 1000
+MAX_RECORD_SIZE = 64 * 1024 * 1024
+WHITESPACE = ' \t\n\r'
+
+structure_regex = re.compile(r'["{}\[\]]')
+string_body_regex = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+scalar_end_regex = re.compile(r'[ \t\n\r,\]]')
+
+
+class recordScanner(object):
+    '''
+    Finds where a JSON value ends in text fed piece by piece, carrying its
+    bracket depth and string state from one piece to the next
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = False
+        self.is_scalar = False
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text, position=0):
+        '''
+        End in text of the value (which starts at position of the first text
+        fed), or None if the value does not end in text
+        '''
+        if not self.started:
+            self.started = True
+            self.is_scalar = (text[position] not in '{["')
+        if self.is_scalar:
+            match = scalar_end_regex.search(text, position)
+            return match.start() if match else None
+
+        while True:
+            if self.in_string:
+                if self.escaped:
+                    if position >= len(text):
+                        return None
+                    position += 1
+                    self.escaped = False
+                position = string_body_regex.match(text, position).end()
+                if position >= len(text):
+                    return None
+                if text[position] == '\\':
+                    # Backslash ending the text, escaping the first character of the next
+                    self.escaped = True
+                    position += 1
+                    continue
+                position += 1
+                self.in_string = False
+                if self.depth == 0:
+                    return position
+                continue
+
+            match = structure_regex.search(text, position)
+            if not match:
+                return None
+            position = match.end()
+            token = match.group()
+            if token == '"':
+                self.in_string = True
+            elif token in '{[':
+                self.depth += 1
+            else:
+                self.depth -= 1
+                if self.depth <= 0:
+                    return position
+
+
+def iter_json_records(file_obj, chunk_size=READ_CHUNK_SIZE, max_record_size=MAX_RECORD_SIZE):
+    '''
+    Yield the records of a UTF-8 JSON array or JSON Lines file. Raises
+    ValueError on invalid JSON and UploadTooLargeException on a record over
+    max_record_size characters.
+    '''
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    scanner = recordScanner()
+    buf = u''
+    eof = False
+    position = 0
+    in_array = None
+
+    def read_text():
+        chunk = file_obj.read(chunk_size)
+        return text_decoder.decode(chunk, final=not chunk), not chunk
+
+    while True:
+        # Skip separators between records
+        while position < len(buf) and buf[position] in WHITESPACE + ',':
+            position += 1
+        if position < len(buf) and in_array is None:
+            in_array = (buf[position] == '[')
+            if in_array:
+                position += 1
+                continue
+        if position < len(buf) and in_array and buf[position] == ']':
+            return
+
+        if position >= len(buf):
+            if eof:
+                return
+            text, eof = read_text()
+            buf, position = buf[position:] + text, 0
+            continue
+
+        # Most records are complete in the buffer and decode directly
+        try:
+            record, end = decoder.raw_decode(buf, position)
+        except ValueError:
+            end = None
+        # A number or literal is only complete once followed by a separator (12 may be 12.5)
+        if end is not None and (isinstance(record, (dict, list, basestring)) or (end < len(buf) and buf[end] in WHITESPACE + ',]') or (eof and end == len(buf))):
+            position = end
+            yield record
+            continue
+
+        # Otherwise find the end of the record first, reading pieces of text
+        # until it arrives, and join them once
+        pieces = [ buf[position:] ]
+        length = len(pieces[0])
+        scanner.reset()
+        end = scanner.feed(pieces[0])
+        while end is None:
+            if eof:
+                if not scanner.is_scalar:
+                    raise ValueError('JSON ends inside a record')
+                end = length
+                break
+            if length > max_record_size:
+                raise UploadTooLargeException('JSON record exceeds {} characters'.format(max_record_size))
+            text, eof = read_text()
+            if text:
+                piece_end = scanner.feed(text)
+                if piece_end is not None:
+                    end = length + piece_end
+                pieces.append(text)
+                length += len(text)
+
+        # Raises ValueError if the complete record is invalid
+        buf = u''.join(pieces)
+        record, decoded_end = decoder.raw_decode(buf, 0)
+        if decoded_end != end:
+            raise ValueError('Extra data in JSON record at character %s' % decoded_end)
+        position = end
+        yield record
+
+
+def get_union_header(records):
+    header = []
+    seen = set()
+    for record in records:
+        for key in record:
+            if key not in seen:
+                seen.add(key)
+                header.append(key)
+    return header
+
+
+def convert_json(file_obj, csv_file, row_limit=None, column_limit=None, sample_size=SCHEMA_SAMPLE_SIZE):
+    '''
+    Write the records of a JSON file to csv_file, with a header of the keys
+    found in the first sample_size records. Returns the number of records.
+    '''
+    records = ( r if isinstance(r, dict) else { 'value': r } for r in iter_json_records(file_obj) )
+
+    sample = []
+    for record in records:
+        sample.append(record)
+        if len(sample) >= sample_size:
+            break
+    header = get_union_header(sample)
+
+    header_keys = set(header)
+    dropped_keys = set()
+    def get_row(record):
+        dropped_keys.update(k for k in record if k not in header_keys)
+        return [ record.get(k) for k in header ]
+
+    # The header counts towards the row limit, as for spreadsheets
+    rows = chain([ header ], (get_row(record) for record in chain(sample, records)))
+    n_rows = write_csv_rows(rows, csv_file, row_limit=row_limit, column_limit=column_limit) - 1
+
+    if dropped_keys:
+        logger.info('Dropped keys missing from the first %s JSON records: %s', sample_size, sorted(dropped_keys))
+    return n_rows
@@ -2,13 +2,15 @@
 From https://github.com/okfn/messytables/blob/master/messytables/types.py
 '''
 import re
+import time
 import pandas as pd
 import numpy as np
 import locale
 import decimal
+import _strptime
 from datetime import datetime, date
 import dateutil.parser as dparser
-from dateparser import DATE_FORMATS, is_date
+from dateparser import DATE_FORMATS, is_date, date_regex
 
 from dive.base.constants import DataType, DataTypeWeights
 
@@ -18,6 +20,21 @@ logger = logging.getLogger(__name__)
 
 string_types = (str, unicode)
 
+# Grammars of float() and decimal.Decimal() for unicode strings, so that
+# unicode digits and whitespace match as they convert. float() only takes
+# ASCII letters in any case, decimal.Decimal() any letter that IGNORECASE
+# folds to them.
+float_regex = re.compile(r'^\s*[+-]?(?:(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?|[iI][nN][fF](?:[iI][nN][iI][tT][yY])?|[nN][aA][nN])\s*\Z', re.UNICODE)
+decimal_regex = re.compile(r'^[+-]?(?:(?=\d|\.\d)\d*(?:\.\d*)?(?:e[+-]?\d+)?|inf(?:inity)?|s?nan\d*)\Z', re.IGNORECASE | re.UNICODE)
+
+# Loose superset of the strings int() accepts
+int_candidate_regex = re.compile(r'^[\s+-]*\d+\s*\Z', re.UNICODE)
+
+
+def _contains(values, regex):
+    ''' Boolean array of the values in which regex finds a match '''
+    return values.str.contains(regex.pattern, flags=regex.flags, na=False).values.astype(bool)
+
 
 class CellType(object):
     ''' A cell type maintains information about the format
@@ -44,6 +61,24 @@ class CellType(object):
         except Exception as e:
             return False
 
+    def test_values(self, values):
+        ''' ``test`` over a sequence of values. Unicode values
+        are tested together by ``test_strings``, others one by one.
+        Boolean array'''
+        values = pd.Series(values, dtype=object).reset_index(drop=True)
+        is_unicode = np.array([ isinstance(v, unicode) for v in values ], dtype=bool)
+        result = np.zeros(len(values), dtype=bool)
+        if is_unicode.any():
+            result[is_unicode] = self.test_strings(values[is_unicode].reset_index(drop=True))
+        for i in np.flatnonzero(~is_unicode):
+            result[i] = self.test(values[i])
+        return result
+
+    def test_strings(self, values):
+        ''' ``test`` over a Series of unicode values. Subclasses
+        vectorize this where the result is identical. '''
+        return np.array([ self.test(v) for v in values ], dtype=bool)
+
     @classmethod
     def instances(cls):
         return [ cls() ]
@@ -65,6 +100,11 @@ class SpecificCellType(CellType):
             return True
         return False
 
+    def test_strings(self, values):
+        if not issubclass(unicode, self.result_type):
+            return np.zeros(len(values), dtype=bool)
+        return values.isin(self.examples).values
+
 
 class IntegerType(CellType):
     name = DataType.INTEGER.value
@@ -87,6 +127,30 @@ class IntegerType(CellType):
         else:
             raise ValueError('Invalid integer: %s' % value)
 
+    def test_strings(self, values):
+        result = _contains(values, self.regex)
+
+        # Integral floats
+        is_float = ~result & _contains(values, float_regex)
+        if is_float.any():
+            floats = np.array([ float(v) for v in values[is_float] ])
+            result[is_float] = np.isfinite(floats) & (np.floor(floats) == floats)
+
+        # Integers in the locale's format, as locale.atoi would read them
+        rest = np.flatnonzero(~result & ~is_float)
+        if len(rest):
+            conventions = locale.localeconv()
+            thousands_sep, decimal_point = conventions['thousands_sep'], conventions['decimal_point']
+            for i in rest:
+                value = values[i]
+                if thousands_sep:
+                    value = value.replace(thousands_sep, '')
+                if decimal_point:
+                    value = value.replace(decimal_point, '.')
+                if int_candidate_regex.match(value):
+                    result[i] = self.test(values[i])
+        return result
+
 
 class StringType(CellType):
     name = DataType.STRING.value
@@ -103,6 +167,9 @@ class StringType(CellType):
         except UnicodeEncodeError:
             return str(value)
 
+    def test_strings(self, values):
+        return np.ones(len(values), dtype=bool)
+
 
 class DecimalType(CellType):
     ''' Decimal number, ``decimal.Decimal`` or float numbers. '''
@@ -119,6 +186,10 @@ class DecimalType(CellType):
                 value = str(value)
             return decimal.Decimal(value)
 
+    def test_strings(self, values):
+        # The locale fallback in cast never succeeds (sys is not imported)
+        return _contains(values.str.strip(), decimal_regex)
+
 
 class BooleanType(CellType):
     ''' A boolean field. Matches true/false, yes/no and 0/1 by default,
@@ -147,6 +218,10 @@ class BooleanType(CellType):
             return False
         raise ValueError
 
+    def test_strings(self, values):
+        normalized = values.str.strip().str.lower()
+        return ((values != '') & normalized.isin(list(self.true_values) + list(self.false_values))).values
+
 
 class DateType(CellType):
     '''
@@ -175,6 +250,51 @@ class DateType(CellType):
                 pass
         return None
 
+    def test_strings(self, values):
+        result = np.zeros(len(values), dtype=bool)
+        remaining = values[(values != '').values & _contains(values, date_regex)]
+
+        # Only values matching a format's regular expression can parse with it
+        for date_format in self.formats:
+            if not len(remaining):
+                break
+            format_regex = _get_format_regex(date_format)
+            if format_regex is None:
+                continue
+            parsed = []
+            for (i, value) in remaining[_contains(remaining, format_regex)].iteritems():
+                try:
+                    datetime.strptime(value, date_format)
+                    parsed.append(i)
+                except:
+                    pass
+            result[parsed] = True
+            remaining = remaining.drop(parsed)
+        return result
+
+
+_format_regexes = {}
+
+def _get_format_regex(date_format):
+    '''
+    Regular expression matching the whole of strings that datetime.strptime
+    could parse with date_format, or None for formats it rejects. Follows
+    strptime's locale.
+    '''
+    locale_key = (_strptime._getlang(), time.tzname, time.daylight)
+    if locale_key not in _format_regexes:
+        _format_regexes[locale_key] = (_strptime.TimeRE(), {})
+    time_re, regexes = _format_regexes[locale_key]
+
+    if date_format not in regexes:
+        try:
+            # Groups are not needed for matching
+            pattern = re.sub(r'\(\?P<\w+>', '(?:', time_re.pattern(date_format))
+            regexes[date_format] = re.compile(r'^(?:%s)\Z' % pattern, re.IGNORECASE)
+        except (KeyError, IndexError, re.error):
+            regexes[date_format] = None
+    return regexes[date_format]
+
 
 class DateUtilType(CellType):
     ''' The date util type uses the dateutil library to
@@ -97,11 +97,17 @@ def get_type_scores_from_field_values(field_values, field_types=FIELD_TYPES):
         type_instances.extend(field_type.instances())
 
     # Detection from values
-    # N_values * N_types iterations (no hierarchical tests)
-    for field_value in field_values:
-        for type_instance in type_instances:
-            if type_instance.test(field_value):
-                type_scores[type_instance.name] += type_instance.weight
+    # Each distinct value is tested once per type, weighted by its count
+    value_counts = pd.Series(list(field_values), dtype=object).value_counts(dropna=False)
+    if not len(value_counts):
+        return type_scores
+
+    distinct_values = pd.Series(value_counts.index, dtype=object)
+    counts = value_counts.values
+    for type_instance in type_instances:
+        matches = type_instance.test_values(distinct_values)
+        if matches.any():
+            type_scores[type_instance.name] += type_instance.weight * int(counts[matches].sum())
     return type_scores
 
 
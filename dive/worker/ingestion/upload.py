@@ -5,56 +5,40 @@ Functions for reading, sampling, and detecting types of datasets
 No manipulation or calculation, only description
 '''
 
+import io
 import os
 import re
+import time
+import uuid
 import csv
-import xlrd
-import json
 import codecs
-try:
-    import cStringIO as StringIO
-except:
-    import StringIO
-import boto3
+import shutil
+import tempfile
 import chardet
+from chardet.universaldetector import UniversalDetector
 import pandas as pd
 
 from werkzeug.utils import secure_filename
 from flask import current_app
 
-from dive.base.core import s3_client, compress
+from dive.base.core import compress
 from dive.base.db import db_access
-from dive.base.exceptions import UploadTooLargeException
+from dive.base.exceptions import UploadTooLargeException, UnsupportedFileTypeException
 from dive.worker.core import celery, task_app
 from dive.base.data.access import get_data
 from dive.base.data.in_memory_data import InMemoryData as IMD
+from dive.base.data.storage import get_storage
+from dive.base.data.columnar import ensure_directory
+from dive.base.data.compression import DecompressingReader, get_compression, get_zip_member_name
+from dive.base.data.row_index import RowIndexBuilder, row_index_to_bytes, get_row_index_path
+from dive.worker.ingestion.excel import convert_workbook
+from dive.worker.ingestion.json_records import convert_json
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-def save_fileobj_to_s3(fileobj, project_id, file_name):
-    try:
-        url = s3_client.generate_presigned_url(
-            'get_object',
-            Params = {
-                'Bucket': current_app.config['AWS_DATA_BUCKET'],
-                'Key': file_name
-            },
-            ExpiresIn = 86400
-        )
-
-        s3_client.upload_fileobj(
-            fileobj,
-            current_app.config['AWS_DATA_BUCKET'],
-            "%s/%s" % (project_id, file_name)
-        )
-    except Exception as e:
-        logger.error(e, exc_info=True)
-    return url
-
-
-def upload_file(project_id, file_obj):
+def upload_file(project_id, file_obj, na_values=None, file_name=None):
     '''
     1. Save file in uploads/project_id directory
     2. If excel or json, also save CSV versions
@@ -63,14 +47,17 @@ def upload_file(project_id, file_obj):
     file_name = foo.csv
     file_title = foo
     '''
-    file_name = secure_filename(file_obj.filename)
-    file_title, file_type = file_name.rsplit('.', 1)
+    file_name = secure_filename(file_name or file_obj.filename)
+
+    # Compressed files are named by the file they hold
+    compression, uncompressed_file_name = get_compression(file_name)
+    if compression == 'zip':
+        uncompressed_file_name = secure_filename(os.path.basename(get_zip_member_name(file_obj)))
+    file_title, file_type = get_file_type(uncompressed_file_name)
 
     # Pre-save properties
-    if current_app.config['STORAGE_TYPE'] == 'file':
-        path = os.path.join(current_app.config['STORAGE_PATH'], str(project_id), file_name)
-    elif current_app.config['STORAGE_TYPE'] == 's3':
-        path = 'https://s3.amazonaws.com/%s/%s/%s' % (current_app.config['AWS_DATA_BUCKET'], str(project_id), file_name)
+    storage = get_storage()
+    path = storage.getPath(project_id, file_name)
 
     # Persisting file and saving to DB
     datasets = save_dataset_to_db(
@@ -80,30 +67,161 @@ def upload_file(project_id, file_obj):
         file_name,
         file_type,
         path,
-        current_app.config['STORAGE_TYPE']
+        storage.storage_type,
+        na_values=na_values,
+        compression=compression
     )
     file_obj.close()
     return datasets
 
 
-def get_encoding(file_obj, sample_size=100*1024*1024):
+def get_file_type(file_name):
+    '''
+    Returns (file_title, file_type) of an uncompressed file name, raising
+    UnsupportedFileTypeException unless its extension is in ALLOWED_EXTENSIONS
+    '''
+    if '.' not in file_name:
+        raise UnsupportedFileTypeException('File {} has no extension, must be one of {}'.format(file_name, ', '.join(sorted(ALLOWED_EXTENSIONS))))
+    file_title, file_type = file_name.rsplit('.', 1)
+    if file_type not in ALLOWED_EXTENSIONS:
+        raise UnsupportedFileTypeException('File {} has unsupported type {}, must be one of {}'.format(file_name, file_type, ', '.join(sorted(ALLOWED_EXTENSIONS))))
+    return file_title, file_type
+
+
+def spool_upload(file_obj):
+    '''
+    Copy an uploaded file to the spool directory, from which a worker persists
+    it, and return the spooled path
+    '''
+    spool_path = current_app.config['UPLOAD_SPOOL_PATH']
+    ensure_directory(spool_path)
+    path = os.path.join(spool_path, '%s-%s' % (uuid.uuid4().hex, secure_filename(file_obj.filename)))
+    file_obj.save(path, buffer_size=STREAM_CHUNK_SIZE)
+    return path
+
+
+def upload_spooled_file(project_id, spooled_path, file_name, na_values=None):
+    '''
+    upload_file for a file spooled by spool_upload, which is removed afterwards
+    '''
     try:
-        blob = file_obj.read(sample_size)
-        file_obj.seek(0)
-    except:
-        blob = file_obj
+        with open(spooled_path, 'rb') as file_obj:
+            return upload_file(project_id, file_obj, na_values=na_values, file_name=file_name)
+    finally:
+        if os.path.exists(spooled_path):
+            os.remove(spooled_path)
+
+
+# Uploads are sniffed from a bounded prefix and copied in fixed-size chunks,
+# so memory use does not grow with the size of the file
+SNIFF_SIZE = 1024 * 1024
+ENCODING_SAMPLE_SIZE = 4 * 1024 * 1024
+ENCODING_CHUNK_SIZE = 64 * 1024
+UTF8_VALIDATION_SIZE = 64 * 1024 * 1024
+UTF8_VALIDATION_CHUNK_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 8 * 1024 * 1024
+
+DEFAULT_DIALECT = {
+    "delimiter": ",",
+    "quotechar": "\"",
+    "escapechar": None,
+    "doublequote": False,
+    "lineterminator": "\r\n"
+}
+
+JSON_FILE_TYPES = [ 'json', 'jsonl', 'ndjson' ]
+
+ALLOWED_EXTENSIONS = set(['txt', 'csv', 'tsv', 'xlsx', 'xls'] + JSON_FILE_TYPES)
+
+UTF8_ENCODINGS = [ 'ascii', 'utf-8', 'utf8', 'utf-8-sig' ]
+
+# UTF-32 before UTF-16, whose little-endian BOM it starts with
+BYTE_ORDER_MARKS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def read_prefix(file_obj, size):
+    prefix = file_obj.read(size)
+    file_obj.seek(0)
+    return prefix
+
 
-    encoding = chardet.detect(blob)
-    return encoding['encoding']
+def is_utf8(encoding):
+    return (encoding or 'utf-8').lower() in UTF8_ENCODINGS
 
 
-def get_dialect(file_obj, sample_size=1024*1024):
+def _is_valid_utf8(file_obj, max_bytes):
+    '''
+    Whether the first max_bytes of file_obj decode as UTF-8, and whether that
+    covered the whole file
+    '''
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    bytes_read = 0
     try:
-        sample = file_obj.read(sample_size)
-    except StopIteration:
-        sample = file_obj.readline()
+        while bytes_read < max_bytes:
+            chunk = file_obj.read(UTF8_VALIDATION_CHUNK_SIZE)
+            if not chunk:
+                decoder.decode(b'', final=True)
+                return True, True
+            decoder.decode(chunk)
+            bytes_read += len(chunk)
+    except UnicodeDecodeError:
+        return False, False
+    return True, False
+
+
+def _detect_encoding(file_obj, sample_size, utf8_size):
+    head = file_obj.read(4)
+    for (bom, encoding) in BYTE_ORDER_MARKS:
+        if head.startswith(bom):
+            return encoding, 1.0
+    file_obj.seek(0)
+
+    # Most uploads are UTF-8 (or ASCII), which a strict decode confirms far faster than detection
+    is_valid, is_complete = _is_valid_utf8(file_obj, utf8_size)
+    if is_valid:
+        return 'utf-8', (1.0 if is_complete else 0.99)
     file_obj.seek(0)
 
+    detector = UniversalDetector()
+    bytes_read = 0
+    while bytes_read < sample_size and not detector.done:
+        chunk = file_obj.read(ENCODING_CHUNK_SIZE)
+        if not chunk:
+            break
+        detector.feed(chunk)
+        bytes_read += len(chunk)
+    detector.close()
+    return (detector.result['encoding'] or 'utf-8'), (detector.result['confidence'] or 0.0)
+
+
+def detect_encoding(file_obj, sample_size=ENCODING_SAMPLE_SIZE, utf8_size=UTF8_VALIDATION_SIZE):
+    '''
+    Returns (encoding, confidence, seconds taken) of a file object. Byte
+    order marks and valid UTF-8 are recognized first; other files are fed to
+    chardet chunk by chunk until it is confident or has read sample_size bytes.
+    '''
+    start_time = time.time()
+    file_obj.seek(0)
+    try:
+        encoding, confidence = _detect_encoding(file_obj, sample_size, utf8_size)
+    finally:
+        file_obj.seek(0)
+    detection_time = time.time() - start_time
+    logger.debug('Detected encoding %s (confidence %s) in %.3fs', encoding, confidence, detection_time)
+    return encoding, confidence, detection_time
+
+
+def get_encoding(file_obj, sample_size=ENCODING_SAMPLE_SIZE):
+    return detect_encoding(file_obj, sample_size=sample_size)[0]
+
+
+def sniff_dialect(sample):
     sniffer = csv.Sniffer()
     dialect = sniffer.sniff(sample)
 
@@ -117,59 +235,131 @@ def get_dialect(file_obj, sample_size=1024*1024):
     return result
 
 
-def save_dataset_to_db(project_id, file_obj, file_title, file_name, file_type, path, storage_type, limit_flat_file_size=False):
+def get_dialect(file_obj, sample_size=SNIFF_SIZE):
+    try:
+        sample = file_obj.read(sample_size)
+    except StopIteration:
+        sample = file_obj.readline()
+    file_obj.seek(0)
+    return sniff_dialect(sample)
+
+
+def count_columns(sample, dialect):
+    '''
+    Number of fields in the header row of a sample
+    '''
+    try:
+        header = next(csv.reader(io.BytesIO(sample), delimiter=str(dialect['delimiter']), quotechar=str(dialect['quotechar'] or '"')))
+    except (StopIteration, csv.Error):
+        return 0
+    return len(header)
+
+
+class TranscodingReader(object):
+    '''
+    Read-only file object over file_obj decoded from encoding and re-encoded
+    as UTF-8, chunk by chunk. Undecodable bytes become replacement characters.
+    '''
+    def __init__(self, file_obj, encoding, chunk_size=STREAM_CHUNK_SIZE):
+        self.file_obj = file_obj
+        self.decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        self.chunk_size = chunk_size
+        self.buffer = b''
+        self.eof = False
+
+    def read(self, size=-1):
+        while not self.eof and (size is None or size < 0 or len(self.buffer) < size):
+            chunk = self.file_obj.read(self.chunk_size)
+            self.eof = not chunk
+            self.buffer += self.decoder.decode(chunk, final=self.eof).encode('utf-8')
+
+        if size is None or size < 0:
+            result, self.buffer = self.buffer, b''
+        else:
+            result, self.buffer = self.buffer[:size], self.buffer[size:]
+        return result
+
+
+class UTF8ValidatingReader(object):
+    '''
+    Read-only file object passing file_obj through while checking, piece by
+    piece, that it decodes as UTF-8. invalid_sample holds the piece in which
+    decoding first failed, or None if it has not.
+    '''
+    def __init__(self, file_obj, piece_size=UTF8_VALIDATION_CHUNK_SIZE):
+        self.file_obj = file_obj
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.piece_size = piece_size
+        self.invalid_sample = None
+
+    def read(self, size=-1):
+        chunk = self.file_obj.read(size)
+        if self.invalid_sample is None:
+            try:
+                for start in range(0, len(chunk), self.piece_size):
+                    piece = chunk[start:start + self.piece_size]
+                    self.decoder.decode(piece)
+                if not chunk:
+                    piece = b''
+                    self.decoder.decode(piece, final=True)
+            except UnicodeDecodeError:
+                self.invalid_sample = piece
+        return chunk
+
+
+def get_fallback_encoding(sample):
+    '''
+    Encoding of a sample that failed to decode as UTF-8, if chardet detects
+    one other than UTF-8, else None
+    '''
+    detector = UniversalDetector()
+    detector.feed(sample)
+    detector.close()
+    encoding = detector.result['encoding']
+    if not encoding or is_utf8(encoding):
+        return None
+    return encoding
+
+
+def save_dataset_to_db(project_id, file_obj, file_title, file_name, file_type, path, storage_type, limit_flat_file_size=False, na_values=None, compression=None):
+    '''
+    Persist an uploaded file and insert its datasets. Compressed files are
+    sniffed and converted through a decompressing stream, and flat files are
+    stored compressed.
+    '''
+    content_obj = DecompressingReader(file_obj, compression) if compression else file_obj
     encoding = 'utf-8'
+    encoding_confidence = None
+    encoding_detection_time = None
 
     # Default dialect (for Excel and JSON conversion)
-    dialect = {
-        "delimiter": ",",
-        "quotechar": "\"",
-        "escapechar": None,
-        "doublequote": False,
-        "lineterminator": "\r\n"
-    }
+    dialect = DEFAULT_DIALECT
 
     file_docs = []
 
     if file_type in ['csv', 'tsv', 'txt']:
-        dialect = get_dialect(file_obj)
-        encoding = get_encoding(file_obj)
-        file_obj.seek(0)
-
-        # Force encoding to UTF-8
-        if (encoding not in ['ascii']) and ('utf' not in encoding) and ('UTF' not in encoding):
-            try:
-                coerced_content = file_obj.read().decode(encoding).encode('utf-8', 'replace')
-            except UnicodeDecodeError as UDE:
-                try:
-                    coerced_content = unicode(file_obj.read(), errors='replace')
-                except UnicodeDecodeError as UDE:
-                    logger.error('Error coercing unicode for file with path %s', path, exc_info=True)
-                    raise UDE
-            file_obj.seek(0)
-            file_obj.write(coerced_content)
-            file_obj.seek(0)
+        encoding, encoding_confidence, encoding_detection_time = detect_encoding(content_obj)
+        prefix = read_prefix(content_obj, SNIFF_SIZE)
+        if not is_utf8(encoding):
+            prefix = prefix.decode(encoding, 'replace').encode('utf-8')
+        dialect = sniff_dialect(prefix)
 
+        row_limit = None
         if limit_flat_file_size:  # False by default, because implemented on front-end
-            rows = file_obj.readlines()
-            cols = rows[0].split(dialect['delimiter'])
-            num_rows = len(rows)
-            num_cols = len(cols)
-            file_obj.seek(0)
-
-            if (num_rows > current_app.config['ROW_LIMIT']):
-                raise UploadTooLargeException('Uploaded file has {} rows, exceeding row limit of {}'.format(num_rows, current_app.config['ROW_LIMIT']))
-            elif (num_cols > current_app.config['COLUMN_LIMIT']):
+            row_limit = current_app.config['ROW_LIMIT']
+            num_cols = count_columns(prefix, dialect)
+            if (num_cols > current_app.config['COLUMN_LIMIT']):
                 raise UploadTooLargeException('Uploaded file has {} columns, exceeding row limit of {}'.format(num_cols, current_app.config['COLUMN_LIMIT']))
 
-        file_doc = save_flat_table(project_id, file_obj, file_title, file_name, file_type, path)
+        file_doc = save_flat_table(project_id, file_obj, file_title, file_name, file_type, path, dialect=dialect, encoding=encoding, row_limit=row_limit, compression=compression)
+        encoding = file_doc['encoding']
         file_docs.append(file_doc)
 
     elif file_type.startswith('xls'):
-        file_docs = save_excel_to_csv(project_id, file_obj, file_title, file_name, file_type, path)
+        file_docs = save_excel_to_csv(project_id, content_obj, file_title, file_name, file_type, path)
 
-    elif file_type == 'json':
-        file_doc = save_json_to_csv(project_id, file_obj, file_title, file_name, file_type, path)
+    elif file_type in JSON_FILE_TYPES:
+        file_doc = save_json_to_csv(project_id, content_obj, file_title, file_name, file_type, path)
         file_docs.append(file_doc)
 
     datasets = []
@@ -179,119 +369,182 @@ def save_dataset_to_db(project_id, file_obj, file_title, file_name, file_type, p
         dataset = db_access.insert_dataset(project_id,
             path = path,
             encoding = encoding,
+            encoding_confidence = encoding_confidence,
+            encoding_detection_time = encoding_detection_time,
             dialect = dialect,
             offset = None,
             title = file_doc['file_title'],
             file_name = file_doc['file_name'],
             type = file_doc['type'],
-            storage_type = storage_type
+            compression = file_doc.get('compression'),
+            storage_type = storage_type,
+            na_values = na_values
         )
         datasets.append(dataset)
 
     return datasets
 
 
-def save_flat_table(project_id, file_obj, file_title, file_name, file_type, path):
+def save_dataframe(project_id, df, file_title, file_name):
+    '''
+    Persist a derived DataFrame (e.g. a transformation result) as a TSV dataset
+    '''
+    storage = get_storage()
+    with tempfile.TemporaryFile() as f:
+        df.to_csv(f, sep=str('\t'), index=False, encoding='utf-8')
+        f.seek(0)
+        return save_dataset_to_db(project_id, f, file_title, file_name, 'tsv', storage.getPath(project_id, file_name), storage.storage_type)
+
+
+def index_stream(source, dialect, destination=None, row_limit=None, chunk_size=STREAM_CHUNK_SIZE):
+    '''
+    Build the row index of source in one pass of fixed-size chunks, copying
+    them to destination if given. Raises UploadTooLargeException as soon as
+    more than row_limit rows are read.
+    '''
+    builder = RowIndexBuilder(dialect)
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        builder.update(chunk)
+        if row_limit and builder.n_rows > row_limit:
+            raise UploadTooLargeException('Uploaded file has over {} rows, exceeding row limit of {}'.format(builder.n_rows, row_limit))
+        if destination:
+            destination.write(chunk)
+    return builder.finish()
+
+
+def save_flat_table(project_id, file_obj, file_title, file_name, file_type, path, dialect=None, encoding=None, row_limit=None, compression=None):
+    '''
+    Persist a flat file as UTF-8, with a byte-offset row index next to it.
+    Files in other encodings are transcoded chunk by chunk into a temporary
+    file, indexed as it is written; UTF-8 files are indexed and stored as is.
+    Compressed files are stored as they are, without a row index.
+
+    Encoding detection only checks a prefix of UTF-8 files, so the rest is
+    validated while indexing. Files that turn out not to be UTF-8 are
+    transcoded from the encoding chardet detects in the invalid bytes, or
+    from UTF-8 with replacement characters. Compressed ones, which are not
+    transcoded, are read in that encoding or Latin-1.
+    '''
     file_doc = {
         'file_title': file_title,
         'file_name': file_name,
         'type': file_type,
-        'path': path
+        'path': path,
+        'encoding': encoding,
+        'compression': compression
     }
 
-    if current_app.config['STORAGE_TYPE'] == 'file':
+    storage = get_storage()
+    if compression:
+        file_obj.seek(0)
+        content_obj = DecompressingReader(file_obj, compression)
+        if is_utf8(encoding):
+            validating_obj = UTF8ValidatingReader(content_obj)
+            index_stream(validating_obj, dialect or {}, row_limit=row_limit)
+            if validating_obj.invalid_sample is not None:
+                file_doc['encoding'] = get_fallback_encoding(validating_obj.invalid_sample) or 'latin-1'
+                logger.warning('File %s is not UTF-8 after the detected prefix, reading it as %s', file_name, file_doc['encoding'])
+        elif row_limit:
+            index_stream(TranscodingReader(content_obj, encoding), dialect or {}, row_limit=row_limit)
+        file_obj.seek(0)
         try:
-            file_obj.save(path)
-        except IOError:
+            storage.save(project_id, file_name, file_obj)
+        except Exception:
+            logger.error('Error saving file with path %s', path, exc_info=True)
+        return file_doc
+
+    with tempfile.TemporaryFile() as transcoded_file:
+        file_obj.seek(0)
+        if not is_utf8(encoding):
+            row_index = index_stream(TranscodingReader(file_obj, encoding), dialect or {}, destination=transcoded_file, row_limit=row_limit)
+            file_obj = transcoded_file
+            file_doc['encoding'] = 'utf-8'
+        else:
+            validating_obj = UTF8ValidatingReader(file_obj)
+            row_index = index_stream(validating_obj, dialect or {}, row_limit=row_limit)
+            if validating_obj.invalid_sample is not None:
+                fallback_encoding = get_fallback_encoding(validating_obj.invalid_sample) or 'utf-8'
+                logger.warning('File %s is not UTF-8 after the detected prefix, transcoding it from %s', file_name, fallback_encoding)
+                file_obj.seek(0)
+                row_index = index_stream(TranscodingReader(file_obj, fallback_encoding), dialect or {}, destination=transcoded_file, row_limit=row_limit)
+                file_obj = transcoded_file
+                file_doc['encoding'] = 'utf-8'
+        file_obj.seek(0)
+
+        try:
+            storage.save(project_id, file_name, file_obj)
+            storage.save(project_id, get_row_index_path(file_name), io.BytesIO(row_index_to_bytes(row_index)))
+        except Exception:
             logger.error('Error saving file with path %s', path, exc_info=True)
-    elif current_app.config['STORAGE_TYPE'] == 's3':
-        url = save_fileobj_to_s3(file_obj, project_id, file_name)
     return file_doc
 
 
+def _get_local_path(file_obj, directory, file_name):
+    '''
+    Path of a file on disk holding the contents of file_obj, copying it into
+    directory unless it is a file on disk already
+    '''
+    name = getattr(file_obj, 'name', None)
+    if isinstance(name, basestring) and os.path.isfile(name):
+        return name
+    path = os.path.join(directory, file_name)
+    file_obj.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(file_obj, f, STREAM_CHUNK_SIZE)
+    return path
+
+
 def save_excel_to_csv(project_id, file_obj, file_title, file_name, file_type, path):
-    book = xlrd.open_workbook(file_contents=file_obj.read())
-    sheet_names = book.sheet_names()
+    '''
+    Persist each non-empty sheet of a workbook as a CSV dataset, converting
+    sheets in parallel
+    '''
+    storage = get_storage()
+    directory = tempfile.mkdtemp()
 
-    file_docs = []
-    for sheet_name in sheet_names:
-        sheet = book.sheet_by_name(sheet_name)
-
-        if (sheet.nrows > current_app.config['ROW_LIMIT']):
-            raise UploadTooLargeException('Uploaded file has {} rows, exceeding row limit of {}'.format(sheet.nrows, current_app.config['ROW_LIMIT']))
-        elif (sheet.ncols > current_app.config['COLUMN_LIMIT']):
-            raise UploadTooLargeException('Uploaded file has {} columns, exceeding row limit of {}'.format(sheet.ncols, current_app.config['COLUMN_LIMIT']))
-
-        if sheet.nrows == 0: continue
-        csv_file_title = file_name + "_" + sheet_name
-        csv_file_name = csv_file_title + ".csv"
-
-        if current_app.config['STORAGE_TYPE'] == 's3':
-            csv_path = 'https://s3.amazonaws.com/%s/%s/%s' % (current_app.config['AWS_DATA_BUCKET'], str(project_id), csv_file_name)
-            strIO = StringIO.StringIO()
-            wr = csv.writer(strIO, quoting=csv.QUOTE_ALL)
-            for rn in xrange(sheet.nrows) :
-                wr.writerow([ unicode(v).encode('utf-8', 'replace') for v in sheet.row_values(rn) ])
-            strIO.seek(0)
-
-            response = s3_client.upload_fileobj(
-                strIO,
-                current_app.config['AWS_DATA_BUCKET'],
-                '%s/%s' % ( str(project_id), csv_file_name )
-            )
-
-        if current_app.config['STORAGE_TYPE'] == 'file':
-            csv_path = os.path.join(current_app.config['STORAGE_PATH'], str(project_id), csv_file_name)
-            csv_file = open(csv_path, 'wb')
-            wr = csv.writer(csv_file, quoting=csv.QUOTE_ALL)
-            for rn in xrange(sheet.nrows) :
-                wr.writerow([ unicode(v).encode('utf-8') for v in sheet.row_values(rn) ])
-            csv_file.close()
-
-        file_doc = {
-            'file_title': csv_file_title,
-            'file_name': csv_file_name,
-            'path': csv_path,
-            'type': 'csv',
-            'orig_type': 'xls'
-        }
-        file_docs.append(file_doc)
+    # Named after the workbook rather than the upload, which may be compressed (foo.xlsx.gz)
+    workbook_name = '%s.%s' % (file_title, file_type)
+    try:
+        workbook_path = _get_local_path(file_obj, directory, workbook_name)
+        sheets = convert_workbook(workbook_path, file_type, directory,
+            row_limit=current_app.config['ROW_LIMIT'],
+            column_limit=current_app.config['COLUMN_LIMIT'],
+            num_processes=current_app.config.get('PARALLEL_PARSE_PROCESSES')
+        )
+
+        file_docs = []
+        for (sheet_name, sheet_path) in sheets:
+            csv_file_title = workbook_name + "_" + sheet_name
+            csv_file_name = csv_file_title + ".csv"
+            csv_path = storage.getPath(project_id, csv_file_name)
+            with open(sheet_path, 'rb') as csv_file:
+                file_doc = save_flat_table(project_id, csv_file, csv_file_title, csv_file_name, 'csv', csv_path, dialect=DEFAULT_DIALECT, encoding='utf-8')
+            file_doc['orig_type'] = 'xls'
+            file_docs.append(file_doc)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
     return file_docs
 
 
 def save_json_to_csv(project_id, file_obj, file_title, file_name, file_type, path):
-    f = open(path, 'rU')
-    json_data = json.load(f)
-
-    orig_type = file_name.rsplit('.', 1)[1]
+    '''
+    Persist a JSON array or JSON Lines file as a CSV dataset, converting it
+    record by record
+    '''
     csv_file_title = file_title
     csv_file_name = csv_file_title + ".csv"
-    csv_path = os.path.join(current_app.config['STORAGE_PATH'], project_id, csv_file_name)
-
-    csv_file = open(csv_path, 'wb')
-    wr = csv.writer(csv_file, quoting=csv.QUOTE_ALL)
-
-    header = json_data[0].keys()
-    num_rows = len(json_data)
-    num_cols = len(header)
-
-    if (num_rows > current_app.config['ROW_LIMIT']):
-        raise UploadTooLargeException('Uploaded file has {} rows, exceeding row limit of {}'.format(num_rows, current_app.config['ROW_LIMIT']))
-    elif (num_cols > current_app.config['COLUMN_LIMIT']):
-        raise UploadTooLargeException('Uploaded file has {} columns, exceeding row limit of {}'.format(num_cols, current_app.config['COLUMN_LIMIT']))
-
-    wr.writerow([v.encode('utf-8') for v in header])
-    for i in range(len(json_data)) :
-        row = []
-        for field in header :
-            row.append(json_data[i][field])
-        wr.writerow([unicode(v).encode('utf-8') for v in row])
-    csv_file.close()
-    file_doc = {
-        'title': csv_file_title,
-        'file_name': csv_file_name,
-        'path': csv_path,
-        'type': 'csv',
-        'orig_type': 'json'
-    }
+    storage = get_storage()
+    csv_path = storage.getPath(project_id, csv_file_name)
+
+    with tempfile.TemporaryFile() as csv_file:
+        file_obj.seek(0)
+        convert_json(file_obj, csv_file,
+            row_limit=current_app.config['ROW_LIMIT'],
+            column_limit=current_app.config['COLUMN_LIMIT']
+        )
+        file_doc = save_flat_table(project_id, csv_file, csv_file_title, csv_file_name, 'csv', csv_path, dialect=DEFAULT_DIALECT, encoding='utf-8')
+    file_doc['orig_type'] = file_type
     return file_doc
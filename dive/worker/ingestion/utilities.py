@@ -1,5 +1,12 @@
+import csv
+import json
 import numpy as np
 
+from dive.base.exceptions import UploadTooLargeException
+
+
+WRITE_BATCH_SIZE = 1000
+
 # Return unique elements from list while maintaining order in O(N)
 # http://stackoverflow.com/questions/480214/how-do-you-remove-duplicates-from-a-list-in-python-whilst-preserving-order
 def get_unique(li, preserve_order=False):
@@ -9,3 +16,41 @@ def get_unique(li, preserve_order=False):
         return [x for x in li if not (x in seen or seen_add(x))]
     else:
         return list(np.unique(li))
+
+
+def format_cell(value):
+    '''
+    UTF-8 CSV field of a cell value from a converted file
+    '''
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8', 'replace')
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False).encode('utf-8', 'replace')
+    return unicode(value).encode('utf-8', 'replace')
+
+
+def write_csv_rows(rows, csv_file, row_limit=None, column_limit=None):
+    '''
+    Write rows of cell values in batches, returning the number written.
+    Raises UploadTooLargeException as soon as a limit is exceeded.
+    '''
+    writer = csv.writer(csv_file, quoting=csv.QUOTE_ALL)
+    n_rows = 0
+    batch = []
+    for row in rows:
+        n_rows += 1
+        if row_limit and n_rows > row_limit:
+            raise UploadTooLargeException('Uploaded file exceeds row limit of {}'.format(row_limit))
+        if column_limit and len(row) > column_limit:
+            raise UploadTooLargeException('Uploaded file has {} columns, exceeding row limit of {}'.format(len(row), column_limit))
+
+        batch.append([ format_cell(v) for v in row ])
+        if len(batch) >= WRITE_BATCH_SIZE:
+            writer.writerows(batch)
+            batch = []
+    writer.writerows(batch)
+    return n_rows
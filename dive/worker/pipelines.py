@@ -6,10 +6,11 @@ from dive.worker.core import celery, task_app
 
 from dive.worker.handlers import worker_error_handler
 
-from dive.worker.ingestion.upload import save_dataset_to_db
+from dive.worker.ingestion.upload import save_dataframe, upload_spooled_file
 from dive.worker.ingestion.dataset_properties import compute_dataset_properties, save_dataset_properties
 from dive.worker.ingestion.field_properties import compute_all_field_properties, save_field_properties
 from dive.worker.ingestion.relationships import compute_relationships, save_relationships
+from dive.base.data.access import save_dataset_snapshot
 
 from dive.worker.transformation.reduce import reduce_dataset
 from dive.worker.transformation.join import join_datasets
@@ -60,19 +61,26 @@ class DIVETask(celery.Task):
         logger.error('Task {0!r} failed in on_failure: {1!r}'.format(task_id, exc))
 
 
+class PrefetchingDIVETask(DIVETask):
+    '''
+    Starts pulling the dataset of (dataset_id, project_id, ...) tasks into local
+    storage as soon as a worker receives them
+    '''
+    Strategy = 'dive.worker.prefetch:prefetch_strategy'
+
+
 @celery.task(bind=True, base=DIVETask)
 def reduce_pipeline(self, column_ids_to_keep, new_dataset_name_prefix, dataset_id, project_id):
     logger.info("In reduce pipeline with dataset_id %s and project_id %s", dataset_id, project_id)
 
     # Unpivot
     self.update_state(state=states.PENDING, meta={'desc': '(1/3) Reducing dataset'})
-    df_reduced, new_dataset_title, new_dataset_name, new_dataset_path = \
+    df_reduced, new_dataset_title, new_dataset_name = \
         reduce_dataset(project_id, dataset_id, column_ids_to_keep, new_dataset_name_prefix)
 
     # Save
     self.update_state(state=states.PENDING, meta={'desc': '(2/3) Saving reduced dataset'})
-    df_reduced.to_csv(new_dataset_path, sep='\t', index=False)
-    dataset_docs = save_dataset(project_id, new_dataset_title, new_dataset_name, 'tsv', new_dataset_path)
+    dataset_docs = save_dataframe(project_id, df_reduced, new_dataset_title, new_dataset_name)
     dataset_doc = dataset_docs[0]
     new_dataset_id = dataset_doc['id']
 
@@ -92,13 +100,12 @@ def join_pipeline(self, left_dataset_id, right_dataset_id, on, left_on, right_on
 
     # Unpivot
     self.update_state(state=states.PENDING, meta={'desc': '(1/3) Joining dataset'})
-    df_joined, new_dataset_title, new_dataset_name, new_dataset_path = \
+    df_joined, new_dataset_title, new_dataset_name = \
         join_datasets(project_id, left_dataset_id, right_dataset_id, on, left_on, right_on, how, left_suffix, right_suffix, new_dataset_name_prefix)
 
     # Save
     self.update_state(state=states.PENDING, meta={'desc': '(2/3) Saving joined dataset'})
-    df_joined.to_csv(new_dataset_path, sep='\t', index=False)
-    dataset_docs = save_dataset(project_id, new_dataset_title, new_dataset_name, 'tsv', new_dataset_path)
+    dataset_docs = save_dataframe(project_id, df_joined, new_dataset_title, new_dataset_name)
     dataset_doc = dataset_docs[0]
     new_dataset_id = dataset_doc['id']
 
@@ -118,13 +125,12 @@ def unpivot_pipeline(self, pivot_fields, variable_name, value_name, new_dataset_
 
     # Unpivot
     self.update_state(state=states.PENDING, meta={'desc': '(1/3) Unpivoting dataset'})
-    df_unpivoted, new_dataset_title, new_dataset_name, new_dataset_path = \
+    df_unpivoted, new_dataset_title, new_dataset_name = \
         unpivot_dataset(project_id, dataset_id, pivot_fields, variable_name, value_name, new_dataset_name_prefix)
 
     # Save
     self.update_state(state=states.PENDING, meta={'desc': '(2/3) Saving unpivoted dataset'})
-    df_unpivoted.to_csv(new_dataset_path, sep='\t', index=False)
-    dataset_docs = save_dataset(project_id, new_dataset_title, new_dataset_name, 'tsv', new_dataset_path)
+    dataset_docs = save_dataframe(project_id, df_unpivoted, new_dataset_title, new_dataset_name)
     dataset_doc = dataset_docs[0]
     new_dataset_id = dataset_doc['id']
 
@@ -150,7 +156,7 @@ def relationship_pipeline(self, project_id):
     return
 
 
-@celery.task(bind=True, base=DIVETask)
+@celery.task(bind=True, base=PrefetchingDIVETask)
 def viz_spec_pipeline(self, dataset_id, project_id, field_agg_pairs, recommendation_types, conditionals, config, SPEC_LIMIT=20):
     '''
     Enumerate, filter, score, and format viz specs in sequence
@@ -175,7 +181,7 @@ def viz_spec_pipeline(self, dataset_id, project_id, field_agg_pairs, recommendat
     return { 'result': saved_viz_specs }
 
 
-@celery.task(bind=True, base=DIVETask)
+@celery.task(bind=True, base=PrefetchingDIVETask)
 def ingestion_pipeline(self, dataset_id, project_id):
     '''
     Compute dataset and field properties in parallel
@@ -183,20 +189,47 @@ def ingestion_pipeline(self, dataset_id, project_id):
     TODO Accept multiple datasets?
     '''
     logger.info("In ingestion pipeline with dataset_id %s and project_id %s", dataset_id, project_id)
-    self.update_state(state=states.PENDING, meta={'desc': '(1/4) Computing dataset properties'})
+    self.update_state(state=states.PENDING, meta={'desc': '(1/5) Computing dataset properties'})
     dataset_properties = compute_dataset_properties(dataset_id, project_id)
 
-    self.update_state(state=states.PENDING, meta={'desc': '(2/4) Saving dataset properties'})
+    self.update_state(state=states.PENDING, meta={'desc': '(2/5) Saving dataset properties'})
     save_dataset_properties(dataset_properties, dataset_id, project_id)
 
-    self.update_state(state=states.PENDING, meta={'desc': '(3/4) Computing dataset field properties'})
+    self.update_state(state=states.PENDING, meta={'desc': '(3/5) Computing dataset field properties'})
     field_properties = compute_all_field_properties(dataset_id, project_id)
 
-    self.update_state(state=states.PENDING, meta={'desc': '(4/4) Saving dataset field properties'})
+    self.update_state(state=states.PENDING, meta={'desc': '(4/5) Saving dataset field properties'})
     result = save_field_properties(field_properties, dataset_id, project_id)
+
+    self.update_state(state=states.PENDING, meta={'desc': '(5/5) Saving columnar snapshot'})
+    save_dataset_snapshot(dataset_id, project_id)
     return result
 
 
+@celery.task(bind=True, base=DIVETask)
+def upload_pipeline(self, spooled_path, file_name, project_id, na_values=None):
+    '''
+    Detect the encoding and dialect of a spooled upload, persist it, and
+    ingest the resulting datasets
+    '''
+    logger.info("In upload pipeline with file %s and project_id %s", file_name, project_id)
+
+    self.update_state(state=states.PENDING, meta={'desc': '(1/2) Saving uploaded file'})
+    datasets = upload_spooled_file(project_id, spooled_path, file_name, na_values=na_values)
+
+    for (i, dataset) in enumerate(datasets):
+        self.update_state(state=states.PENDING, meta={'desc': '(2/2) Ingesting dataset %s of %s' % (i + 1, len(datasets))})
+        ingestion_pipeline.apply(args=[ dataset['id'], project_id ], throw=True)
+
+    dataset_ids = [ dataset['id'] for dataset in datasets ]
+    return {
+        'result': {
+            'id': dataset_ids[-1] if dataset_ids else None,
+            'ids': dataset_ids
+        }
+    }
+
+
 @celery.task(bind=True, base=DIVETask)
 def comparison_pipeline(self, spec, project_id, conditionals=[]):
     logger.info("In comparison pipeline with and project_id %s", project_id)
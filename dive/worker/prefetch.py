@@ -0,0 +1,113 @@
+'''
+Start pulling a dataset into local storage as soon as a worker receives a task
+that reads it
+
+Tasks whose base sets Strategy to prefetch_strategy hand their (dataset_id,
+project_id) arguments to a few background threads of the worker's main
+process when the message arrives, before it is dispatched to a pool child. Ingested datasets are read from
+their columnar snapshot, so a snapshot of the current content version is
+prefetched (into the shared cache and the page cache) instead of the raw file.
+Otherwise the storage backend's prefetch hook fills the host's S3 cache (or
+the page cache for files) with the raw file. Either way the transfer overlaps
+with queueing and the task's setup, and a pool child reading the same object
+meanwhile waits on the cache's per-key lock instead of downloading it again.
+'''
+import threading
+from Queue import Queue
+
+from celery.worker.strategy import default as default_strategy
+
+from dive.base.db import db_access
+from dive.base.data.storage import get_storage
+from dive.base.data.access import prefetch_snapshot
+from dive.worker.core import task_app
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def prefetch_dataset(project_id, dataset_id):
+    dataset = db_access.get_dataset(project_id, dataset_id)
+    if not dataset:
+        return
+    field_properties = db_access.get_field_properties(project_id, dataset_id)
+    if field_properties and prefetch_snapshot(dataset, project_id, field_properties):
+        logger.debug('Prefetched snapshot of dataset %s', dataset_id)
+        return
+    logger.debug('Prefetching dataset %s', dataset_id)
+    get_storage(dataset).prefetch(dataset, project_id)
+
+
+class datasetPrefetcher(object):
+    '''
+    Background threads prefetching queued datasets, each at most once at a time
+    '''
+    def __init__(self):
+        self.queue = Queue()
+        self.pending = set()
+        self.threads = []
+        self.lock = threading.Lock()
+
+    def enqueue(self, project_id, dataset_id):
+        key = (project_id, dataset_id)
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+            self._start_threads()
+        self.queue.put(key)
+
+    def _start_threads(self):
+        while len(self.threads) < task_app.config.get('PREFETCH_THREADS', 1):
+            thread = threading.Thread(target=self._run, name='dataset-prefetch')
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self):
+        while True:
+            key = self.queue.get()
+            try:
+                with task_app.app_context():
+                    prefetch_dataset(*key)
+            except Exception as e:
+                logger.error('Error prefetching dataset %s: %s', key[1], e, exc_info=True)
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+
+DatasetPrefetcher = datasetPrefetcher()
+
+
+def _get_message_arguments(message, body):
+    # Protocol 1 messages arrive decoded; protocol 2 bodies are (args, kwargs, embed)
+    if body is not None:
+        return body.get('args') or [], body.get('kwargs') or {}
+    args, kwargs = message.payload[:2]
+    return args or [], kwargs or {}
+
+
+def _get_dataset_arguments(args, kwargs):
+    dataset_id = kwargs.get('dataset_id', args[0] if len(args) > 0 else None)
+    project_id = kwargs.get('project_id', args[1] if len(args) > 1 else None)
+    return dataset_id, project_id
+
+
+def prefetch_strategy(task, app, consumer, **kwargs):
+    '''
+    Celery's default strategy, enqueueing a prefetch of the task's dataset
+    before handing the message on. Used by tasks taking (dataset_id, project_id, ...).
+    '''
+    handle_message = default_strategy(task, app, consumer, **kwargs)
+
+    def task_message_handler(message, body, ack, reject, callbacks, **handler_kwargs):
+        if task_app.config.get('PREFETCH_ON_RECEIVE'):
+            try:
+                dataset_id, project_id = _get_dataset_arguments(*_get_message_arguments(message, body))
+                if dataset_id is not None and project_id is not None:
+                    DatasetPrefetcher.enqueue(project_id, dataset_id)
+            except Exception as e:
+                logger.error('Error enqueueing prefetch of task %s: %s', task.name, e, exc_info=True)
+        return handle_message(message, body, ack, reject, callbacks, **handler_kwargs)
+
+    return task_message_handler
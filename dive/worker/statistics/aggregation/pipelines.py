@@ -2,7 +2,7 @@ import pandas as pd
 import numpy as np
 
 from dive.base.db import db_access
-from dive.base.data.access import get_data, get_conditioned_data
+from dive.base.data.access import get_data, get_conditioned_data, get_conditional_field_names
 from dive.worker.core import task_app
 from dive.worker.ingestion.utilities import get_unique
 from dive.worker.ingestion.binning import get_num_bins
@@ -36,7 +36,8 @@ def run_aggregation_from_spec(spec, project_id, config={}, conditionals=[]):
         subset_variables += [ weight_variable_name ]
     subset_variables = get_unique(subset_variables, preserve_order=True)
 
-    df = get_data(project_id=project_id, dataset_id=dataset_id)
+    conditional_field_names = get_conditional_field_names(project_id, dataset_id, conditionals)
+    df = get_data(project_id=project_id, dataset_id=dataset_id, columns=subset_variables + conditional_field_names)
     df_conditioned = get_conditioned_data(project_id, dataset_id, df, conditionals)
     df_subset = df_conditioned[ subset_variables ]
     df_ready = df_subset.dropna(how='all')  # Remove unclean
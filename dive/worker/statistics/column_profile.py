@@ -0,0 +1,146 @@
+'''
+Profile of a numeric column from one sort of its values
+
+Count, NA count, min, max, quantiles, unique values and histogram counts are
+all read off the sorted non-null values, instead of DataFrame.describe (which
+partitions the column once per percentile), np.unique and the contiguity and
+binning checks each making their own pass. Mean and variance use the same
+two-pass formulas as pandas, and quantiles the same interpolation as
+np.percentile, so the statistics equal those of describe.
+'''
+from __future__ import division
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+PROFILABLE_DTYPE_KINDS = 'iuf'
+
+
+def get_percentile_label(percentile):
+    # Same labels as DataFrame.describe
+    x = percentile * 100
+    if x == int(x):
+        return '%.0f%%' % x
+    return '%.1f%%' % x
+
+
+def is_profilable(values):
+    return values.dtype.kind in PROFILABLE_DTYPE_KINDS
+
+
+def _get_moments(values, null, count):
+    '''
+    Mean and variance (ddof=1) of the non-null values, as pandas' nanmean and
+    nanvar compute them: sums over the column with nulls replaced by 0
+    '''
+    if not count:
+        return np.nan, np.nan
+
+    is_float = (values.dtype.kind == 'f')
+    count_type = values.dtype.type if is_float else np.float64
+    floats = values if is_float else values.astype(np.float64)
+    if null is not None:
+        floats = floats.copy()
+        floats[null] = 0
+
+    total = floats.sum(dtype=np.float64)
+    if not is_float:
+        mean = values.sum(dtype=np.float64) / count_type(count)
+    elif values.dtype == np.float64:
+        mean = total / count_type(count)
+    else:
+        mean = floats.sum(dtype=values.dtype) / count_type(count)
+    if count <= 1:
+        return mean, np.nan
+
+    sqr = (total / count_type(count) - floats) ** 2
+    if null is not None:
+        sqr[null] = 0
+    var = sqr.sum(dtype=np.float64) / count_type(count - 1)
+    if is_float:
+        var = values.dtype.type(var)
+    return mean, var
+
+
+class ColumnProfile(object):
+    '''
+    Summary of an integer or float column (NaN marks nulls) computed from a
+    single sort of its non-null values
+    '''
+    def __init__(self, values):
+        values = np.asarray(values)
+        self.total_count = len(values)
+
+        null = np.isnan(values) if values.dtype.kind == 'f' else None
+        if null is not None and not null.any():
+            null = None
+        self.sorted_values = np.sort(values if null is None else values[~null])
+        self.count = len(self.sorted_values)
+        self.num_na = self.total_count - self.count
+        self.mean, self.var = _get_moments(values, null, self.count)
+
+        if self.count:
+            self.min, self.max = self.sorted_values[0], self.sorted_values[-1]
+        else:
+            self.min = self.max = np.nan
+
+        # As np.unique: the first of each run of equal sorted values
+        is_first = np.concatenate([ [ True ], self.sorted_values[1:] != self.sorted_values[:-1] ])
+        self.unique_values = self.sorted_values[is_first] if self.count else self.sorted_values
+
+    @property
+    def num_unique(self):
+        return len(self.unique_values)
+
+    def std(self):
+        return np.sqrt(self.var)
+
+    def quantiles(self, percentiles):
+        '''
+        Linear interpolation between closest ranks, as np.percentile
+        '''
+        if not self.count:
+            return [ np.nan for p in percentiles ]
+        q = (np.asarray(percentiles, dtype=float) * 100) / 100.0
+        indices = q * (self.count - 1)
+        indices_below = np.floor(indices).astype(np.intp)
+        indices_above = np.minimum(indices_below + 1, self.count - 1)
+        weights_above = indices - indices_below
+        weights_below = 1.0 - weights_above
+        return (self.sorted_values[indices_below] * weights_below + self.sorted_values[indices_above] * weights_above).tolist()
+
+    def describe(self, percentiles=[]):
+        '''
+        Statistics of DataFrame.describe for a numeric column, plus total_count
+        '''
+        percentiles = sorted(set(list(percentiles) + [ 0.5 ]))
+        stats = {
+            'count': float(self.count),
+            'mean': float(self.mean),
+            'std': float(self.std()),
+            'min': float(self.min),
+            'max': float(self.max),
+        }
+        for percentile, value in zip(percentiles, self.quantiles(percentiles)):
+            stats[get_percentile_label(percentile)] = value
+        stats['total_count'] = self.total_count
+        return stats
+
+    def is_contiguous(self):
+        '''
+        Whether consecutive unique values differ by at most 1
+        '''
+        return not np.any(np.abs(np.diff(self.unique_values)) > 1)
+
+    def bin_counts(self, bin_edges):
+        '''
+        Number of values in each bin of np.digitize(values, bin_edges,
+        right=False), for non-decreasing bin_edges. Bin numbers run from 0
+        (below the first edge) to len(bin_edges) (at or above the last).
+        '''
+        # digitize compares values and edges as floats
+        below_edges = np.searchsorted(self.sorted_values.astype(float), np.asarray(bin_edges, dtype=float), side='left')
+        return np.diff(np.concatenate([ [ 0 ], below_edges, [ self.count ] ]))
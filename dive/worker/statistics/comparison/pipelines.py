@@ -1,5 +1,5 @@
 from dive.base.db import db_access
-from dive.base.data.access import get_data, get_conditioned_data
+from dive.base.data.access import get_data, get_conditioned_data, get_conditional_field_names
 
 from dive.worker.statistics.comparison.numerical_comparison import run_valid_numerical_comparison_tests
 from dive.worker.statistics.comparison.anova import run_anova
@@ -25,7 +25,8 @@ def run_comparison_from_spec(spec, project_id, conditionals=[]):
     can_run_numerical_comparison = (can_run_numerical_comparison_dependent or can_run_numerical_comparison_independent)
 
     can_run_anova = (len(dependent_variables) and len(independent_variables))
-    df = get_data(project_id=project_id, dataset_id=dataset_id)
+    conditional_field_names = get_conditional_field_names(project_id, dataset_id, conditionals)
+    df = get_data(project_id=project_id, dataset_id=dataset_id, columns=dependent_variables_names + independent_variables_names + conditional_field_names)
     df_conditioned = get_conditioned_data(project_id, dataset_id, df, conditionals)
     df_subset = df_conditioned[ dependent_variables_names + independent_variables_names ]
     df_ready = df_subset.dropna(how='any')  # Remove unclean
@@ -12,7 +12,7 @@ from math import log10, floor
 from scipy.stats import ttest_ind
 
 from dive.base.db import db_access
-from dive.base.data.access import get_data, get_conditioned_data
+from dive.base.data.access import get_data, get_conditioned_data, get_conditional_field_names
 from dive.worker.core import task_app
 from dive.worker.ingestion.utilities import get_unique
 
@@ -25,7 +25,8 @@ def run_correlation_from_spec(spec, project_id, conditionals=[]):
     correlation_variables = spec.get("correlationVariables")
     correlation_variables_names = correlation_variables
 
-    df = get_data(project_id=project_id, dataset_id=dataset_id)
+    conditional_field_names = get_conditional_field_names(project_id, dataset_id, conditionals)
+    df = get_data(project_id=project_id, dataset_id=dataset_id, columns=correlation_variables_names + conditional_field_names)
     df = get_conditioned_data(project_id, dataset_id, df, conditionals)
 
     df_subset = df[ correlation_variables_names ]
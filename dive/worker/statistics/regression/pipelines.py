@@ -87,7 +87,7 @@ def load_data(dependent_variable_name, independent_variables_names, interaction_
                 independent_variables.append(field)
 
     # 2) Access dataset
-    df = get_data(project_id=project_id, dataset_id=dataset_id)
+    df = get_data(project_id=project_id, dataset_id=dataset_id, columns=[dependent_variable_name] + independent_variables_names)
 
     # Drop NAs
     df_subset = df[[dependent_variable_name] + independent_variables_names]
@@ -0,0 +1,204 @@
+'''
+Aggregations over sequences of DataFrame or Series chunks, in bounded memory
+
+Value counts and groupby sums/counts are merged exactly across chunks.
+Quantiles are estimated from a fixed-size uniform reservoir sample, which is
+exact whenever the column has no more values than the reservoir holds.
+'''
+from __future__ import division
+
+import numpy as np
+import pandas as pd
+
+from dive.worker.statistics.column_profile import get_percentile_label
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_SAMPLE_SIZE = 100000
+DEFAULT_MAX_UNIQUE = 1000
+
+
+class StreamingSketch(object):
+    '''
+    Single-pass summary of a numeric column: exact count, NA count, min, max,
+    mean and variance (merged with Chan's parallel algorithm), a reservoir
+    sample for quantiles, and the unique values while there are few of them.
+    '''
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE, max_unique=DEFAULT_MAX_UNIQUE):
+        self.sample_size = sample_size
+        self.max_unique = max_unique
+
+        self.total_count = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sample = np.array([], dtype=float)
+        self.unique_values = set()
+        self.too_many_unique = False
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        self.total_count += len(values)
+        values = values[~np.isnan(values)]
+        n = len(values)
+        if not n:
+            return self
+
+        chunk_mean = values.mean()
+        chunk_m2 = ((values - chunk_mean) ** 2).sum()
+        delta = chunk_mean - self.mean
+        total = self.count + n
+        self.mean += delta * n / total
+        self.m2 += chunk_m2 + (delta ** 2) * self.count * n / total
+
+        chunk_min, chunk_max = values.min(), values.max()
+        self.min = chunk_min if self.min is None else min(self.min, chunk_min)
+        self.max = chunk_max if self.max is None else max(self.max, chunk_max)
+
+        if not self.too_many_unique:
+            self.unique_values.update(np.unique(values).tolist())
+            if len(self.unique_values) > self.max_unique:
+                self.too_many_unique = True
+                self.unique_values = set()
+
+        self._update_sample(values)
+        self.count = total
+        return self
+
+    def _update_sample(self, values):
+        free = self.sample_size - len(self.sample)
+        if free > 0:
+            self.sample = np.concatenate([ self.sample, values[:free] ])
+            values = values[free:]
+            seen = self.count + free
+        else:
+            seen = self.count
+        if not len(values):
+            return
+
+        # Algorithm R, vectorized: item t (1-based) replaces a random slot with probability k / t
+        positions = seen + np.arange(1, len(values) + 1)
+        accepted = np.random.random(len(values)) < (self.sample_size / positions)
+        num_accepted = accepted.sum()
+        if num_accepted:
+            slots = np.random.randint(0, self.sample_size, size=num_accepted)
+            self.sample[slots] = values[accepted]
+
+    @property
+    def exact(self):
+        return self.count <= self.sample_size
+
+    @property
+    def num_unique(self):
+        return None if self.too_many_unique else len(self.unique_values)
+
+    def std(self, ddof=1):
+        if self.count <= ddof:
+            return np.nan
+        return np.sqrt(self.m2 / (self.count - ddof))
+
+    def quantiles(self, percentiles):
+        if not len(self.sample):
+            return [ np.nan for p in percentiles ]
+        return np.percentile(self.sample, [ p * 100 for p in percentiles ]).tolist()
+
+    def sample_with_extremes(self):
+        '''
+        Sample values including the exact min and max, for functions that
+        derive bin edges from a vector
+        '''
+        if self.min is None:
+            return pd.Series([], dtype=float)
+        return pd.Series(np.concatenate([ [ self.min ], self.sample, [ self.max ] ]))
+
+    def describe(self, percentiles=[]):
+        '''
+        Statistics of DataFrame.describe for a numeric column, plus total_count
+        '''
+        percentiles = sorted(set(list(percentiles) + [ 0.5 ]))
+        stats = {
+            'count': float(self.count),
+            'mean': self.mean if self.count else np.nan,
+            'std': self.std(),
+            'min': self.min if self.count else np.nan,
+            'max': self.max if self.count else np.nan,
+        }
+        for percentile, value in zip(percentiles, self.quantiles(percentiles)):
+            stats[get_percentile_label(percentile)] = value
+        stats['total_count'] = self.total_count
+        return stats
+
+
+def streaming_sketch(series_chunks, **kwargs):
+    sketch = StreamingSketch(**kwargs)
+    for chunk in series_chunks:
+        sketch.update(chunk)
+    return sketch
+
+
+def streaming_value_counts(series_chunks):
+    '''
+    Series.value_counts(sort=True, dropna=True) over the concatenation of
+    series_chunks, and the number of values read (nulls included)
+    '''
+    total_count = 0
+    value_counts = pd.Series([], dtype=np.int64)
+    for chunk in series_chunks:
+        total_count += len(chunk)
+        value_counts = value_counts.add(chunk.value_counts(dropna=True), fill_value=0)
+    value_counts = value_counts[value_counts > 0]
+    return value_counts.astype(np.int64).sort_values(ascending=False), total_count
+
+
+def streaming_describe_categorical(series_chunks):
+    '''
+    count / unique / top / freq, as DataFrame.describe returns for object
+    columns, plus total_count
+    '''
+    value_counts, total_count = streaming_value_counts(series_chunks)
+    return {
+        'count': int(value_counts.sum()),
+        'unique': len(value_counts),
+        'top': value_counts.index[0] if len(value_counts) else None,
+        'freq': int(value_counts.iloc[0]) if len(value_counts) else None,
+        'total_count': total_count
+    }
+
+
+streaming_agg_functions = [ 'count', 'sum', 'mean', 'min', 'max' ]
+def streaming_groupby_agg(chunks, group_by, agg_field, agg_fn, get_keys=None):
+    '''
+    Group rows of each chunk by group_by (column name(s)), or by the array
+    returned by get_keys(chunk), and merge the per-group aggregates of
+    agg_field across chunks. Returns a Series indexed by group.
+    '''
+    if agg_fn not in streaming_agg_functions:
+        raise ValueError('Aggregation function %s cannot be streamed' % agg_fn)
+
+    sums, counts, mins, maxs = [ pd.Series([], dtype=float) for i in range(4) ]
+    for chunk in chunks:
+        keys = get_keys(chunk) if get_keys else group_by
+        grouped = chunk[agg_field].groupby(keys, sort=False)
+        counts = counts.add(grouped.count(), fill_value=0)
+        if agg_fn in [ 'sum', 'mean' ]:
+            sums = sums.add(grouped.sum(), fill_value=0)
+        elif agg_fn == 'min':
+            mins = pd.concat([ mins, grouped.min() ]).groupby(level=0).min()
+        elif agg_fn == 'max':
+            maxs = pd.concat([ maxs, grouped.max() ]).groupby(level=0).max()
+
+    if agg_fn == 'count':
+        result = counts.astype(np.int64)
+    elif agg_fn == 'sum':
+        result = sums
+    elif agg_fn == 'mean':
+        result = sums / counts
+    elif agg_fn == 'min':
+        result = mins
+    elif agg_fn == 'max':
+        result = maxs
+    return result.sort_index()
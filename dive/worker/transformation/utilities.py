@@ -1,4 +1,4 @@
-import os
+from dive.base.data.storage import get_storage
 
 def list_elements_from_indices(li, indices):
     if not (type(indices) is list):
@@ -20,22 +20,20 @@ def difference_of_lists(li1, li2):
         return diff2
 
 
-def get_transformed_file_name(directory, prefix, fallback_title, original_dataset_title, dataset_type):
-    MAX_PATH_CHARS = 255
+def get_transformed_file_name(project_id, prefix, fallback_title, original_dataset_title, dataset_type):
+    MAX_NAME_CHARS = 255
+    storage = get_storage()
     title = original_dataset_title
     name = title + dataset_type
-    path = os.path.join(directory, name)
 
-    if path > MAX_PATH_CHARS:
+    if len(name) > MAX_NAME_CHARS:
         title = '%s %s' % (prefix, fallback_title)
         name = title + dataset_type
-        path = os.path.join(directory, name)
 
-    if os.path.exists(path):
+    if storage.exists(project_id, name):
         file_number = 0
-        while os.path.exists(path):
+        while storage.exists(project_id, name):
             title = '%s %s_%s' % (prefix, original_dataset_title, file_number)
             name = '%s%s' % (title, dataset_type)
-            path = os.path.join(directory, name)
             file_number = file_number + 1
-    return title, name, path
+    return title, name
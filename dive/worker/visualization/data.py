@@ -16,7 +16,8 @@ from flask import current_app
 
 from dive.base.db import db_access
 from dive.base.data.in_memory_data import InMemoryData as IMD
-from dive.base.data.access import get_data, get_conditioned_data
+from dive.base.data.access import get_data, get_conditioned_data, get_conditional_field_names, remove_unused_categories, DataChunks
+from dive.worker.statistics.streaming import streaming_sketch, streaming_value_counts, streaming_groupby_agg, streaming_agg_functions
 from dive.base.constants import GeneralDataType as GDT, DataType as DT
 from dive.worker.ingestion.type_detection import detect_time_series
 from dive.worker.ingestion.binning import get_bin_edges, get_bin_decimals, format_bin_edges_list, get_num_bins
@@ -62,6 +63,17 @@ def _get_derived_field(df, precomputed, label_descriptor):
     return result
 
 
+def drop_unobserved_groups(groupby, agg_df):
+    '''
+    Grouping by Categorical columns yields every category (and every combination
+    of categories, for several keys) whether or not it occurs in the data
+    '''
+    sizes = groupby.size()
+    if (sizes > 0).all():
+        return agg_df
+    return agg_df[(sizes.reindex(agg_df.index) > 0).values]
+
+
 def get_aggregated_df(groupby, aggregation_function_name):
     try:
         if aggregation_function_name == 'sum':
@@ -78,7 +90,7 @@ def get_aggregated_df(groupby, aggregation_function_name):
             agg_df = groupby.mean()
         elif aggregation_function_name == 'count':
             agg_df = groupby.count()
-        return agg_df
+        return drop_unobserved_groups(groupby, agg_df)
 
     except Exception as e:
         logger.error(e)
@@ -114,11 +126,24 @@ def get_viz_data_from_enumerated_spec(spec, project_id, conditionals, config, df
     logger.debug('Arguments: %s', args)
     start_time = time()
 
+    id_fields = [ fp for fp in db_access.get_field_properties(project_id, dataset_id) if fp['is_id']]
+
     if df is None:
-        df = get_data(project_id=project_id, dataset_id=dataset_id)
-        df = get_conditioned_data(project_id, dataset_id, df, conditionals)
+        spec_field_names = [ v['name'] for v in args.values() if isinstance(v, dict) and 'name' in v ]
+        id_field_names = [ id_field['name'] for id_field in id_fields ]
+        conditional_field_names = get_conditional_field_names(project_id, dataset_id, conditionals)
+
+        # Stream large unconditioned datasets through the procedures that support it
+        if (not conditional_field_names) and \
+            (gp in [ GeneratingProcedure.VAL_COUNT.value, GeneratingProcedure.BIN_AGG.value ]):
+            dataset_properties = db_access.get_dataset_properties(project_id, dataset_id)
+            if dataset_properties and \
+                (dataset_properties.get('n_rows') or 0) > current_app.config.get('STREAMING_ROW_THRESHOLD', 1000000):
+                df = DataChunks(project_id, dataset_id, columns=spec_field_names)
 
-    id_fields = [ fp for fp in db_access.get_field_properties(project_id, dataset_id) if fp['is_id']]
+    if df is None:
+        df = get_data(project_id=project_id, dataset_id=dataset_id, columns=spec_field_names + id_field_names + conditional_field_names)
+        df = get_conditioned_data(project_id, dataset_id, df, conditionals)
 
     generating_procedure_to_data_function = {
         GeneratingProcedure.AGG.value: get_agg_data,
@@ -336,6 +361,7 @@ def get_multigroup_count_data(df, args, id_fields=[], precomputed={}, config={},
     df = df.dropna(subset=[group_a_field_name, group_b_field_name])
 
     grouped_df = df.groupby([group_a_field_name, group_b_field_name], sort=False).size()
+    grouped_df = grouped_df[grouped_df > 0]
 
     results_as_data_array = []
     results_as_data_array_with_interval = []
@@ -507,9 +533,25 @@ def get_bin_agg_data(df, args, id_fields=[], precomputed={}, config={}, data_for
     agg_field_a = args['agg_field_a']['name']
     aggregation_function_name = args['agg_fn']
 
+    # Chunked input: sketch the binning field in one pass, aggregate per bin in a second
+    streaming = isinstance(df, DataChunks)
+    # ColumnProfile of the binning field, computed during ingestion
+    profile = precomputed.get('profiles', {}).get(binning_field)
+    if streaming and (general_type != GDT.Q.value or aggregation_function_name not in streaming_agg_functions):
+        df = df.to_frame(columns=[ binning_field, agg_field_a ])
+        streaming = False
+
     # Handling NAs
-    df_no_nas = df.dropna(subset=[ binning_field ])
-    binning_field_values = df_no_nas[binning_field]
+    if streaming:
+        binning_field_sketch = streaming_sketch(df.iter_column(binning_field))
+        binning_field_values = binning_field_sketch.sample_with_extremes()
+        num_rows = binning_field_sketch.total_count
+        num_binning_field_values = binning_field_sketch.count
+    else:
+        df_no_nas = df.dropna(subset=[ binning_field ])
+        binning_field_values = df_no_nas[binning_field]
+        num_rows = df.shape[0]
+        num_binning_field_values = len(binning_field_values)
 
     # Configuration
     data_config = config
@@ -521,9 +563,14 @@ def get_bin_agg_data(df, args, id_fields=[], precomputed={}, config={}, data_for
 
     # Max number of bins for integers is number of unique values
     if procedural:
-        num_bins = get_num_bins(binning_field_values, procedure=procedure)
+        num_bins = get_num_bins(binning_field_values, procedure=procedure, n=num_binning_field_values)
         if (args['binning_field']['type'] == DT.INTEGER.value):
-            MAX_NUM_BINS = len(np.unique(binning_field_values))
+            if streaming:
+                MAX_NUM_BINS = binning_field_sketch.num_unique or MAX_NUM_BINS
+            elif profile is not None:
+                MAX_NUM_BINS = profile.num_unique
+            else:
+                MAX_NUM_BINS = len(np.unique(binning_field_values))
         num_bins = min(num_bins, MAX_NUM_BINS)
 
     bin_edges_list = get_bin_edges(
@@ -537,17 +584,32 @@ def get_bin_agg_data(df, args, id_fields=[], precomputed={}, config={}, data_for
     bin_num_to_formatted_edges = formatted_bin_edges_object['bin_num_to_formatted_edges']  # {1: [left_edge, right_edge]}
     formatted_bin_edges_list = formatted_bin_edges_object['formatted_bin_edges_list']  # [(left_edge, right_edge)]
 
-    # Faster digitize? https://github.com/numpy/numpy/pull/4184
-    if general_type == GDT.Q.value:
-        df_bin_indices = np.digitize(binning_field_values, bin_edges_list, right=False)
-    elif general_type == GDT.T.value:
-        binning_field_values = binning_field_values.view('i8')
-        df_bin_indices = np.digitize(binning_field_values, pd.to_datetime(bin_edges_list).view('i8'), right=False)
-
-    groupby = df_no_nas.groupby(df_bin_indices, sort=True)
+    if streaming:
+        agg_series = streaming_groupby_agg(
+            (chunk.dropna(subset=[ binning_field ]) for chunk in df.iter_columns([ binning_field, agg_field_a ])),
+            None,
+            agg_field_a,
+            aggregation_function_name,
+            get_keys=lambda chunk: np.digitize(chunk[binning_field], bin_edges_list, right=False)
+        )
+        agg_df = pd.DataFrame({ agg_field_a: agg_series })
+    elif profile is not None and general_type == GDT.Q.value and aggregation_function_name == 'count' \
+        and agg_field_a == binning_field and np.all(np.diff(bin_edges_list) >= 0):
+        # Histogram of the field itself, from its sorted values
+        bin_counts = profile.bin_counts(bin_edges_list)
+        bin_nums = np.flatnonzero(bin_counts)
+        agg_df = pd.DataFrame({ agg_field_a: bin_counts[bin_nums] }, index=bin_nums)
+    else:
+        # Faster digitize? https://github.com/numpy/numpy/pull/4184
+        if general_type == GDT.Q.value:
+            df_bin_indices = np.digitize(binning_field_values, bin_edges_list, right=False)
+        elif general_type == GDT.T.value:
+            binning_field_values = binning_field_values.view('i8')
+            df_bin_indices = np.digitize(binning_field_values, pd.to_datetime(bin_edges_list).view('i8'), right=False)
 
+        groupby = df_no_nas.groupby(df_bin_indices, sort=True)
+        agg_df = get_aggregated_df(groupby, aggregation_function_name)
 
-    agg_df = get_aggregated_df(groupby, aggregation_function_name)
     agg_bins_to_values = agg_df[agg_field_a].to_dict()
     agg_values = agg_bins_to_values.values()
 
@@ -613,7 +675,7 @@ def get_bin_agg_data(df, args, id_fields=[], precomputed={}, config={}, data_for
             'data': table_data
         }
     if 'count' in data_formats:
-        final_data['count'] = df.shape[0]
+        final_data['count'] = num_rows
     return final_data
 
 def get_val_box_data(df, args, id_fields=[], precomputed={}, config={}, data_formats=['visualize']):
@@ -622,7 +684,7 @@ def get_val_box_data(df, args, id_fields=[], precomputed={}, config={}, data_for
     boxed_field_name = args['boxed_field']['name']
 
     df = df[[grouped_field_name, boxed_field_name]]
-    df = df.dropna(how='any', subset=[grouped_field_name, boxed_field_name])
+    df = remove_unused_categories(df.dropna(how='any', subset=[grouped_field_name, boxed_field_name]))
 
     if 'groupby' in precomputed and grouped_field_name in precomputed['groupby']:
         grouped_df = precomputed['groupby'][grouped_field_name]
@@ -769,8 +831,15 @@ def get_val_count_data(df, args, id_fields=[], precomputed={}, config={}, data_f
     final_data = {}
     field_a_label = args['field_a']['name']
 
-    values = df[field_a_label].dropna()
-    value_counts = values.value_counts(sort=True, dropna=True)
+    if isinstance(df, DataChunks):
+        value_counts, num_rows = streaming_value_counts(df.iter_column(field_a_label))
+    else:
+        num_rows = df.shape[0]
+        values = df[field_a_label].dropna()
+        value_counts = values.value_counts(sort=True, dropna=True)
+
+    # Categoricals count every category, including ones absent from these rows
+    value_counts = value_counts[value_counts > 0]
 
     subset = config.get('subset', 100)
     is_subset = False
@@ -795,7 +864,7 @@ def get_val_count_data(df, args, id_fields=[], precomputed={}, config={}, data_f
             'data': [[v, c] for (v, c) in zip(value_list, counts)]
         }
     if 'count' in data_formats:
-        final_data['count'] = df.shape[0]
+        final_data['count'] = num_rows
 
     final_data['subset'] = subset if (is_subset or subset == 'all') else None
 
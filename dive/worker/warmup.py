@@ -0,0 +1,55 @@
+'''
+Warm the host-wide dataset cache when a worker starts
+
+After a deploy the cache is cold, and the first request for each popular
+dataset would pay a full parse. Once the worker is ready, a background thread
+brings the datasets with the most (or most recent) accesses into the shared
+cache and the page cache, highest-ranked first, until WARMUP_MAX_BYTES is used.
+'''
+import threading
+
+from celery.signals import worker_ready
+
+from dive.base.db import db_access
+from dive.base.data.access import warm_dataset
+from dive.worker.core import task_app
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def warm_up_datasets(num_datasets, max_bytes, order_by='frequency'):
+    used_bytes = 0
+    warmed_dataset_ids = []
+    for dataset in db_access.get_hot_datasets(num_datasets, order_by=order_by):
+        if used_bytes >= max_bytes:
+            break
+        try:
+            size = warm_dataset(dataset['project_id'], dataset['id'], max_bytes=max_bytes - used_bytes)
+        except Exception as e:
+            logger.error('Error warming up dataset %s: %s', dataset['id'], e, exc_info=True)
+            continue
+        if size is not None:
+            used_bytes += size
+            warmed_dataset_ids.append(dataset['id'])
+    logger.info('Warmed up datasets %s (%s bytes)', warmed_dataset_ids, used_bytes)
+    return warmed_dataset_ids
+
+
+def _run_warm_up():
+    with task_app.app_context():
+        warm_up_datasets(
+            task_app.config['WARMUP_DATASETS'],
+            task_app.config['WARMUP_MAX_BYTES'],
+            order_by=task_app.config.get('WARMUP_ORDER', 'frequency')
+        )
+
+
+@worker_ready.connect
+def start_warm_up(sender=None, **kwargs):
+    # In a thread, so the worker starts taking tasks right away
+    if not task_app.config.get('WARMUP_DATASETS'):
+        return
+    thread = threading.Thread(target=_run_warm_up, name='dataset-warmup')
+    thread.daemon = True
+    thread.start()
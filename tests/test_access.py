@@ -0,0 +1,68 @@
+import io
+
+import mock
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+
+from dive.base.data import access
+from dive.base.data.row_index import build_row_index, RowIndex
+
+
+DIALECT = { 'delimiter': ',', 'quotechar': '"', 'escapechar': None, 'doublequote': True, 'lineterminator': '\r\n' }
+
+
+def _write_dataset(tmpdir, num_rows=200):
+    rng = np.random.RandomState(0)
+    lines = [ 'id,name,value,note' ]
+    for i in range(num_rows):
+        note = rng.choice([ '"multi\nline"', '5" tall', 'don\'t', '"a, ""b"""', '' ])
+        lines.append('%s,name %s,%s,%s' % (i, i % 7, rng.randn(), note))
+    path = str(tmpdir.join('data.csv'))
+    with open(path, 'wb') as f:
+        f.write('\n'.join(lines) + '\n')
+    dataset = { 'id': 1, 'dialect': DIALECT, 'encoding': 'utf-8', 'offset': None, 'na_values': None, 'compression': None }
+    return dataset, path
+
+
+def _read_parallel(dataset, path, row_index, usecols=None):
+    storage = mock.Mock()
+    storage.open.side_effect = lambda dataset, project_id, byte_range=None: open(path, 'rb')
+    app = mock.Mock(config={ 'PARALLEL_PARSE_PROCESSES': 3 })
+    with mock.patch.object(access, 'get_storage', return_value=storage), \
+        mock.patch.object(access, 'get_row_index', return_value=row_index), \
+        mock.patch.object(access, 'current_app', app):
+        serial_df = access._read_raw(dataset, 1, usecols=usecols)
+        return serial_df, access._read_raw_parallel(dataset, 1, path, usecols=usecols)
+
+
+def test_parallel_parse_equals_serial_parse(tmpdir):
+    dataset, path = _write_dataset(tmpdir)
+    with open(path, 'rb') as f:
+        row_index = build_row_index(f, DIALECT, interval=16)
+
+    serial_df, parallel_df = _read_parallel(dataset, path, row_index)
+    assert parallel_df is not None
+    assert len(serial_df) == 200
+    tm.assert_frame_equal(parallel_df, serial_df)
+
+    serial_df, parallel_df = _read_parallel(dataset, path, row_index, usecols=[ 'id', 'note' ])
+    tm.assert_frame_equal(parallel_df, serial_df)
+
+
+def test_mismatched_row_index_parses_serially(tmpdir):
+    dataset, path = _write_dataset(tmpdir)
+    with open(path, 'rb') as f:
+        row_index = build_row_index(f, DIALECT, interval=16)
+
+    # Row count of another version of the file
+    stale_index = RowIndex(row_index.offsets, row_index.interval, row_index.n_rows + 1, row_index.data_offset)
+    assert _read_parallel(dataset, path, stale_index)[1] is None
+
+    # Offsets inside quoted fields, as an index built without regard for quotes
+    with open(path, 'rb') as f:
+        content = f.read()
+    misplaced_offsets = row_index.offsets.copy()
+    misplaced_offsets[1:] = [ content.index(b'line"', offset) for offset in row_index.offsets[1:] ]
+    misplaced_index = RowIndex(misplaced_offsets, row_index.interval, row_index.n_rows, row_index.data_offset)
+    assert _read_parallel(dataset, path, misplaced_index)[1] is None
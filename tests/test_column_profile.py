@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dive.worker.statistics.column_profile import ColumnProfile
+
+
+PERCENTILES = [ (i * .5) / 10 for i in range(1, 20) ]
+
+
+def _columns():
+    rng = np.random.RandomState(0)
+    floats = rng.randn(1000) * 100
+    floats[rng.randint(0, 1000, 100)] = np.nan
+    return [
+        ('ints', rng.randint(-50, 50, 1000)),
+        ('large ints', rng.randint(0, 2 ** 40, 1000).astype(np.int64) * 1000),
+        ('uints', rng.randint(0, 10, 1000).astype(np.uint8)),
+        ('contiguous ints', np.arange(20)[::-1].repeat(3)),
+        ('floats', rng.randn(1000)),
+        ('floats with nan', floats),
+        ('float32', rng.randn(1000).astype(np.float32) * 1000),
+        ('float32 with nan', floats.astype(np.float32)),
+        ('ties', np.array([ 1.5, 1.5, 1.5, 2.5, 2.5, np.nan ])),
+        ('all nan', np.array([ np.nan ] * 10)),
+        ('all nan float32', np.array([ np.nan ] * 10, dtype=np.float32)),
+        ('single value', np.array([ 7 ] * 10)),
+        ('single float value', np.array([ 0.1 ] * 10 + [ np.nan ])),
+        ('single float32 value', np.array([ 0.1 ] * 10, dtype=np.float32)),
+        ('one row', np.array([ 3.25 ])),
+    ]
+
+COLUMNS = _columns()
+IDS = [ name for (name, values) in COLUMNS ]
+VALUES = [ values for (name, values) in COLUMNS ]
+
+
+def _non_null(values):
+    return values[~np.isnan(values)] if values.dtype.kind == 'f' else values
+
+
+def _assert_same(actual, expected):
+    assert (actual == expected) or (np.isnan(actual) and np.isnan(expected)), (actual, expected)
+
+
+@pytest.mark.parametrize('values', VALUES, ids=IDS)
+def test_describe_equals_dataframe_describe(values):
+    stats = ColumnProfile(values).describe(percentiles=PERCENTILES)
+
+    df = pd.DataFrame(values)
+    expected = df.describe(percentiles=PERCENTILES).to_dict().values()[0]
+    expected['total_count'] = df.shape[0]
+
+    assert sorted(stats.keys()) == sorted(expected.keys())
+    for (key, value) in expected.items():
+        _assert_same(stats[key], value)
+
+
+@pytest.mark.parametrize('values', VALUES, ids=IDS)
+def test_unique_values_and_contiguity_equal_np_unique(values):
+    profile = ColumnProfile(values)
+    unique_values = np.unique(_non_null(values))
+
+    assert profile.unique_values.tolist() == unique_values.tolist()
+    assert profile.unique_values.dtype == values.dtype
+    assert profile.num_unique == len(unique_values)
+    assert profile.is_contiguous() == (not np.any(np.abs(np.diff(unique_values)) > 1))
+    assert profile.count == len(_non_null(values))
+    assert profile.num_na == len(values) - profile.count
+
+
+def _edges(values):
+    non_null = _non_null(values).astype(float)
+    if not len(non_null):
+        return [ [ 0.0, 1.0 ] ]
+    (low, high) = (non_null.min(), non_null.max())
+    return [
+        np.linspace(low, high, 11),
+        np.linspace(low - 1, high + 1, 4),
+        [ low ],
+        [ high ],
+        [ low, low, high, high ],
+        [ high + 1, high + 2 ],
+        [ low - 2, low - 1 ],
+        np.unique(non_null)[:5],
+        # Between float32 neighbours, where comparing in float32 would differ
+        [ np.float64(np.float32(0.1)) + 1e-12, 0.1 ],
+    ]
+
+
+@pytest.mark.parametrize('values', VALUES, ids=IDS)
+def test_bin_counts_equal_np_digitize(values):
+    profile = ColumnProfile(values)
+    non_null = _non_null(values)
+    for bin_edges in _edges(values):
+        bin_edges = sorted(bin_edges)
+        expected = np.bincount(np.digitize(non_null, bin_edges, right=False), minlength=len(bin_edges) + 1)
+        assert profile.bin_counts(bin_edges).tolist() == expected.tolist(), bin_edges
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+
+from dive.base.data.columnar import write_columnar, read_columnar, read_columnar_meta, iter_columnar, get_columnar_files
+
+
+def _get_frame():
+    return pd.DataFrame({
+        'text': [ u'a', np.nan, u'', u'caf\xe9', u'文字', u'z' * 1000, np.nan ],
+        'bytes': [ b'a', b'b', np.nan, b'', b'\xff\xfe', b'c', b'd' ],
+        'mixed': [ u'a', 1, 2.5, None, u'b', u'c', u'd' ],
+        'number': np.arange(7, dtype=float),
+        'category': pd.Series(list('xyxyxyx')).astype('category'),
+    }, columns=[ 'text', 'bytes', 'mixed', 'number', 'category' ])
+
+
+def test_round_trip(tmpdir):
+    directory = str(tmpdir.join('snapshot'))
+    df = _get_frame()
+    meta = write_columnar(df, directory)
+
+    assert [ c['kind'] for c in meta['columns'] ] == [ 'strings', 'strings', 'object', 'array', 'category' ]
+    assert sorted(get_columnar_files(meta)) == sorted(f for f in os.listdir(directory) if f != 'meta.json')
+    tm.assert_frame_equal(read_columnar(directory), df)
+    assert [ type(v) for v in read_columnar(directory)['text'].dropna() ] == [ unicode ] * 5
+    assert [ type(v) for v in read_columnar(directory)['bytes'].dropna() ] == [ str ] * 6
+
+
+def test_row_ranges(tmpdir):
+    directory = str(tmpdir.join('snapshot'))
+    df = _get_frame()
+    write_columnar(df, directory)
+
+    for (start, stop) in [ (0, 1), (1, 4), (3, 7), (6, None), (None, 2), (5, 5), (7, 9) ]:
+        expected = df.iloc[slice(start, stop)]
+        tm.assert_frame_equal(read_columnar(directory, start=start, stop=stop), expected)
+        tm.assert_frame_equal(read_columnar(directory, columns=[ 'text' ], start=start, stop=stop), expected[[ 'text' ]])
+
+
+def test_iter_chunks(tmpdir):
+    directory = str(tmpdir.join('snapshot'))
+    df = _get_frame()
+    write_columnar(df, directory)
+
+    chunks = list(iter_columnar(directory, 3))
+    assert [ len(chunk) for chunk in chunks ] == [ 3, 3, 1 ]
+    tm.assert_frame_equal(pd.concat(chunks), df)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from dive.base.data.conditionals import get_clauses, compile_mask
+from dive.base.data.indexes import build_categorical_index
+
+
+def _get_mask(df, field, operation, criteria, get_index=None):
+    conditionals = { 'and': [ { 'field_id': field['id'], 'operation': operation, 'criteria': criteria } ] }
+    return compile_mask(df, get_clauses(conditionals, [ field ]), get_index=get_index).tolist()
+
+
+def test_year_field_stored_as_integers():
+    df = pd.DataFrame({ 'year': [ 1999, 2000, 2001, 2002 ] })
+    field = { 'id': 1, 'name': 'year', 'general_type': 't', 'type': 'year' }
+
+    assert _get_mask(df, field, '==', '2000') == [ False, True, False, False ]
+    assert _get_mask(df, field, '>=', '2001') == [ False, False, True, True ]
+    assert _get_mask(df, field, 'in', [ '1999', 2002 ]) == [ True, False, False, True ]
+    assert _get_mask(df, field, 'not in', [ '1999' ]) == [ False, True, True, True ]
+
+
+def test_datetime_field():
+    df = pd.DataFrame({ 'date': pd.to_datetime([ '2016-01-01', '2016-06-01', '2017-01-01' ]) })
+    field = { 'id': 1, 'name': 'date', 'general_type': 't', 'type': 'datetime' }
+
+    assert _get_mask(df, field, '<', '2016-06-01') == [ True, False, False ]
+    assert _get_mask(df, field, '==', '2016-06-01T00:00:00') == [ False, True, False ]
+    assert _get_mask(df, field, 'in', [ '2016-01-01', '2017-01-01' ]) == [ True, False, True ]
+    assert _get_mask(df, field, 'not in', [ '2016-01-01' ]) == [ False, True, True ]
+
+
+def test_numeric_field_with_string_criteria():
+    df = pd.DataFrame({ 'x': [ 1.5, 2.0, np.nan ] })
+    field = { 'id': 1, 'name': 'x', 'general_type': 'q', 'type': 'decimal' }
+
+    assert _get_mask(df, field, '>', '1.5') == [ False, True, False ]
+    assert _get_mask(df, field, 'in', [ '2' ]) == [ False, True, False ]
+
+
+def test_categorical_index_of_numbers():
+    df = pd.DataFrame({ 'code': pd.Series([ 10, 20, 10, 30 ]).astype('category') })
+    field = { 'id': 1, 'name': 'code', 'general_type': 'c', 'type': 'integer' }
+    index = build_categorical_index(df['code'], [ 10, 20, 30 ])
+
+    assert _get_mask(df, field, 'in', [ '10', '30' ]) == [ True, False, True, True ]
+    assert _get_mask(df, field, 'in', [ '10', '30' ], get_index=lambda name: index) == [ True, False, True, True ]
+    assert _get_mask(df, field, '!=', '10', get_index=lambda name: index) == [ False, True, False, True ]
+
+
+def test_string_field():
+    df = pd.DataFrame({ 'name': [ 'a', 'b', '1' ] })
+    field = { 'id': 1, 'name': 'name', 'general_type': 'c', 'type': 'string' }
+
+    assert _get_mask(df, field, '==', 1) == [ False, False, True ]
+    assert _get_mask(df, field, 'not in', [ 'a' ]) == [ False, True, True ]
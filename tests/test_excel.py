@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import os
+
+import mock
+from openpyxl import Workbook
+
+from dive.worker.ingestion import excel
+
+
+def _write_workbook(path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = 'first'
+    sheet.append([ 'name', 'value' ])
+    for i in range(50):
+        sheet.append([ u'caf\xe9 %s' % (i % 5), i ])
+    workbook.create_sheet(title='empty')
+    last = workbook.create_sheet(title='last')
+    for i in range(30):
+        last.append([ 'shared %s' % (i % 3), i * 1.5 ])
+    workbook.save(path)
+
+
+def _convert(workbook_path, directory, num_processes):
+    os.mkdir(directory)
+    sheets = excel.convert_workbook(workbook_path, 'xlsx', directory, num_processes=num_processes)
+    contents = []
+    for (sheet_name, csv_path) in sheets:
+        with open(csv_path, 'rb') as f:
+            contents.append((sheet_name, f.read()))
+    return contents
+
+
+def test_sheets_converted_in_processes_from_one_workbook(tmpdir):
+    workbook_path = str(tmpdir.join('book.xlsx'))
+    _write_workbook(workbook_path)
+    serial = _convert(workbook_path, str(tmpdir.join('serial')), 1)
+
+    # Loads are logged to a file, which forked workers append to as well
+    log_path = str(tmpdir.join('loads'))
+    load_workbook = excel.load_workbook
+    def logged_load_workbook(*args, **kwargs):
+        with open(log_path, 'a') as f:
+            f.write('%s\n' % os.getpid())
+        return load_workbook(*args, **kwargs)
+
+    with mock.patch.object(excel, 'load_workbook', logged_load_workbook):
+        parallel = _convert(workbook_path, str(tmpdir.join('parallel')), 3)
+
+    assert parallel == serial
+    assert [ sheet_name for (sheet_name, content) in serial ] == [ 'first', 'last' ]
+    assert serial[0][1].splitlines()[:2] == [ '"name","value"', '"caf\xc3\xa9 0","0"' ]
+    with open(log_path) as f:
+        assert f.read().splitlines() == [ str(os.getpid()) ]
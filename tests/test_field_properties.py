@@ -0,0 +1,45 @@
+import billiard
+import numpy as np
+import pandas as pd
+
+from dive.base.pool import get_pool
+from dive.worker.ingestion.field_properties import _map_fields, _compute_field_property_type
+
+
+def _get_frame():
+    rng = np.random.RandomState(0)
+    return pd.DataFrame({
+        'a': rng.randn(200),
+        'b': rng.choice([ 'x', 'y', 'z' ], 200),
+        'c': rng.randint(1990, 2010, 200),
+        'd': [ '2016-01-%02d' % (i % 28 + 1) for i in range(200) ],
+    })
+
+
+def _map_in_daemon(df, tasks, num_processes, queue):
+    pool = get_pool(num_processes)
+    pool_type = type(pool).__name__
+    pool.close()
+    pool.join()
+    queue.put((billiard.current_process().daemon, pool_type, _map_fields(_compute_field_property_type, df, tasks, num_processes)))
+
+
+def test_map_fields_in_daemonic_process():
+    '''
+    Celery prefork children are daemonic: fields are still mapped in a process pool
+    '''
+    df = _get_frame()
+    tasks = [ (i, field_name, len(df.columns)) for (i, field_name) in enumerate(df) ]
+    expected = _map_fields(_compute_field_property_type, df, tasks, 1)
+
+    queue = billiard.Queue()
+    process = billiard.Process(target=_map_in_daemon, args=(df, tasks, 2, queue))
+    process.daemon = True
+    process.start()
+    is_daemon, pool_type, result = queue.get(timeout=60)
+    process.join()
+
+    assert is_daemon
+    assert pool_type == 'Pool'
+    # Type scores come from a random sample of values, types do not
+    assert [ (r['type'], r['general_type']) for r in result ] == [ (r['type'], r['general_type']) for r in expected ]
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+
+import mock
+import pytest
+
+from dive.base.exceptions import UploadTooLargeException
+from dive.worker.ingestion import json_records
+from dive.worker.ingestion.json_records import iter_json_records
+
+
+RECORDS = [
+    { 'a': 1, 'b': u'caf\xe9' },
+    { 'a': [ 1, { 'c': '}]' } ], 'b': 'quote " and backslash \\ and {[' },
+    { 'b': 'x' * 50, 'a': None },
+    'scalar',
+    12.5,
+    True,
+    [ 1, 2 ],
+]
+
+
+def _records(content, chunk_size, **kwargs):
+    return list(iter_json_records(io.BytesIO(content), chunk_size=chunk_size, **kwargs))
+
+
+@pytest.mark.parametrize('chunk_size', [ 1, 2, 3, 7, 64, 1024 ])
+def test_array_and_lines(chunk_size):
+    array = json.dumps(RECORDS, ensure_ascii=False).encode('utf-8')
+    lines = '\n'.join(json.dumps(r) for r in RECORDS).encode('utf-8')
+    assert _records(array, chunk_size) == RECORDS
+    assert _records(b'\xef\xbb\xbf  ' + array + b'\n', chunk_size) == RECORDS
+    assert _records(lines, chunk_size) == RECORDS
+    assert _records(b'[]', chunk_size) == []
+    assert _records(b'', chunk_size) == []
+
+
+@pytest.mark.parametrize('content', [
+    b'[{"a": 1}, {"a": 1,, "b": 2}, ' + b'{"a": 3}, ' * 10000 + b'{}]',
+    b'{"a": tru}\n' + b'{"a": 3}\n' * 10000,
+    b'{"a" 1}\n{"a": 2}',
+    b'nope\n{"a": 2}',
+])
+def test_invalid_record_raises_without_reading_rest(content):
+    file_obj = io.BytesIO(content)
+    records = iter_json_records(file_obj, chunk_size=64)
+    with pytest.raises(ValueError):
+        list(records)
+    assert file_obj.tell() <= 128
+
+
+@pytest.mark.parametrize('content', [ b'[{"a": 1}, {"a": 2', b'{"a": "b\n', b'{"a": 1}\n[1, 2' ])
+def test_truncated_file_raises(content):
+    with pytest.raises(ValueError):
+        _records(content, 4)
+
+
+def test_record_over_max_size():
+    content = json.dumps([ { 'a': 'x' * 1000 } ]).encode('utf-8')
+    with pytest.raises(UploadTooLargeException):
+        _records(content, 100, max_record_size=500)
+    assert _records(content, 100, max_record_size=2000) == [ { 'a': 'x' * 1000 } ]
+
+
+def test_large_record_decoded_once():
+    record = { 'a': [ 'x' * 100 ] * 1000 }
+    content = json.dumps([ record, record ]).encode('utf-8')
+    decoder = json_records.json.JSONDecoder()
+    with mock.patch.object(json_records.json, 'JSONDecoder', return_value=decoder), \
+        mock.patch.object(decoder, 'raw_decode', wraps=decoder.raw_decode) as raw_decode:
+        assert _records(content, 1000) == [ record, record ]
+    # Once from the first chunk of each record, once when complete
+    assert raw_decode.call_count == 4
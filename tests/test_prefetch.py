@@ -0,0 +1,51 @@
+import mock
+import pandas as pd
+
+from dive.base.data import access
+from dive.base.data.columnar import write_columnar
+from dive.worker import prefetch
+
+
+DATASET = { 'id': 1, 'version': 2, 'preloaded': False, 'file_name': 'foo.csv' }
+FIELD_PROPERTIES = [ { 'index': 0, 'name': 'a', 'type': 'integer' } ]
+
+
+def _prefetch(storage, field_properties=FIELD_PROPERTIES):
+    with mock.patch.object(prefetch.db_access, 'get_dataset', return_value=DATASET), \
+        mock.patch.object(prefetch.db_access, 'get_field_properties', return_value=field_properties), \
+        mock.patch.object(prefetch, 'get_storage', return_value=storage), \
+        mock.patch.object(access, 'get_storage', return_value=storage):
+        prefetch.prefetch_dataset(1, DATASET['id'])
+
+
+def _local_storage(snapshot_path):
+    storage = mock.Mock(is_local=True)
+    storage.getLocalPath.return_value = snapshot_path
+    return storage
+
+
+def test_current_snapshot_prefetched_instead_of_raw_file(tmpdir):
+    snapshot_path = str(tmpdir.join('foo.csv.columnar'))
+    write_columnar(pd.DataFrame({ 'a': [ 1, 2 ] }), snapshot_path,
+        attrs={ 'content_version': access.get_content_version(DATASET, FIELD_PROPERTIES) })
+    storage = _local_storage(snapshot_path)
+
+    with mock.patch.object(access, 'read_through_columnar') as read_through_columnar:
+        _prefetch(storage)
+    read_through_columnar.assert_called_once_with(snapshot_path)
+    assert not storage.prefetch.called
+
+
+def test_stale_snapshot_falls_back_to_raw_file(tmpdir):
+    snapshot_path = str(tmpdir.join('foo.csv.columnar'))
+    write_columnar(pd.DataFrame({ 'a': [ 1, 2 ] }), snapshot_path, attrs={ 'content_version': 'v1-stale' })
+    storage = _local_storage(snapshot_path)
+
+    _prefetch(storage)
+    storage.prefetch.assert_called_once_with(DATASET, 1)
+
+
+def test_dataset_without_field_properties_prefetches_raw_file():
+    storage = _local_storage(None)
+    _prefetch(storage, field_properties=[])
+    storage.prefetch.assert_called_once_with(DATASET, 1)
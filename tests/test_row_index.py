@@ -0,0 +1,65 @@
+import io
+
+import pandas as pd
+import pytest
+
+from dive.base.data.row_index import build_row_index
+
+
+DIALECT = { 'delimiter': ',', 'quotechar': '"', 'escapechar': None, 'doublequote': True }
+
+
+def _read(content, dialect, **kwargs):
+    return pd.read_csv(io.BytesIO(content), sep=dialect['delimiter'], quotechar=dialect['quotechar'],
+        escapechar=dialect['escapechar'], doublequote=dialect['doublequote'], **kwargs)
+
+
+def _check_index(content, dialect=DIALECT, interval=2):
+    '''
+    Index the content in blocks of every size, and check each indexed offset
+    starts the row the parser reads at that position
+    '''
+    df = _read(content, dialect, dtype=object)
+    for block_size in [ 1, 2, 3, 5, 8, len(content) ]:
+        row_index = build_row_index(io.BytesIO(content), dialect, interval=interval, block_size=block_size)
+        assert row_index.n_rows == len(df)
+        assert len(row_index.offsets) == (len(df) + interval - 1) // interval
+        for (i, offset) in enumerate(row_index.offsets):
+            row = _read(content[offset:], dialect, header=None, names=df.columns.tolist(), nrows=1, dtype=object)
+            assert row.iloc[0].tolist() == df.iloc[i * interval].tolist()
+    return row_index
+
+
+def test_quoted_fields():
+    content = b'a,b\n1,"x\ny"\n2,"say ""hi""\nthere"\n3,z\n4,"\n"\n5,w\n'
+    _check_index(content)
+
+
+@pytest.mark.parametrize('content', [
+    b'a,b\n1,5" tall\n2,x\n3,y\n4,z\n',
+    b'a,b\n1,don\'t\n2,x\n3,"y\nz"\n4,w\n',
+    b'a,b\n1,6" x 8" board\n2,"q,\nr"\n3,y\n4,it\'s "ok"\n5,v\n',
+    b'a,b\n1,"closed"trailing\n2,x\n3,y\n',
+])
+def test_stray_quotes_in_unquoted_fields(content):
+    _check_index(content)
+
+
+def test_escapechar():
+    dialect = dict(DIALECT, escapechar='\\', doublequote=False)
+    content = b'a,b\n1,"x \\" y"\n2,"line\nbreak \\""\n3,z\n4,\\"w\n5,v\n'
+    _check_index(content, dialect)
+
+
+def test_crlf():
+    content = b'a,b\r\n1,"x\r\ny"\r\n\r\n2,5" tall\r\n3,z\r\n4,w'
+    row_index = _check_index(content)
+    assert row_index.n_rows == 4
+
+
+def test_header_offset():
+    content = b'title\na,b\n1,x\n2,"y\n"\n3,z\n'
+    row_index = build_row_index(io.BytesIO(content), DIALECT, offset=1, interval=1, block_size=4)
+    assert row_index.n_rows == 3
+    assert row_index.data_offset == content.index(b'1,x')
+    assert row_index.offsets.tolist() == [ content.index(b'1,x'), content.index(b'2,'), content.index(b'3,z') ]
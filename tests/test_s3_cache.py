@@ -0,0 +1,120 @@
+import io
+import os
+
+import mock
+import pytest
+
+from dive.base.data.s3_cache import s3ObjectCache, ETAG_SUFFIX
+from dive.base.data.local_s3 import LocalS3Client
+from dive.base.data.storage import LocalS3Storage
+
+BUCKET = 'bucket'
+
+
+@pytest.fixture
+def client(tmpdir):
+    return LocalS3Client(str(tmpdir.join('s3')))
+
+
+@pytest.fixture
+def cache(tmpdir):
+    cache = s3ObjectCache()
+    cache.configure(cache_path=str(tmpdir.join('cache')))
+    return cache
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _rewrite(client, key, content):
+    # Move the mtime on, so the object's ETag changes even within a clock tick
+    client.put_object(Bucket=BUCKET, Key=key, Body=content)
+    path = client.getObjectPath(BUCKET, key)
+    mtime = os.stat(path).st_mtime + 10
+    os.utime(path, (mtime, mtime))
+
+
+def test_cache_hit(client, cache):
+    client.put_object(Bucket=BUCKET, Key='1/a.csv', Body=b'a,b\n1,2\n')
+    assert cache.getValidPath(client, BUCKET, '1/a.csv') is None
+
+    with mock.patch.object(client, 'get_object', wraps=client.get_object) as get_object:
+        path = cache.getPath(client, BUCKET, '1/a.csv')
+        assert cache.getPath(client, BUCKET, '1/a.csv') == path
+        assert cache.getValidPath(client, BUCKET, '1/a.csv') == path
+
+    assert get_object.call_count == 1
+    assert _read(path) == b'a,b\n1,2\n'
+    assert (cache.misses, cache.hits) == (1, 2)
+
+
+def test_stale_etag_revalidated(client, cache):
+    client.put_object(Bucket=BUCKET, Key='1/a.csv', Body=b'a,b\n1,2\n')
+    path = cache.getPath(client, BUCKET, '1/a.csv')
+
+    _rewrite(client, '1/a.csv', b'a,b\n3,4\n')
+    assert cache.getValidPath(client, BUCKET, '1/a.csv') is None
+
+    assert cache.getPath(client, BUCKET, '1/a.csv') == path
+    assert _read(path) == b'a,b\n3,4\n'
+    assert _read(path + ETAG_SUFFIX) == client.head_object(Bucket=BUCKET, Key='1/a.csv')['ETag']
+    assert (cache.misses, cache.hits) == (2, 0)
+
+
+def test_write_through_skips_download(client, cache):
+    client.put_object(Bucket=BUCKET, Key='1/a.csv', Body=b'a,b\n1,2\n')
+    etag = client.head_object(Bucket=BUCKET, Key='1/a.csv')['ETag']
+    cache.putFileobj(BUCKET, '1/a.csv', io.BytesIO(b'a,b\n1,2\n'), etag)
+
+    with mock.patch.object(client, 'get_object') as get_object:
+        path = cache.getPath(client, BUCKET, '1/a.csv')
+    assert not get_object.called
+    assert _read(path) == b'a,b\n1,2\n'
+
+
+def test_least_recently_used_evicted(client, cache):
+    cache.configure(cache_path=cache.cache_path, max_bytes=25)
+    for key in [ 'a', 'b', 'c' ]:
+        client.put_object(Bucket=BUCKET, Key=key, Body=key * 10)
+
+    path_a = cache.getPath(client, BUCKET, 'a')
+    path_b = cache.getPath(client, BUCKET, 'b')
+    os.utime(path_a, (1000, 1000))
+    os.utime(path_b, (2000, 2000))
+
+    # A hit makes a the most recently used, so b goes when c is added
+    cache.getPath(client, BUCKET, 'a')
+    path_c = cache.getPath(client, BUCKET, 'c')
+
+    assert os.path.isfile(path_a) and os.path.isfile(path_c)
+    assert not os.path.exists(path_b)
+    assert not os.path.exists(path_b + ETAG_SUFFIX)
+    assert cache.evictions == 1
+    assert cache.getValidPath(client, BUCKET, 'b') is None
+
+
+def test_entry_being_added_not_evicted(client, cache):
+    cache.configure(cache_path=cache.cache_path, max_bytes=5)
+    client.put_object(Bucket=BUCKET, Key='a', Body=b'a' * 10)
+
+    path = cache.getPath(client, BUCKET, 'a')
+    assert _read(path) == b'a' * 10
+    assert cache.evictions == 0
+
+
+def test_storage_reads_through_cache(tmpdir, cache):
+    storage = LocalS3Storage(str(tmpdir.join('s3')), BUCKET, cache=cache)
+    dataset = { 'file_name': 'a.csv', 'preloaded': False }
+    storage.save(1, 'a.csv', io.BytesIO(b'a,b\n1,2\n'))
+
+    with mock.patch.object(storage.client, 'get_object') as get_object:
+        path = storage.open(dataset, 1)
+    assert not get_object.called
+    assert path == cache._path(BUCKET, '1/a.csv')
+    assert _read(path) == b'a,b\n1,2\n'
+
+    storage.delete(dataset, 1)
+    assert cache.getValidPath(storage.client, BUCKET, '1/a.csv') is None
+    assert not os.path.exists(cache._path(BUCKET, '1/a.csv'))
@@ -0,0 +1,105 @@
+import mock
+import numpy as np
+import pandas as pd
+import pandas.util.testing as tm
+from flask import Flask
+
+from dive.base.data.access import DataChunks
+from dive.worker.statistics.streaming import streaming_value_counts, streaming_sketch, streaming_describe_categorical
+from dive.worker.statistics.column_profile import ColumnProfile
+from dive.worker.visualization.data import get_val_count_data
+from dive.worker.ingestion import field_properties
+
+
+class FrameChunks(DataChunks):
+    '''
+    DataChunks over a DataFrame in memory
+    '''
+    def __init__(self, df, chunksize):
+        self.df = df
+        self.columns = None
+        self.chunksize = chunksize
+
+    def iter_columns(self, columns):
+        for start in range(0, len(self.df), self.chunksize):
+            yield self.df[columns].iloc[start:start + self.chunksize]
+
+
+def _get_frame():
+    rng = np.random.RandomState(0)
+    values = rng.choice([ 'a', 'b', 'c', 'd', None ], 1000, p=[ 0.4, 0.3, 0.15, 0.1, 0.05 ])
+    return pd.DataFrame({ 'x': values, 'y': rng.randint(0, 3, 1000) })
+
+
+def test_streaming_value_counts():
+    df = _get_frame()
+    chunks = [ df['x'].iloc[start:start + 64] for start in range(0, len(df), 64) ]
+    value_counts, total_count = streaming_value_counts(chunks)
+    tm.assert_series_equal(value_counts, df['x'].value_counts(sort=True, dropna=True), check_names=False)
+    assert total_count == len(df)
+
+
+def test_val_count_data_of_chunks_equals_frame():
+    df = _get_frame()
+    args = { 'field_a': { 'name': 'x' } }
+    data_formats = [ 'visualize', 'score', 'count' ]
+    expected = get_val_count_data(df, args, data_formats=data_formats, config={ 'subset': 3 })
+    assert get_val_count_data(FrameChunks(df, 100), args, data_formats=data_formats, config={ 'subset': 3 }) == expected
+    assert expected['count'] == 1000
+    assert expected['subset'] == 3
+
+
+def _chunks_of(series, chunksize=64):
+    return [ series.iloc[start:start + chunksize] for start in range(0, len(series), chunksize) ]
+
+
+def test_sketch_describe_equals_column_profile():
+    rng = np.random.RandomState(0)
+    values = rng.randn(1000)
+    values[rng.randint(0, 1000, 50)] = np.nan
+    percentiles = [ (i * .5) / 10 for i in range(1, 20) ]
+
+    stats = streaming_sketch(_chunks_of(pd.Series(values))).describe(percentiles=percentiles)
+    expected = ColumnProfile(values).describe(percentiles=percentiles)
+    assert sorted(stats.keys()) == sorted(expected.keys())
+    for (key, value) in expected.items():
+        assert np.isclose(stats[key], value, rtol=1e-12), (key, stats[key], value)
+
+
+def test_describe_categorical_equals_dataframe_describe():
+    df = _get_frame()
+    stats = streaming_describe_categorical(_chunks_of(df['x']))
+    expected = df[[ 'x' ]].describe().to_dict()['x']
+    expected['total_count'] = len(df)
+    assert stats == expected
+
+
+def _compute_all_field_properties(df, threshold):
+    app = Flask(__name__)
+    app.config['STREAMING_ROW_THRESHOLD'] = threshold
+    with app.app_context(), \
+        mock.patch.object(field_properties, 'get_data', return_value=df.copy()), \
+        mock.patch.object(field_properties, 'DataChunks', side_effect=lambda *args, **kwargs: FrameChunks(df, 100)) as data_chunks, \
+        mock.patch.object(field_properties.db_access, 'get_dataset_version', return_value=1), \
+        mock.patch.object(field_properties.IMD, 'insertData'):
+        result = field_properties.compute_all_field_properties(1, 1, should_detect_hierarchical_relationships=False)['result']
+    return result, data_chunks.called
+
+
+def test_ingestion_stats_streamed_above_threshold():
+    df = _get_frame()
+    df['z'] = np.random.RandomState(1).randn(len(df))
+    df.loc[::7, 'z'] = np.nan
+
+    (streamed, streamed_chunks) = _compute_all_field_properties(df, 100)
+    (expected, expected_chunks) = _compute_all_field_properties(df, len(df))
+    assert streamed_chunks and not expected_chunks
+
+    for (fp, expected_fp) in zip(streamed, expected):
+        assert fp['name'] == expected_fp['name']
+        assert sorted(fp['stats'].keys()) == sorted(expected_fp['stats'].keys())
+        for (key, value) in expected_fp['stats'].items():
+            if isinstance(value, float):
+                assert np.isclose(fp['stats'][key], value, rtol=1e-12), (fp['name'], key)
+            else:
+                assert fp['stats'][key] == value, (fp['name'], key)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import locale
+
+import mock
+import numpy as np
+import pytest
+
+from dive.worker.ingestion.type_classes import IntegerType, DecimalType, DateType, BooleanType
+
+
+TYPES = [ IntegerType(), DecimalType(), DateType(), BooleanType() ]
+
+NUMBERS = [
+    u'12', u'-3', u'+4', u'007', u'1.0', u'1.5', u'.5', u'5.', u'1e3', u'1E-3', u'1e', u'--5', u'- 5', u'5-',
+    u'0x10', u'1_000', u'1,000', u'1.000', u'1,5', u'1.000,5', u'1 000', u'1,000,000',
+    u'inf', u'-Infinity', u'nan', u'NaN', u'sNaN', u'NaN12', u'ınf', u'ſnan',
+]
+UNICODE_DIGITS = [
+    u'١٢', u'１２', u'१२.३', u'²', u'⅕', u'٢٠١٦-01-02',
+]
+WHITESPACE = [
+    u'', u' ', u'\t', u' 5 ', u'\t1\t', u'1\n', u' 12 ', u'  7', u'　1.5', u' 2016-01-02',
+    u'2016-01-02 ', u' yes', u'no\n', u' true',
+]
+WORDS = [
+    u'abc', u'yes', u'No', u' TRUE ', u'False', u'y', u'0', u'1', u'1.0.0', u'é',
+    u'2016-01-02', u'01/02/2016', u'02/01/16', u'Jan 2 2016', u'2 January 2016', u'2016-13-01', u'2016-02-30',
+    u'12:30', u'2016', u'20160102', u'2016-01-02T10:20:30', u'Mon, 02 Jan 2016',
+]
+VALUES = NUMBERS + UNICODE_DIGITS + WHITESPACE + WORDS
+
+
+def _loop(cell_type, values):
+    return [ cell_type.test(v) for v in values ]
+
+
+@pytest.mark.parametrize('cell_type', TYPES, ids=lambda t: type(t).__name__)
+def test_values_equal_loop_over_test(cell_type):
+    assert cell_type.test_values(VALUES).tolist() == _loop(cell_type, VALUES)
+
+
+@pytest.mark.parametrize('cell_type', TYPES, ids=lambda t: type(t).__name__)
+def test_values_of_mixed_types(cell_type):
+    values = VALUES[:10] + [ b'12', b'2016-01-02', b' yes ', 12, 1.5, np.nan, True ] + VALUES[10:]
+    assert cell_type.test_values(values).tolist() == _loop(cell_type, values)
+
+
+@pytest.mark.parametrize('cell_type', TYPES, ids=lambda t: type(t).__name__)
+def test_values_in_locale_with_dot_thousands(cell_type):
+    conventions = dict(locale.localeconv(), thousands_sep='.', decimal_point=',')
+    with mock.patch.object(locale, 'localeconv', return_value=conventions):
+        assert cell_type.test_values(VALUES).tolist() == _loop(cell_type, VALUES)
+
+
+@pytest.mark.parametrize('locale_name', [ 'de_DE.UTF-8', 'en_US.UTF-8', 'fr_FR.UTF-8' ])
+@pytest.mark.parametrize('cell_type', TYPES, ids=lambda t: type(t).__name__)
+def test_values_in_locale(cell_type, locale_name):
+    previous = locale.setlocale(locale.LC_ALL)
+    try:
+        locale.setlocale(locale.LC_ALL, locale_name)
+    except locale.Error:
+        pytest.skip('Locale %s not available' % locale_name)
+    try:
+        assert cell_type.test_values(VALUES).tolist() == _loop(cell_type, VALUES)
+    finally:
+        locale.setlocale(locale.LC_ALL, previous)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import gzip
+import codecs
+import zipfile
+
+import mock
+import pytest
+from chardet.universaldetector import UniversalDetector
+
+from dive.base.exceptions import UnsupportedFileTypeException
+from dive.base.data.compression import DecompressingReader
+from dive.base.data.row_index import get_row_index_path, row_index_to_bytes, build_row_index
+from dive.worker.ingestion import upload
+
+
+def _zip_of(member_name, content=b'a,b\n1,2\n'):
+    buf = io.BytesIO()
+    archive = zipfile.ZipFile(buf, 'w')
+    archive.writestr(member_name, content)
+    archive.close()
+    buf.seek(0)
+    return buf
+
+
+def test_get_file_type():
+    assert upload.get_file_type('foo.bar.csv') == ('foo.bar', 'csv')
+    with pytest.raises(UnsupportedFileTypeException):
+        upload.get_file_type('README')
+    with pytest.raises(UnsupportedFileTypeException):
+        upload.get_file_type('foo.exe')
+
+
+@pytest.mark.parametrize('member_name', [ 'README', 'data/foo.exe' ])
+def test_zip_member_must_be_allowed(member_name):
+    with pytest.raises(UnsupportedFileTypeException):
+        upload.upload_file(1, _zip_of(member_name), file_name='archive.zip')
+
+
+def test_compressed_workbook_copied_under_workbook_name(tmpdir):
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+        f.write(b'not really a workbook')
+    compressed.seek(0)
+
+    workbook_paths = []
+    def convert_workbook(path, file_type, directory, **kwargs):
+        workbook_paths.append(os.path.basename(path))
+        with open(path, 'rb') as f:
+            assert f.read() == b'not really a workbook'
+        return []
+
+    app = mock.Mock(config={ 'ROW_LIMIT': 10, 'COLUMN_LIMIT': 10 })
+    with mock.patch.object(upload, 'convert_workbook', convert_workbook), mock.patch.object(upload, 'current_app', app):
+        upload.save_excel_to_csv(1, DecompressingReader(compressed, 'gzip'), 'foo', 'foo.xlsx.gz', 'xlsx', '/foo.xlsx.gz')
+    assert workbook_paths == [ 'foo.xlsx' ]
+
+
+@pytest.mark.parametrize('bom, codec, encoding', [
+    (codecs.BOM_UTF8, 'utf-8', 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le', 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be', 'utf-16'),
+    (codecs.BOM_UTF32_LE, 'utf-32-le', 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be', 'utf-32'),
+])
+def test_detect_encoding_from_byte_order_mark(bom, codec, encoding):
+    file_obj = io.BytesIO(bom + u'a,b\n1,2\n'.encode(codec))
+    with mock.patch.object(upload, 'UniversalDetector') as detector:
+        assert upload.detect_encoding(file_obj)[:2] == (encoding, 1.0)
+    assert not detector.called
+    assert file_obj.tell() == 0
+
+
+def test_detect_encoding_of_utf8():
+    content = u'a,b\ncafé,2\n'.encode('utf-8') * 1000
+    with mock.patch.object(upload, 'UniversalDetector') as detector:
+        assert upload.detect_encoding(io.BytesIO(content))[:2] == ('utf-8', 1.0)
+        # Only a prefix was checked
+        assert upload.detect_encoding(io.BytesIO(content), utf8_size=len(content) // 2)[:2] == ('utf-8', 0.99)
+    assert not detector.called
+
+
+class CountingDetector(UniversalDetector):
+    def __init__(self, done_after=None):
+        UniversalDetector.__init__(self)
+        self.done_after = done_after
+        self.num_fed = 0
+
+    def feed(self, chunk):
+        UniversalDetector.feed(self, chunk)
+        self.num_fed += 1
+        if self.num_fed == self.done_after:
+            self.done = True
+
+
+@pytest.mark.parametrize('done_after, sample_size, num_fed', [
+    (None, 10 * 64 * 1024, 10),
+    (3, 10 * 64 * 1024, 3),
+])
+def test_detect_encoding_stops_early(done_after, sample_size, num_fed):
+    content = u'a,b\ncafé,crème brûlée\n'.encode('latin-1') * 100000
+    detectors = []
+    def get_detector():
+        detectors.append(CountingDetector(done_after=done_after))
+        return detectors[-1]
+
+    file_obj = io.BytesIO(content)
+    with mock.patch.object(upload, 'UniversalDetector', side_effect=get_detector):
+        (encoding, confidence, detection_time) = upload.detect_encoding(file_obj, sample_size=sample_size)
+    assert detectors[0].num_fed == num_fed
+    assert file_obj.tell() == 0
+
+
+class MemoryStorage(object):
+    def __init__(self):
+        self.files = {}
+
+    def save(self, project_id, file_name, file_obj):
+        self.files[file_name] = file_obj.read()
+
+
+def _save_flat_table(file_obj, file_name, compression=None):
+    storage = MemoryStorage()
+    with mock.patch.object(upload, 'get_storage', return_value=storage):
+        file_doc = upload.save_flat_table(1, file_obj, 'a', file_name, 'csv', '/a.csv',
+            dialect=upload.DEFAULT_DIALECT, encoding='utf-8', compression=compression)
+    return file_doc, storage.files
+
+
+def _latin1_after_utf8(num_rows=200000):
+    # Valid UTF-8 for more than a validation chunk, then a Latin-1 row
+    rows = u'a,b\n' + u'crème,1\n' * num_rows
+    return rows.encode('utf-8') + u'café,2\n'.encode('latin-1'), rows + u'café,2\n'
+
+
+def test_invalid_utf8_after_prefix_transcoded():
+    (content, text) = _latin1_after_utf8()
+    assert upload.detect_encoding(io.BytesIO(content), utf8_size=upload.UTF8_VALIDATION_CHUNK_SIZE)[:2] == ('utf-8', 0.99)
+
+    (file_doc, files) = _save_flat_table(io.BytesIO(content), 'a.csv')
+    assert file_doc['encoding'] == 'utf-8'
+    stored = files['a.csv'].decode('utf-8')
+    assert stored[:-len(u'café,2\n')] == text[:-len(u'café,2\n')]
+    assert stored.endswith(u',2\n')
+    assert files[get_row_index_path('a.csv')] == row_index_to_bytes(build_row_index(io.BytesIO(files['a.csv']), upload.DEFAULT_DIALECT))
+
+
+def test_valid_utf8_stored_as_is():
+    content = (u'a,b\n' + u'crème,1\n' * 1000).encode('utf-8')
+    (file_doc, files) = _save_flat_table(io.BytesIO(content), 'a.csv')
+    assert file_doc['encoding'] == 'utf-8'
+    assert files['a.csv'] == content
+
+
+def test_invalid_utf8_in_compressed_file_read_in_fallback_encoding():
+    (content, text) = _latin1_after_utf8()
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+        f.write(content)
+    compressed.seek(0)
+
+    (file_doc, files) = _save_flat_table(compressed, 'a.csv.gz', compression='gzip')
+    assert not upload.is_utf8(file_doc['encoding'])
+    assert files['a.csv.gz'] == compressed.getvalue()
+    content.decode(file_doc['encoding'])
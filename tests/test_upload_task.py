@@ -0,0 +1,80 @@
+import io
+import os
+import json
+
+import mock
+import pytest
+from flask import Flask
+from celery import states
+from celery.backends.base import Backend
+
+from dive.base.exceptions import UploadTooLargeException, UnsupportedFileTypeException
+from dive.worker.core import celery
+from dive.server.resources import datasets, task_resources
+
+
+@pytest.fixture
+def app(tmpdir):
+    app = Flask(__name__)
+    app.config['UPLOAD_SPOOL_PATH'] = str(tmpdir.join('spool'))
+    return app
+
+
+def _get_task_result(exc, serializer):
+    '''
+    TaskResult of a task that raised exc, read back from a result backend
+    '''
+    backend = Backend(app=celery, serializer=serializer)
+    info = backend.exception_to_python(backend.prepare_exception(exc))
+    task = mock.Mock(state=states.FAILURE, info=info)
+    with mock.patch.object(task_resources.celery, 'AsyncResult', return_value=task):
+        response = task_resources.TaskResult().get('task-id')
+    return response.status_code, json.loads(response.get_data())
+
+
+@pytest.mark.parametrize('serializer', [ 'json', 'pickle' ])
+@pytest.mark.parametrize('exc, status_code', [
+    (UploadTooLargeException('Uploaded file exceeds row limit of 10'), 413),
+    (UnsupportedFileTypeException('File foo.exe has unsupported type exe'), 415),
+])
+def test_upload_failure_reported_to_client(app, exc, status_code, serializer):
+    with app.test_request_context():
+        (code, result) = _get_task_result(exc, serializer)
+    assert code == status_code
+    assert result['state'] == states.FAILURE
+    assert result['message'] == str(exc)
+    assert result['error'] == '%s: %s' % (type(exc).__name__, exc)
+
+
+def test_other_failures_are_server_errors(app):
+    with app.test_request_context():
+        (code, result) = _get_task_result(ValueError('boom'), 'json')
+    assert code == 500
+    assert 'message' not in result
+
+
+def test_upload_pipeline_fails_with_upload_exception(tmpdir):
+    spooled_path = str(tmpdir.join('spooled.csv'))
+    with open(spooled_path, 'wb') as f:
+        f.write(b'a,b\n1,2\n')
+
+    with mock.patch.object(datasets.upload_pipeline, 'update_state'), \
+        mock.patch('dive.worker.ingestion.upload.upload_file', side_effect=UploadTooLargeException('too large')):
+        result = datasets.upload_pipeline.apply(args=[ spooled_path, 'a.csv', 1 ])
+
+    assert result.state == states.FAILURE
+    assert isinstance(result.result, UploadTooLargeException)
+    assert not os.path.exists(spooled_path)
+
+
+def test_spooled_file_removed_when_task_not_sent(app):
+    data = {
+        'data': json.dumps({ 'project_id': 1 }),
+        'file': (io.BytesIO(b'a,b\n1,2\n'), 'a.csv')
+    }
+    with app.test_request_context(method='POST', data=data):
+        with mock.patch.object(datasets.upload_pipeline, 'apply_async', side_effect=IOError('broker down')):
+            with pytest.raises(IOError):
+                datasets.UploadFile().post()
+
+    assert os.listdir(app.config['UPLOAD_SPOOL_PATH']) == []